@@ -0,0 +1,177 @@
+"""
+原子、只在內容改變時才寫入的輸出檔
+
+直接以 'w' 開啟輸出檔逐頁寫入時，中途當機會留下看似完整的截斷檔案；
+相同的結果每次重跑也會改寫檔案、更新 mtime，觸發下游同步（rsync）與重新索引。
+此模組的寫入流程：
+- 寫入同一目錄的暫存檔（同一檔案系統，rename 為原子操作），寫入時同時計算 SHA-256
+- 完成後 flush + fsync，再與既有檔案比較內容；相同時丟棄暫存檔，既有檔案與 mtime 都不變
+- 不同時以 os.replace 取代，並 fsync 目錄讓 rename 本身也寫入磁碟
+- 暫存檔（mkstemp 建立時為 0600）在取代前改為既有檔案的權限；新檔案為 0666 去掉 umask，
+  與直接 open() 建立的檔案相同，共用檔案系統上的其他使用者與節點仍可讀取
+
+讀者只會看到舊檔或完整的新檔。
+"""
+
+import hashlib
+import os
+import stat
+import tempfile
+from typing import Optional
+
+TMP_SUFFIX = ".tmp"
+
+
+def _read_umask() -> int:
+    # os.umask 只能以設定的方式讀取；在匯入時讀取一次，避免執行中與其他執行緒建立檔案互相干擾
+    mask = os.umask(0o022)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _read_umask()
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> Optional[str]:
+    """檔案內容的 SHA-256，檔案不存在時為 None"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def fsync_dir(directory: str) -> None:
+    """讓目錄項目（rename 結果）寫入磁碟；不支援的平台（Windows）直接略過"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def target_mode(path: str) -> int:
+    """取代 path 時應有的權限：沿用既有檔案的權限，新檔案為 0666 去掉 umask"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+class AtomicWriter:
+    """
+    先寫入暫存檔，commit() 時才出現在目標路徑
+
+    可當作檔案物件使用（write / tell），也可作為 context manager：
+    正常離開時 commit，發生例外時丟棄暫存檔，目標檔案維持原狀。
+
+    Args:
+        path: 目標路徑
+        mode: "w"（文字，以 encoding 編碼）或 "wb"
+        encoding: 文字模式的編碼
+    """
+
+    def __init__(self, path: str, mode: str = "wb", encoding: str = "utf-8"):
+        self.path = path
+        self.binary = "b" in mode
+        self.encoding = encoding
+        self.directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(self.directory, exist_ok=True)
+        # 以 "." 開頭：下游掃描 *.md / *.pages.jsonl 時不會看到未完成的檔案
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{os.path.basename(path)}.",
+                                             suffix=TMP_SUFFIX)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self.done = False
+
+    def write(self, data) -> int:
+        if not self.binary:
+            data = data.encode(self.encoding)
+        self._hash.update(data)
+        self._file.write(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def digest(self) -> str:
+        """目前已寫入內容的 SHA-256"""
+        return self._hash.hexdigest()
+
+    def _sync(self) -> None:
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def unchanged(self) -> bool:
+        """寫入的內容與目標檔案目前的內容相同"""
+        return file_digest(self.path) == self.digest()
+
+    def commit(self, replace: Optional[bool] = None) -> bool:
+        """
+        完成寫入
+
+        Args:
+            replace: 是否取代目標檔；None 時只在內容與既有檔案不同時取代
+
+        Returns:
+            是否取代了目標檔（False 表示內容相同或呼叫端決定不取代，暫存檔已刪除）
+        """
+        if self.done:
+            return False
+        self.done = True
+        self._sync()
+        if replace is None:
+            replace = not self.unchanged()
+        if not replace:
+            os.remove(self.tmp_path)
+            return False
+        os.chmod(self.tmp_path, target_mode(self.path))
+        os.replace(self.tmp_path, self.path)
+        fsync_dir(self.directory)
+        return True
+
+    def discard(self) -> None:
+        """放棄寫入，目標檔案維持原狀"""
+        if self.done:
+            return
+        self.done = True
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "AtomicWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def replace_if_changed(source: str, destination: str) -> bool:
+    """
+    以 source 原子地取代 destination（例如暫存目錄中已完成的輸出）；內容相同時刪除 source
+
+    Returns:
+        是否取代了 destination
+    """
+    if file_digest(source) == file_digest(destination):
+        os.remove(source)
+        return False
+    os.chmod(source, target_mode(destination))
+    os.replace(source, destination)
+    fsync_dir(os.path.dirname(os.path.abspath(destination)))
+    return True
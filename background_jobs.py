@@ -0,0 +1,79 @@
+"""
+背景解析工作（快速預覽的其餘頁面）
+
+快速預覽先解析前幾頁並立即顯示，其餘頁面交給背景執行緒繼續解析：
+- 工作在 process 內的 daemon 執行緒執行，結果保存在 BackgroundJob 物件中
+  （Streamlit 的 session state 只保存物件參照，使用者翻頁、下載造成的重新執行不會中斷解析）
+- 進度事件只保留最新一筆，介面以定時重新執行的 fragment 讀取
+- cancel() 設定取消旗標，解析層的 Deadline 在下一次輪詢時中止
+
+背景執行緒沒有 Streamlit 的 ScriptRunContext，解析層的 st.info 等呼叫不會顯示，
+只會讓 Streamlit 記錄 missing ScriptRunContext 警告；這些警告依執行緒名稱過濾。
+"""
+
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+THREAD_PREFIX = "pdf2md-background"
+
+Publish = Callable[[Dict], None]
+
+_counter = itertools.count(1)
+
+
+class _BackgroundThreadFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not record.threadName.startswith(THREAD_PREFIX)
+
+
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(_BackgroundThreadFilter())
+
+
+class BackgroundJob:
+    """
+    在背景執行緒執行單一工作
+
+    Args:
+        work: work(cancel_event, publish) -> 結果；publish(event) 更新最新的進度事件
+        description: 顯示用的說明
+    """
+
+    def __init__(self, work: Callable[[threading.Event, Publish], Any], description: str = ""):
+        self.description = description
+        self.cancel_event = threading.Event()
+        self.event: Optional[Dict] = None
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._done = threading.Event()
+        self._work = work
+        self._thread = threading.Thread(target=self._run, name=f"{THREAD_PREFIX}-{next(_counter)}", daemon=True)
+        self._thread.start()
+
+    def _publish(self, event: Dict) -> None:
+        self.event = event
+
+    def _run(self) -> None:
+        try:
+            self.result = self._work(self.cancel_event, self._publish)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待完成，回傳是否已完成"""
+        return self._done.wait(timeout)
+
+    def cancel(self) -> None:
+        """要求中止（解析層在下一次輪詢時丟出 ParseCancelled 或回傳取消的結果）"""
+        self.cancel_event.set()
@@ -0,0 +1,85 @@
+"""
+LlamaParse 批次提交效能測試
+
+以大量短篇論文比較逐份呼叫（process_pdf）與單一 event loop 批次提交（process_pdfs_bulk）的總時間。
+遠端服務以本地替身取代，模擬每個工作固定的建立與輪詢延遲，以及每頁的解析時間。
+
+使用方式：
+    python benchmarks/bench_bulk.py [--documents 300] [--job-seconds 1.0] [--concurrency 16]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import local_llamaparse  # noqa: E402
+from corpus import build_document  # noqa: E402
+
+
+def make_papers(directory: str, documents: int, pages: int) -> list:
+    paths = []
+    for i in range(documents):
+        path = os.path.join(directory, f"paper_{i:04d}.pdf")
+        build_document(path, ["text"] * pages, seed=i)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LlamaParse 批次提交效能測試")
+    parser.add_argument("--documents", type=int, default=300, help="短篇論文數量")
+    parser.add_argument("--pages", type=int, default=4, help="每篇頁數")
+    parser.add_argument("--job-seconds", type=float, default=1.0, help="每個工作的建立與輪詢延遲（模擬）")
+    parser.add_argument("--seconds-per-page", type=float, default=0.05, help="每頁解析時間（模擬）")
+    parser.add_argument("--concurrency", type=int, default=16, help="批次提交時同時在途的工作數")
+    parser.add_argument("--serial-sample", type=int, default=20,
+                        help="逐份呼叫只量測前 N 份再依比例推估（0 為全部執行）")
+    args = parser.parse_args()
+
+    local_llamaparse.configure(args.seconds_per_page, job_seconds=args.job_seconds)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import medical_journal_parser as parser_module
+    parser_module.LlamaParse = local_llamaparse.LocalLlamaParse
+    from progress import ProgressTracker
+    from scheduler import JobScheduler
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_dir = os.path.join(tmp, "pdfs")
+        os.makedirs(pdf_dir)
+        paths = make_papers(pdf_dir, args.documents, args.pages)
+        total_pages = args.documents * args.pages
+
+        serial_paths = paths[:args.serial_sample] if args.serial_sample else paths
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for path in serial_paths:
+                parser_module.process_pdf(path, os.path.join(tmp, "serial"))
+        serial = (time.perf_counter() - start) * len(paths) / len(serial_paths)
+
+        scheduler = JobScheduler("sjf")
+        scheduler.add_paths(paths)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser_module.process_pdfs_bulk(scheduler, os.path.join(tmp, "bulk"), args.concurrency,
+                                            progress=ProgressTracker())
+        bulk = time.perf_counter() - start
+        written = len([name for name in os.listdir(os.path.join(tmp, "bulk")) if name.endswith(".md")])
+
+    estimated = " (estimated)" if len(serial_paths) < len(paths) else ""
+    print(f"{args.documents} documents × {args.pages} pages, job overhead {args.job_seconds}s, "
+          f"{args.seconds_per_page}s/page")
+    print(f"one call per file:  {serial:8.1f} s  {total_pages / serial:7.1f} pages/s{estimated}")
+    print(f"bulk ({args.concurrency:>3} in flight): {bulk:8.1f} s  {total_pages / bulk:7.1f} pages/s "
+          f"({serial / bulk:.1f}× faster, {written} documents written)")
+
+
+if __name__ == "__main__":
+    main()
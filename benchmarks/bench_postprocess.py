@@ -0,0 +1,106 @@
+"""
+後處理管線效能測試
+
+以合成頁面量測 postprocess_pages 的吞吐量，並以 2 倍、4 倍頁數驗證為線性時間；
+若已安裝 PyMuPDF 與 MarkItDown，另外量測同樣頁數的本地解析耗時作為比較基準。
+
+使用方式：
+    python benchmarks/bench_postprocess.py [--pages 500]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postprocess import postprocess_pages  # noqa: E402
+
+WORDS = ("glucose insulin metformin placebo cohort endpoint hazard ratio renal "
+         "cardiovascular mortality randomized trial baseline follow-up").split()
+
+
+def make_page(rng: random.Random, number: int) -> str:
+    """產生一頁類似期刊輸出的 Markdown：頁首、段落（含斷字）、表格、頁碼"""
+    paragraphs = []
+    for _ in range(6):
+        words = [rng.choice(WORDS) for _ in range(80)]
+        words[40] = words[40][:3] + "-\n" + words[40][3:] if len(words[40]) > 6 else words[40]
+        paragraphs.append(" ".join(words))
+    table = "\n\n".join(f"|{rng.randint(1, 99)}|  {rng.random():.3f} |{rng.choice(WORDS)}|" for _ in range(8))
+    return (f"N Engl J Med 2024;{390 + number % 3}:{1000 + number}\n\n"
+            + "\n\n".join(paragraphs) + "\n\n| Group | Value | Note |\n\n" + table
+            + f"\n\n{number}\n")
+
+
+def time_pipeline(pages):
+    start = time.perf_counter()
+    total = sum(len(page) for page in postprocess_pages(iter(pages)))
+    return time.perf_counter() - start, total
+
+
+def time_markitdown(page_count: int):
+    """以 PyMuPDF 產生同頁數的 PDF，再量測 MarkItDown 解析時間；缺少套件時回傳 None"""
+    try:
+        import fitz
+        from markitdown import MarkItDown
+    except ImportError:
+        return None
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.pdf")
+        doc = fitz.open()
+        for number in range(page_count):
+            page = doc.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), make_page(rng, number), fontsize=8)
+        doc.save(path)
+
+        start = time.perf_counter()
+        MarkItDown().convert(path)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="後處理管線效能測試")
+    parser.add_argument("--pages", type=int, default=500, help="基準頁數")
+    parser.add_argument("--parse-pages", type=int, default=30, help="MarkItDown 比較用的頁數（pdfminer 較慢）")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    base = [make_page(rng, i) for i in range(args.pages)]
+
+    print(f"{'pages':>8} {'seconds':>10} {'ms/page':>10} {'MB/s':>8}")
+    for factor in (1, 2, 4):
+        pages = base * factor
+        size_mb = sum(len(page) for page in pages) / 1e6
+        elapsed, _ = time_pipeline(pages)
+        print(f"{len(pages):>8} {elapsed:>10.3f} {elapsed / len(pages) * 1000:>10.3f} {size_mb / elapsed:>8.1f}")
+
+    # 串流處理的峰值記憶體應只與視窗大小有關，與總頁數無關
+    for factor in (1, 4):
+        tracemalloc.start()
+        for _ in postprocess_pages(make_page(rng, i) for i in range(args.pages * factor)):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"peak traced memory while streaming {args.pages * factor} pages: {peak / 1024:.0f} KiB")
+
+    pipeline_seconds, _ = time_pipeline(base)
+    parse_seconds = time_markitdown(args.parse_pages)
+    if parse_seconds is None:
+        print("PyMuPDF / MarkItDown not installed; skipping parse-time comparison")
+    else:
+        pipeline_per_page = pipeline_seconds / len(base)
+        parse_per_page = parse_seconds / args.parse_pages
+        print(f"MarkItDown parse: {parse_per_page * 1000:.1f} ms/page; "
+              f"post-processing: {pipeline_per_page * 1000:.2f} ms/page "
+              f"({pipeline_per_page / parse_per_page * 100:.2f}% overhead)")
+
+
+if __name__ == "__main__":
+    main()
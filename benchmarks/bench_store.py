@@ -0,0 +1,130 @@
+"""
+壓縮儲存效能測試
+
+以合成期刊文件（PyMuPDF 擷取的逐頁文字）比較未壓縮輸出與 compressed_store 的壓縮封存：
+- 儲存大小（.md + 逐頁 JSONL + 位移索引）
+- 寫入時間
+- 隨機讀取單頁的延遲（未壓縮：seek + readline；壓縮：seek + 解壓單一 frame）
+- 依序讀取所有頁面的時間
+
+zstd 只在已安裝（Python 3.14+ 或 zstandard 套件）時列出。
+
+使用方式：
+    python benchmarks/bench_store.py [--documents 20] [--pages 30] [--reads 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from compressed_store import (archive_document, available_codecs, iter_framed_pages,  # noqa: E402
+                              read_framed_page)
+from corpus import build_document  # noqa: E402
+from page_store import iter_pages, pages_path_for, read_page, records_from_pages, write_pages  # noqa: E402
+
+
+def make_pages(directory: str, documents: int, pages: int) -> list:
+    """產生合成 PDF 並以 PyMuPDF 擷取逐頁文字（約八成純文字、兩成表格）"""
+    import fitz
+
+    extracted = []
+    for i in range(documents):
+        path = os.path.join(directory, f"paper_{i:03d}.pdf")
+        build_document(path, ["table" if n % 5 == 1 else "text" for n in range(pages)], seed=i)
+        with fitz.open(path) as doc:
+            extracted.append([page.get_text() for page in doc])
+        os.remove(path)
+    return extracted
+
+
+def write_plain(output_dir: str, documents: list) -> list:
+    md_paths = []
+    for i, pages in enumerate(documents):
+        md_path = os.path.join(output_dir, f"paper_{i:03d}.md")
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(pages))
+        write_pages(pages_path_for(md_path), records_from_pages(pages, "MarkItDown", None, 1.0))
+        md_paths.append(md_path)
+    return md_paths
+
+
+def directory_bytes(directory: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def measure(md_paths: list, page_counts: list, reads: int, single_page, all_pages) -> dict:
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(reads):
+        i = rng.randrange(len(md_paths))
+        pages_path = pages_path_for(md_paths[i])
+        page = rng.randint(1, page_counts[i])
+        start = time.perf_counter()
+        single_page(pages_path, page)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    start = time.perf_counter()
+    for md_path in md_paths:
+        for _ in all_pages(pages_path_for(md_path)):
+            pass
+    full = time.perf_counter() - start
+    return {"read_p50_us": latencies[len(latencies) // 2] * 1e6,
+            "read_p95_us": latencies[int(len(latencies) * 0.95)] * 1e6,
+            "full_read_s": full}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="壓縮儲存效能測試")
+    parser.add_argument("--documents", type=int, default=20, help="文件數量")
+    parser.add_argument("--pages", type=int, default=30, help="每份頁數")
+    parser.add_argument("--reads", type=int, default=2000, help="隨機讀取單頁的次數")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        documents = make_pages(tmp, args.documents, args.pages)
+        page_counts = [len(pages) for pages in documents]
+
+        plain_dir = os.path.join(tmp, "plain")
+        os.makedirs(plain_dir)
+        start = time.perf_counter()
+        md_paths = write_plain(plain_dir, documents)
+        write_seconds = time.perf_counter() - start
+        plain_bytes = directory_bytes(plain_dir)
+        rows.append(dict(codec="plain", bytes=plain_bytes, write_s=write_seconds,
+                         **measure(md_paths, page_counts, args.reads, read_page, iter_pages)))
+
+        for codec in available_codecs():
+            codec_dir = os.path.join(tmp, codec)
+            os.makedirs(codec_dir)
+            codec_paths = write_plain(codec_dir, documents)
+            start = time.perf_counter()
+            for md_path in codec_paths:
+                archive_document(md_path, codec)
+            # 寫入時間 = 未壓縮寫入 + 封存
+            elapsed = write_seconds + time.perf_counter() - start
+            rows.append(dict(codec=codec, bytes=directory_bytes(codec_dir), write_s=elapsed,
+                             **measure(codec_paths, page_counts, args.reads, read_framed_page,
+                                       iter_framed_pages)))
+
+    pages = sum(page_counts)
+    print(f"{args.documents} documents × {args.pages} pages ({pages} pages, "
+          f"{plain_bytes / 1e6:.2f} MB uncompressed)")
+    print(f"{'store':<8} {'size MB':>9} {'ratio':>7} {'write s':>8} {'page p50 µs':>12} "
+          f"{'page p95 µs':>12} {'full read s':>12}")
+    for row in rows:
+        print(f"{row['codec']:<8} {row['bytes'] / 1e6:9.2f} {row['bytes'] / plain_bytes:7.1%} "
+              f"{row['write_s']:8.2f} {row['read_p50_us']:12.1f} {row['read_p95_us']:12.1f} "
+              f"{row['full_read_s']:12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+逐頁模型分級效能測試
+
+以混合文件（純文字、表格、掃描頁）比較整份使用 pro 模型與依頁面複雜度分級的總時間與估計額度。
+遠端服務以本地替身取代，各模型的每頁延遲依 model_tiers.MODEL_TIERS 的估計值等比例縮放。
+
+使用方式：
+    python benchmarks/bench_tiers.py [--documents 10] [--pages 40] [--time-scale 0.02]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import local_llamaparse  # noqa: E402
+from corpus import build_document  # noqa: E402
+from model_tiers import MODEL_TIERS, plan_document, tier_report  # noqa: E402
+
+# 混合文件的頁面組成：約七成純文字、兩成表格、一成掃描
+PAGE_MIX = ["text"] * 7 + ["table"] * 2 + ["scanned"]
+
+
+def make_documents(directory: str, documents: int, pages: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(directory, f"mixed_{i:03d}.pdf")
+        build_document(path, [rng.choice(PAGE_MIX) for _ in range(pages)], seed=i)
+        paths.append(path)
+    return paths
+
+
+def run(parser_module, paths, output_dir, tiered):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in paths:
+            parser_module.process_pdf(path, output_dir, tiered=tiered)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="逐頁模型分級效能測試")
+    parser.add_argument("--documents", type=int, default=10, help="混合文件數量")
+    parser.add_argument("--pages", type=int, default=40, help="每份頁數")
+    parser.add_argument("--time-scale", type=float, default=0.02,
+                        help="模擬延遲 = 各模型估計的每頁秒數 × 此倍率")
+    args = parser.parse_args()
+
+    local_llamaparse.configure(job_seconds=0.0, model_seconds={
+        tier["model"]: tier["seconds_per_page"] * args.time_scale for tier in MODEL_TIERS})
+    with contextlib.redirect_stdout(io.StringIO()):
+        import medical_journal_parser as parser_module
+    parser_module.LlamaParse = local_llamaparse.LocalLlamaParse
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_dir = os.path.join(tmp, "pdfs")
+        os.makedirs(pdf_dir)
+        paths = make_documents(pdf_dir, args.documents, args.pages)
+
+        start = time.perf_counter()
+        plans = [plan_document(path) for path in paths]
+        planning = time.perf_counter() - start
+        reports = [tier_report(plan) for plan in plans]
+
+        single = run(parser_module, paths, os.path.join(tmp, "single"), tiered=False)
+        tiered = run(parser_module, paths, os.path.join(tmp, "tiered"), tiered=True)
+
+    pages = args.documents * args.pages
+    print(f"{args.documents} documents × {args.pages} pages (mix: text / table / scanned)")
+    print("pages per model: " + ", ".join(
+        f"{model} {sum(report['models'].get(model, {}).get('pages', 0) for report in reports)}"
+        for model in (tier["model"] for tier in MODEL_TIERS)))
+    print(f"complexity scoring: {planning / pages * 1000:.1f} ms/page")
+    credits = sum(report["credits"] for report in reports)
+    single_credits = sum(report["single_model_credits"] for report in reports)
+    print(f"all {MODEL_TIERS[-1]['model']}: {single:8.1f} s  {single_credits:8.0f} credits (estimated)")
+    print(f"tiered:            {tiered:8.1f} s  {credits:8.0f} credits (estimated) "
+          f"({single / tiered:.1f}× faster, {1 - credits / single_credits:.0%} fewer credits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+合成 PDF 測試語料
+
+以 PyMuPDF 產生可重現的本地語料（相同 seed 產生位元組完全相同的檔案）：
+- text_paper.pdf：純文字期刊論文（雙欄段落、標題、參考文獻）
+- table_heavy.pdf：每頁數個表格（格線與數值欄位）
+- scanned.pdf：只有圖片、沒有文字層的掃描頁
+- mixed.pdf：文字、表格與掃描頁交錯（本地優先模式會只送出掃描頁）
+- stress_<N>.pdf：N 頁的壓力測試文件（預設 1000 頁）
+
+manifest.json 記錄每份文件的頁數、頁面類型與 SHA-256；語料已存在且雜湊相符時不會重新產生。
+
+使用方式：
+    python benchmarks/corpus.py [--output benchmarks/corpus] [--stress-pages 1000]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+from typing import Dict, List
+
+WORDS = ("glucose insulin metformin placebo cohort endpoint hazard ratio renal cardiovascular "
+         "mortality randomized trial baseline follow-up adverse events confidence interval "
+         "secondary outcome diabetes retinopathy albuminuria statin blood pressure").split()
+
+SECTIONS = ("Abstract", "Introduction", "Methods", "Results", "Discussion", "References")
+
+MANIFEST = "manifest.json"
+
+# 產生器版本：修改產生方式時遞增，讓既有語料重新產生
+CORPUS_VERSION = 1
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter
+MARGIN = 54
+
+
+def _sentence(rng: random.Random, words: int = 18) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _paragraph(rng: random.Random, sentences: int = 5) -> str:
+    return " ".join(_sentence(rng, rng.randint(10, 24)) for _ in range(sentences))
+
+
+def _new_page(doc, number: int, journal: str):
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    # 頁首與頁碼（後處理會移除）
+    page.insert_text((MARGIN, 36), f"{journal} 2024;390:{1000 + number}", fontsize=7)
+    page.insert_text((PAGE_WIDTH / 2, PAGE_HEIGHT - 30), str(number + 1), fontsize=8)
+    return page
+
+
+def _text_page(doc, rng: random.Random, number: int) -> None:
+    import fitz
+
+    page = _new_page(doc, number, "N Engl J Med")
+    section = SECTIONS[number % len(SECTIONS)]
+    page.insert_text((MARGIN, 70), section, fontsize=14)
+    column_width = (PAGE_WIDTH - 2 * MARGIN - 18) / 2
+    for column in range(2):
+        left = MARGIN + column * (column_width + 18)
+        rect = fitz.Rect(left, 84, left + column_width, PAGE_HEIGHT - 50)
+        paragraphs = [_paragraph(rng) for _ in range(4)]
+        # 文字超出欄位時 insert_textbox 不會寫入任何內容，逐段減少直到放得下
+        while paragraphs and page.insert_textbox(rect, "\n\n".join(paragraphs), fontsize=8.5) < 0:
+            paragraphs.pop()
+
+
+def _table_page(doc, rng: random.Random, number: int) -> None:
+    import fitz
+
+    page = _new_page(doc, number, "Diabetes Care")
+    # 以單一 Shape 繪製整頁表格（逐格 insert_text 每次都會重寫內容串流）
+    shape = page.new_shape()
+    top = 64
+    for table in range(3):
+        columns = rng.randint(4, 6)
+        rows = rng.randint(6, 9)
+        shape.insert_text((MARGIN, top + 10), f"Table {number * 3 + table + 1}. {_sentence(rng, 8)}", fontsize=9)
+        top += 18
+        cell_width = (PAGE_WIDTH - 2 * MARGIN) / columns
+        header = ["Variable"] + [f"Group {c}" for c in range(1, columns)]
+        for row in range(rows + 1):
+            y = top + row * 16
+            shape.draw_line(fitz.Point(MARGIN, y), fitz.Point(PAGE_WIDTH - MARGIN, y))
+            for c in range(columns):
+                if row == 0:
+                    value = header[c]
+                elif c == 0:
+                    value = rng.choice(WORDS)
+                else:
+                    value = f"{rng.uniform(0, 200):.1f} ({rng.uniform(0, 50):.1f})"
+                shape.insert_text((MARGIN + c * cell_width + 3, y + 11), value, fontsize=7.5)
+        top += (rows + 1) * 16 + 30
+    shape.finish(width=0.4)
+    shape.commit()
+
+
+def _scanned_page(doc, rng: random.Random, number: int) -> None:
+    import fitz
+
+    # 先畫出一頁文字，再點陣化後以圖片放入新頁面：沒有文字層，只有掃描影像
+    source = fitz.open()
+    _text_page(source, rng, number)
+    pixmap = source[0].get_pixmap(dpi=100, colorspace=fitz.csGRAY)
+    source.close()
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    page.insert_image(page.rect, pixmap=pixmap)
+
+
+PAGE_BUILDERS = {
+    "text": _text_page,
+    "table": _table_page,
+    "scanned": _scanned_page,
+}
+
+
+def document_specs(stress_pages: int = 1000) -> Dict[str, List[str]]:
+    """語料中每份文件的頁面類型序列"""
+    mixed = []
+    for i in range(16):
+        mixed.append("scanned" if i % 5 == 4 else "table" if i % 4 == 1 else "text")
+    return {
+        "text_paper.pdf": ["text"] * 12,
+        "table_heavy.pdf": ["table"] * 8,
+        "scanned.pdf": ["scanned"] * 6,
+        "mixed.pdf": mixed,
+        f"stress_{stress_pages}.pdf": ["table" if i % 10 == 3 else "text" for i in range(stress_pages)],
+    }
+
+
+def build_document(path: str, page_types: List[str], seed: int) -> None:
+    """依頁面類型序列產生 PDF（內容只由 seed 與檔名決定）"""
+    import fitz
+
+    rng = random.Random(f"{seed}:{os.path.basename(path)}")
+    doc = fitz.open()
+    for number, page_type in enumerate(page_types):
+        PAGE_BUILDERS[page_type](doc, rng, number)
+    # 固定中繼資料與檔案 ID，讓相同輸入產生相同位元組
+    doc.set_metadata({"title": os.path.basename(path), "producer": "pdf2md benchmark corpus",
+                      "creationDate": "D:20240101000000", "modDate": "D:20240101000000"})
+    doc.save(path, garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest_matches(output_dir: str, seed: int, specs: Dict[str, List[str]]) -> bool:
+    try:
+        with open(os.path.join(output_dir, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if manifest.get("version") != CORPUS_VERSION or manifest.get("seed") != seed:
+        return False
+    documents = manifest.get("documents", {})
+    if set(documents) != set(specs):
+        return False
+    for name, entry in documents.items():
+        path = os.path.join(output_dir, name)
+        if entry.get("page_types") != specs[name] or not os.path.exists(path) or _sha256(path) != entry["sha256"]:
+            return False
+    return True
+
+
+def generate_corpus(output_dir: str, seed: int = 0, stress_pages: int = 1000,
+                    include_stress: bool = True, force: bool = False) -> Dict:
+    """
+    產生（或沿用）合成語料
+
+    Args:
+        output_dir: 語料目錄
+        seed: 亂數種子
+        stress_pages: 壓力測試文件的頁數
+        include_stress: 是否產生壓力測試文件
+        force: 即使既有語料相符也重新產生
+
+    Returns:
+        manifest 字典（documents：檔名 → pages / page_types / bytes / sha256）
+    """
+    specs = document_specs(stress_pages)
+    if not include_stress:
+        specs = {name: types for name, types in specs.items() if not name.startswith("stress_")}
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    if not force and _manifest_matches(output_dir, seed, specs):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    documents = {}
+    for name, page_types in specs.items():
+        path = os.path.join(output_dir, name)
+        build_document(path, page_types, seed)
+        documents[name] = {
+            "pages": len(page_types),
+            "page_types": page_types,
+            "bytes": os.path.getsize(path),
+            "sha256": _sha256(path),
+        }
+
+    manifest = {"version": CORPUS_VERSION, "seed": seed, "documents": documents}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產生合成 PDF 測試語料")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus"),
+                        help="語料目錄")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    parser.add_argument("--stress-pages", type=int, default=1000, help="壓力測試文件的頁數")
+    parser.add_argument("--no-stress", action="store_true", help="不產生壓力測試文件")
+    parser.add_argument("--force", action="store_true", help="重新產生既有語料")
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.output, args.seed, args.stress_pages, not args.no_stress, args.force)
+    for name, entry in manifest["documents"].items():
+        print(f"{name:<20} {entry['pages']:>5} pages {entry['bytes'] / 1024:>9.0f} KiB  {entry['sha256'][:12]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,571 @@
+"""
+多使用者並行負載測試
+
+模擬 N 個使用者同時上傳合成語料（benchmarks/corpus.py）中的 PDF，逐步提高並行數，
+量測每個並行數下的吞吐量、延遲百分位數、錯誤率與 process 樹（含 worker process）的 RSS 與 CPU：
+- app：每個使用者一個 Streamlit session（AppTest），上傳後按下「開始解析」
+- service：HTTP 解析服務（parse_service.py），上傳後輪詢狀態並下載結果
+
+遠端服務以本地替身（benchmarks/local_llamaparse.py）取代。每份結果與單一使用者的參考結果比對，
+內容不同（暫存檔互相覆寫或被刪除）也計為錯誤；服務以 429 拒絕的上傳另外計數，依 Retry-After 重試。
+預設停用結果快取，重複上傳同一份文件時仍會實際解析。
+
+結果寫入 benchmarks/results/load/<時間>-<commit>.json。
+
+使用方式：
+    python benchmarks/load_test.py [--target app|service] [--users 1,2,4,8] [--uploads-per-user 3]
+"""
+
+import argparse
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import generate_corpus  # noqa: E402
+from run_benchmarks import DEFAULT_CORPUS_DIR, _git_revision  # noqa: E402
+
+DEFAULT_RESULTS_DIR = os.path.join(BENCH_DIR, "results", "load")
+APP_PATH = os.path.join(REPO_DIR, "streamlit_app_with_markitdown.py")
+
+# app 目標的解析模式
+APP_MODES = {
+    "auto": "智能模式（推薦）",
+    "llamaparse": "LlamaParse 優先",
+    "local_first": "本地優先（難頁送 LlamaParse）",
+    "markitdown": "MarkItDown 本地解析",
+}
+
+# RSS / CPU 取樣間隔（秒）
+SAMPLE_INTERVAL = 0.2
+# 服務狀態輪詢間隔與 429 重試等待上限（秒）
+POLL_INTERVAL = 0.1
+MAX_RETRY_WAIT = 2.0
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近排名法百分位數（q 為 0–100）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-q * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+# 資源取樣
+
+def _process_tree(pid: int) -> List[int]:
+    # 本 process 與所有子孫 process（/proc/<pid>/task/<tid>/children）
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        try:
+            tasks = os.listdir(f"/proc/{current}/task")
+        except OSError:
+            continue
+        for tid in tasks:
+            try:
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    stack.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+    return pids
+
+
+def _tree_usage(pids: List[int]) -> Dict:
+    # RSS 總和（MB）與累計 CPU 秒數（utime + stime）
+    rss_kb, ticks = 0, 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss_kb += int(line.split()[1])
+                        break
+            with open(f"/proc/{pid}/stat") as f:
+                # 第二欄（程式名稱）可能含空白，從最後一個括號之後計算
+                fields = f.read().rsplit(")", 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            continue
+    return {"rss_mb": rss_kb / 1024, "cpu_seconds": ticks / os.sysconf("SC_CLK_TCK")}
+
+
+class ResourceSampler:
+    """
+    背景執行緒定期取樣 process 樹的 RSS 與 CPU
+
+    沒有 /proc 時（macOS）只回報本 process 的 RSS（local_pool.memory_snapshot）。
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.has_proc = os.path.isdir(f"/proc/{os.getpid()}/task")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples: List[Dict] = []
+
+    def _sample(self) -> Dict:
+        if self.has_proc:
+            pids = _process_tree(os.getpid())
+            usage = _tree_usage(pids)
+            return {"time": time.monotonic(), "processes": len(pids), **usage}
+        from local_pool import memory_snapshot
+        return {"time": time.monotonic(), "processes": 1, "rss_mb": memory_snapshot()["rss_mb"],
+                "cpu_seconds": time.process_time()}
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.samples.append(self._sample())
+
+    def __enter__(self) -> "ResourceSampler":
+        self.samples = [self._sample()]
+        self._thread = threading.Thread(target=self._loop, name="load-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.samples.append(self._sample())
+
+    def summary(self) -> Dict:
+        first, last = self.samples[0], self.samples[-1]
+        wall = last["time"] - first["time"]
+        # 已結束的子 process 的 CPU 不在取樣中，CPU 使用率為下限
+        cpu = max(sample["cpu_seconds"] for sample in self.samples) - first["cpu_seconds"]
+        return {
+            "baseline_rss_mb": round(first["rss_mb"], 1),
+            "peak_rss_mb": round(max(sample["rss_mb"] for sample in self.samples), 1),
+            "peak_processes": max(sample["processes"] for sample in self.samples),
+            "cpu_percent": round(100 * cpu / wall, 1) if wall > 0 else None,
+        }
+
+
+# 目標：Streamlit 介面
+
+def _allow_concurrent_apptest() -> None:
+    """
+    讓多個 AppTest 在同一 process 的不同執行緒同時執行
+
+    - AppTest 每次執行時設定全域的 Runtime._instance、結束時清除：先結束的 session 會清除其他
+      session 正在使用的 runtime，清除後改為沿用最近一次的 runtime
+    - 每次執行都重新編譯腳本，Python 3.11 的 ast.parse 在多執行緒同時呼叫時會失敗：
+      編譯結果在所有 session 間共用，只編譯一次
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    original_instance = Runtime.instance.__func__
+    latest = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            latest[:] = [cls._instance]
+            return cls._instance
+        return latest[0] if latest else original_instance(cls)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(latest))
+
+    original_get_bytecode = ScriptCache.get_bytecode
+    compiled = {}
+    compile_lock = threading.Lock()
+
+    def get_bytecode(self, script_path):
+        with compile_lock:
+            if script_path not in compiled:
+                compiled[script_path] = original_get_bytecode(self, script_path)
+            return compiled[script_path]
+
+    ScriptCache.get_bytecode = get_bytecode
+
+
+class AppTarget:
+    """
+    每個使用者一個 Streamlit session（AppTest），與實際部署相同地共用同一個 Python process
+
+    LlamaParse 在載入介面前替換為本地替身；結果快取（process 內共用）預設停用。
+    """
+
+    name = "app"
+
+    def __init__(self, mode: str, remote_seconds_per_page: float, cache: bool = False):
+        import llama_parse
+        import local_llamaparse
+        import result_cache
+        import streamlit.logger
+
+        local_llamaparse.configure(remote_seconds_per_page)
+        # 介面以 from llama_parse import LlamaParse 取得類別，須在第一次執行前替換
+        llama_parse.LlamaParse = local_llamaparse.LocalLlamaParse
+        if not cache:
+            os.environ["PDF2MD_CACHE_DIR"] = ""
+            result_cache._shared_cache = result_cache.ResultCache(max_bytes=0)
+        self.mode = APP_MODES[mode]
+        _allow_concurrent_apptest()
+        # bare mode 的 ScriptRunContext 警告每個 session 都會出現
+        streamlit.logger.set_log_level("error")
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def session(self) -> Callable[[str, bytes], Dict]:
+        """建立一個使用者 session，回傳 upload(filename, data) -> 結果"""
+        from streamlit.testing.v1 import AppTest
+
+        at = AppTest.from_file(APP_PATH, default_timeout=600)
+        at.run()
+        for text_input in at.sidebar.text_input:
+            text_input.input("local-load-test")
+        at.sidebar.radio[0].set_value(self.mode)
+        at.run()
+
+        def upload(filename: str, data: bytes) -> Dict:
+            at.get("file_uploader")[0].upload(filename, data, "application/pdf")
+            at.run()
+            buttons = [button for button in at.button if "開始解析" in button.label]
+            if not buttons:
+                return {"success": False, "error": "parse button not shown"}
+            buttons[0].click()
+            at.run()
+            errors = [element.value for element in at.error]
+            current = at.session_state["current_result"] if "current_result" in at.session_state else None
+            if errors or current is None:
+                return {"success": False, "error": (errors or ["no result"])[0]}
+            return {"success": True, "content": current["result"]["content"],
+                    "method": current["result"].get("method")}
+
+        return upload
+
+
+# 目標：HTTP 解析服務
+
+def _use_local_llamaparse(remote_seconds_per_page: float) -> None:
+    # worker process 的初始化：以本地替身取代 LlamaParse，捨棄解析過程的輸出
+    import local_llamaparse
+    import medical_journal_parser
+
+    sys.stdout = open(os.devnull, "w")
+    local_llamaparse.configure(remote_seconds_per_page)
+    medical_journal_parser.LlamaParse = local_llamaparse.LocalLlamaParse
+
+
+def _quiet_handler():
+    from parse_service import ParseRequestHandler
+
+    class QuietHandler(ParseRequestHandler):
+        def log_message(self, format, *args):
+            # 不輸出每個請求的存取記錄
+            pass
+
+    return QuietHandler
+
+
+class ServiceTarget:
+    """
+    HTTP 解析服務（與 medical_journal_parser.py serve 相同：可回收的 worker process + 有界佇列）
+
+    伺服器在本 process 的背景執行緒中執行，使用者以 HTTP 上傳、輪詢並下載結果。
+    """
+
+    name = "service"
+
+    def __init__(self, engine: str, remote_seconds_per_page: float, concurrency: int, max_queue: int):
+        self.engine = engine
+        self.remote_seconds_per_page = remote_seconds_per_page
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+
+    def start(self) -> None:
+        import medical_journal_parser
+        from local_pool import LocalConversionPool
+        from parse_service import ParseHTTPServer, ParseService
+
+        self.work_dir = tempfile.mkdtemp(prefix="pdf2md-load-")
+        options = {"engine": self.engine, "postprocess": True, "deadlines": None, "optimize": None,
+                   "quality_threshold": medical_journal_parser.QUALITY_THRESHOLD,
+                   "extract_images": False, "tiered": False}
+        self.pool = LocalConversionPool(
+            self.concurrency, task=medical_journal_parser._service_task,
+            initializer=functools.partial(_use_local_llamaparse, self.remote_seconds_per_page))
+        self.pool.__enter__()
+
+        def process(pdf_path, output_dir):
+            return self.pool.run(pdf_path, output_dir, options)["success"]
+
+        self.service = ParseService(process, self.work_dir, concurrency=self.concurrency,
+                                    max_queue=self.max_queue)
+        self.service.start()
+        self.server = ParseHTTPServer(("127.0.0.1", 0), self.service)
+        self.server.RequestHandlerClass = _quiet_handler()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, name="load-server", daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.stop()
+        self.pool.__exit__(None, None, None)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _request(self, method: str, path: str, data: Optional[bytes] = None,
+                 headers: Optional[Dict] = None):
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers=headers or {})
+        try:
+            with urllib.request.urlopen(request, timeout=600) as response:
+                return response.status, dict(response.headers), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, dict(e.headers), e.read()
+
+    def session(self) -> Callable[[str, bytes], Dict]:
+        def upload(filename: str, data: bytes) -> Dict:
+            headers = {"Content-Type": "application/pdf", "X-Filename": filename}
+            while True:
+                status, response_headers, body = self._request("POST", "/jobs", data, headers)
+                if status != 429:
+                    break
+                # 佇列已滿：依 Retry-After 等待後重試（等待時間計入延遲）
+                with self._retries_lock:
+                    self.retries += 1
+                time.sleep(min(MAX_RETRY_WAIT, float(response_headers.get("Retry-After", 1))))
+            if status != 202:
+                return {"success": False, "error": f"upload: HTTP {status}"}
+            job_id = json.loads(body)["id"]
+            while True:
+                status, _, body = self._request("GET", f"/jobs/{job_id}")
+                state = json.loads(body).get("state") if status == 200 else None
+                if state not in ("queued", "running"):
+                    break
+                time.sleep(POLL_INTERVAL)
+            if state != "done":
+                return {"success": False, "error": f"job {state}: {json.loads(body).get('error')}"}
+            status, _, body = self._request("GET", f"/jobs/{job_id}/result")
+            if status != 200:
+                return {"success": False, "error": f"result: HTTP {status}"}
+            return {"success": True, "content": body.decode("utf-8")}
+
+        return upload
+
+
+# 執行
+
+def run_level(target, users: int, uploads_per_user: int, documents: List[Dict],
+              reference: Dict[str, str], shared_filename: Optional[str]) -> Dict:
+    """
+    一個並行數：users 個使用者同時開始，各自依序上傳 uploads_per_user 份文件
+
+    第 i 個使用者的第 j 次上傳為 documents[(i + j) % len(documents)]，同時進行的上傳涵蓋不同文件。
+    """
+    sessions = [target.session() for _ in range(users)]
+    outcomes: List[Dict] = []
+    outcomes_lock = threading.Lock()
+    start_barrier = threading.Barrier(users)
+
+    def user(index: int) -> None:
+        start_barrier.wait()
+        for j in range(uploads_per_user):
+            document = documents[(index + j) % len(documents)]
+            start = time.perf_counter()
+            try:
+                outcome = sessions[index](shared_filename or document["name"], document["data"])
+            except Exception as e:
+                outcome = {"success": False, "error": f"{type(e).__name__}: {e}"}
+            outcome["seconds"] = time.perf_counter() - start
+            outcome["document"] = document["name"]
+            outcome["pages"] = document["pages"]
+            if outcome["success"] and reference.get(document["name"]) not in (None, fingerprint(outcome["content"])):
+                outcome.update(success=False, error="content differs from the single-user result")
+            outcome.pop("content", None)
+            with outcomes_lock:
+                outcomes.append(outcome)
+
+    threads = [threading.Thread(target=user, args=(i,), name=f"load-user-{i}") for i in range(users)]
+    retries_before = getattr(target, "retries", 0)
+    with ResourceSampler() as sampler:
+        wall_start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_start
+
+    succeeded = [outcome for outcome in outcomes if outcome["success"]]
+    latencies = [outcome["seconds"] for outcome in succeeded]
+    errors: Dict[str, int] = {}
+    for outcome in outcomes:
+        if not outcome["success"]:
+            errors[outcome["error"][:80]] = errors.get(outcome["error"][:80], 0) + 1
+    return {
+        "users": users,
+        "uploads": len(outcomes),
+        "succeeded": len(succeeded),
+        "error_rate": round(1 - len(succeeded) / len(outcomes), 4) if outcomes else 0.0,
+        "errors": errors,
+        "rejected_retries": getattr(target, "retries", 0) - retries_before,
+        "wall_seconds": round(wall, 3),
+        "documents_per_second": round(len(succeeded) / wall, 3) if wall > 0 else None,
+        "pages_per_second": round(sum(outcome["pages"] for outcome in succeeded) / wall, 2) if wall > 0 else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p90": percentile(latencies, 90),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": max(latencies) if latencies else None,
+        **sampler.summary(),
+    }
+
+
+def build_reference(target, documents: List[Dict]) -> Dict[str, str]:
+    """單一使用者依序解析每份文件一次，記錄內容指紋（同時預熱 worker 與模組匯入）"""
+    upload = target.session()
+    reference = {}
+    for document in documents:
+        outcome = upload(document["name"], document["data"])
+        if not outcome["success"]:
+            raise RuntimeError(f"reference run failed for {document['name']}: {outcome['error']}")
+        reference[document["name"]] = fingerprint(outcome["content"])
+    return reference
+
+
+def capacity(levels: List[Dict], slo_seconds: Optional[float]) -> Optional[int]:
+    """沒有錯誤（且 p90 延遲在 SLO 內）的最高並行數"""
+    healthy = [level["users"] for level in levels
+               if level["error_rate"] == 0
+               and (slo_seconds is None or (level["latency_p90"] or 0) <= slo_seconds)]
+    return max(healthy) if healthy else None
+
+
+def format_table(levels: List[Dict]) -> str:
+    def seconds(value):
+        return f"{value:.2f}" if value is not None else "-"
+
+    lines = [f"{'users':>5} {'uploads':>7} {'errors':>7} {'retry':>5} {'docs/s':>7} {'pages/s':>8} "
+             f"{'p50 s':>7} {'p90 s':>7} {'p99 s':>7} {'max s':>7} {'peak MB':>8} {'procs':>5} {'cpu %':>6}"]
+    for level in levels:
+        lines.append(f"{level['users']:>5} {level['uploads']:>7} {level['error_rate']:>7.1%} "
+                     f"{level['rejected_retries']:>5} {level['documents_per_second'] or 0:>7.2f} "
+                     f"{level['pages_per_second'] or 0:>8.1f} {seconds(level['latency_p50']):>7} "
+                     f"{seconds(level['latency_p90']):>7} {seconds(level['latency_p99']):>7} "
+                     f"{seconds(level['latency_max']):>7} {level['peak_rss_mb']:>8.0f} "
+                     f"{level['peak_processes']:>5} {level['cpu_percent'] or 0:>6.0f}")
+        for error, count in level["errors"].items():
+            lines.append(f"      {count} × {error}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多使用者並行負載測試")
+    parser.add_argument("--target", choices=["app", "service"], default="app", help="測試目標")
+    parser.add_argument("--users", default="1,2,4,8", help="逗號分隔的並行使用者數（依序執行）")
+    parser.add_argument("--uploads-per-user", type=int, default=3, help="每個使用者依序上傳的文件數")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="語料目錄（不存在時自動產生）")
+    parser.add_argument("--documents", help="逗號分隔的文件名稱（預設為全部，不含壓力測試文件）")
+    parser.add_argument("--shared-filename",
+                        help="所有上傳使用同一個檔名（例如 paper.pdf），檢查暫存檔是否互相覆寫")
+    parser.add_argument("--mode", choices=list(APP_MODES), default="auto", help="app 目標的解析模式")
+    parser.add_argument("--engine", choices=["llamaparse", "markitdown", "hybrid"], default="llamaparse",
+                        help="service 目標的解析引擎")
+    parser.add_argument("--concurrency", type=int, default=4, help="service 目標的 worker 數")
+    parser.add_argument("--max-queue", type=int, default=16, help="service 目標的佇列上限")
+    parser.add_argument("--remote-seconds-per-page", type=float, default=0.05,
+                        help="本地 LlamaParse 替身的每頁模擬延遲")
+    parser.add_argument("--cache", action="store_true", help="app 目標啟用結果快取（預設停用）")
+    parser.add_argument("--slo", type=float, help="p90 延遲目標（秒），用於計算可承受的並行數")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_DIR, help="結果目錄")
+    parser.add_argument("--no-save", action="store_true", help="不寫入結果檔")
+    args = parser.parse_args()
+
+    levels_users = [int(value) for value in args.users.split(",") if value.strip()]
+    manifest = generate_corpus(args.corpus, include_stress=False)
+    entries = manifest["documents"]
+    if args.documents:
+        wanted = {name.strip() for name in args.documents.split(",")}
+        entries = {name: entry for name, entry in entries.items() if name in wanted}
+    documents = []
+    for name, entry in entries.items():
+        with open(os.path.join(args.corpus, name), "rb") as f:
+            documents.append({"name": name, "pages": entry["pages"], "data": f.read()})
+
+    if args.target == "app":
+        target = AppTarget(args.mode, args.remote_seconds_per_page, cache=args.cache)
+    else:
+        target = ServiceTarget(args.engine, args.remote_seconds_per_page, args.concurrency, args.max_queue)
+
+    # 解析過程的輸出全部捨棄：redirect_stdout 替換的是全域的 sys.stdout，不能在各使用者執行緒內各自切換
+    console = sys.stdout
+    print(format_table([]), flush=True)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        target.start()
+        try:
+            reference = build_reference(target, documents)
+            levels = []
+            for users in levels_users:
+                level = run_level(target, users, args.uploads_per_user, documents, reference,
+                                  args.shared_filename)
+                levels.append(level)
+                print(format_table([level]).split("\n", 1)[1], file=console, flush=True)
+        finally:
+            target.stop()
+
+    results = {
+        **_git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "target": args.target,
+            "mode": args.mode if args.target == "app" else None,
+            "engine": args.engine if args.target == "service" else None,
+            "concurrency": args.concurrency if args.target == "service" else None,
+            "max_queue": args.max_queue if args.target == "service" else None,
+            "uploads_per_user": args.uploads_per_user,
+            "shared_filename": args.shared_filename,
+            "remote_seconds_per_page": args.remote_seconds_per_page,
+            "cache": args.cache,
+            "corpus_sha256": {name: entry["sha256"] for name, entry in entries.items()},
+        },
+        "levels": levels,
+        "capacity_users": capacity(levels, args.slo),
+    }
+
+    print()
+    print(format_table(levels))
+    slo = f" with p90 ≤ {args.slo:g}s" if args.slo else ""
+    print(f"capacity: {results['capacity_users'] or 'none'} concurrent user(s) without errors{slo}")
+
+    if not args.no_save:
+        os.makedirs(args.results, exist_ok=True)
+        result_path = os.path.join(args.results,
+                                   f"{time.strftime('%Y%m%d-%H%M%S')}-{results['commit'] or 'nogit'}.json")
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"\nresults saved to {result_path}")
+
+
+if __name__ == "__main__":
+    main()
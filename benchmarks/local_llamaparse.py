@@ -0,0 +1,88 @@
+"""
+本地 LlamaParse 替身（效能測試用）
+
+提供與 LlamaParse 相同的呼叫介面（建構參數、get_json_result、aget_json），
+不連線、不消耗額度：以 PyMuPDF 擷取文字層作為每頁 Markdown，並依模擬的上傳頻寬與每頁延遲等待，
+讓效能測試量測的是本地端的排程、後處理與寫檔成本，而不是網路狀況。
+
+沒有文字層的頁面（掃描頁）回傳固定的辨識結果，模擬多模態模型的輸出。
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+
+# 模擬的遠端延遲（秒）；由效能測試設定
+SECONDS_PER_PAGE = 0.02
+UPLOAD_MBPS = 200.0
+# 每個工作固定的建立與輪詢往返延遲（實際服務約 1–5 秒的輪詢間隔）
+JOB_SECONDS = 0.0
+# 依多模態模型覆寫每頁延遲（模型分級測試用），未列出的模型使用 SECONDS_PER_PAGE
+MODEL_SECONDS_PER_PAGE: Dict[str, float] = {}
+
+
+def configure(seconds_per_page: Optional[float] = None, upload_mbps: Optional[float] = None,
+              job_seconds: Optional[float] = None, model_seconds: Optional[Dict[str, float]] = None) -> None:
+    """設定模擬延遲（在每個測試 process 內呼叫）"""
+    global SECONDS_PER_PAGE, UPLOAD_MBPS, JOB_SECONDS
+    if seconds_per_page is not None:
+        SECONDS_PER_PAGE = seconds_per_page
+    if upload_mbps is not None:
+        UPLOAD_MBPS = upload_mbps
+    if job_seconds is not None:
+        JOB_SECONDS = job_seconds
+    if model_seconds is not None:
+        MODEL_SECONDS_PER_PAGE.clear()
+        MODEL_SECONDS_PER_PAGE.update(model_seconds)
+
+
+def _parse_target_pages(target_pages: Optional[str]) -> Optional[List[int]]:
+    # LlamaParse 的 target_pages 從 0 開始、以逗號分隔
+    if not target_pages:
+        return None
+    return [int(part) for part in str(target_pages).split(",") if part.strip()]
+
+
+class LocalLlamaParse:
+    """與 llama_parse.LlamaParse 相容的本地替身"""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.target_pages = _parse_target_pages(kwargs.get("target_pages"))
+        self.calls: List[Dict] = []
+
+    def _pages(self, file_path: str) -> List[Dict]:
+        import fitz  # PyMuPDF
+
+        pages = []
+        with fitz.open(file_path) as doc:
+            numbers = self.target_pages if self.target_pages is not None else range(doc.page_count)
+            for index in numbers:
+                text = doc[index].get_text("text").strip()
+                if not text:
+                    text = (f"# Scanned page {index + 1}\n\n"
+                            "Text recognized from the page image by the multimodal model.")
+                pages.append({"page": index + 1, "md": text, "text": text})
+        return pages
+
+    def _delay(self, file_path: str, pages: int) -> float:
+        upload = os.path.getsize(file_path) * 8 / (UPLOAD_MBPS * 1_000_000)
+        per_page = MODEL_SECONDS_PER_PAGE.get(self.kwargs.get("vendor_multimodal_model_name"), SECONDS_PER_PAGE)
+        return JOB_SECONDS + upload + pages * per_page
+
+    def _result(self, file_path: str, pages: List[Dict]) -> List[Dict]:
+        self.calls.append({"file_path": file_path, "pages": len(pages),
+                           "model": self.kwargs.get("vendor_multimodal_model_name")})
+        return [{"file_path": file_path, "job_id": f"local-{len(self.calls)}", "pages": pages}]
+
+    def get_json_result(self, file_path: str) -> List[Dict]:
+        pages = self._pages(file_path)
+        time.sleep(self._delay(file_path, len(pages)))
+        return self._result(file_path, pages)
+
+    async def aget_json(self, file_path: str) -> List[Dict]:
+        pages = self._pages(file_path)
+        # 以 asyncio.sleep 等待，時限與取消可以中止
+        await asyncio.sleep(self._delay(file_path, len(pages)))
+        return self._result(file_path, pages)
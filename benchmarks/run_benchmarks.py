@@ -0,0 +1,299 @@
+"""
+解析路徑的回歸與效能測試
+
+在合成語料（benchmarks/corpus.py）上執行每條解析路徑，量測吞吐量（pages/sec）、延遲與峰值 RSS：
+- 批次路徑：process_pdf（LlamaParse）、process_pdf_fallback（MarkItDown）、process_pdf_hybrid（本地優先）
+- 網頁路徑：smart_parse 的四種模式
+
+遠端服務以本地替身（benchmarks/local_llamaparse.py）取代，延遲可設定，不需要 API key 也不消耗額度。
+每個 (路徑, 文件) 在獨立的 process 中執行，峰值 RSS 不受其他測試影響。
+
+結果寫入 benchmarks/results/<時間>-<commit>.json，並與前一次結果比較：
+吞吐量下降或峰值 RSS 上升超過門檻時列為回歸（--fail-on-regression 時以非零狀態結束）。
+
+使用方式：
+    python benchmarks/run_benchmarks.py [--quick] [--paths process_pdf,smart_markitdown] [--repeat 3]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import generate_corpus  # noqa: E402
+
+DEFAULT_CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+DEFAULT_RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# 路徑名稱 → (模組, 函數或 smart_parse 模式)
+PATHS = {
+    "process_pdf": ("medical_journal_parser", "process_pdf"),
+    "process_pdf_fallback": ("medical_journal_parser", "process_pdf_fallback"),
+    "process_pdf_hybrid": ("medical_journal_parser", "process_pdf_hybrid"),
+    "smart_auto": ("streamlit_app_with_markitdown", "智能模式（推薦）"),
+    "smart_llamaparse": ("streamlit_app_with_markitdown", "LlamaParse 優先"),
+    "smart_local_first": ("streamlit_app_with_markitdown", "本地優先（難頁送 LlamaParse）"),
+    "smart_markitdown": ("streamlit_app_with_markitdown", "MarkItDown 本地解析"),
+}
+
+# 回歸門檻：吞吐量下降或峰值 RSS 上升超過此比例
+REGRESSION_THRESHOLD = 0.2
+
+
+def _load_module(name: str):
+    import local_llamaparse
+
+    # Streamlit 介面在匯入時以 bare mode 執行（不會有互動）
+    with contextlib.redirect_stdout(io.StringIO()):
+        module = __import__(name)
+    module.LlamaParse = local_llamaparse.LocalLlamaParse
+    return module
+
+
+def _run_once(module, target: str, pdf_path: str, output_dir: str) -> Dict:
+    if module.__name__ == "medical_journal_parser":
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            success = getattr(module, target)(pdf_path, output_dir)
+        lines = log.getvalue().strip().splitlines()
+        return {"success": bool(success), "error": None if success or not lines else lines[-1]}
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = module.smart_parse(pdf_path, target, "gemini-2.5-pro", "local-benchmark",
+                                    {"auto_retry": True, "max_retries": 2})
+    return {"success": bool(result.get("success")), "method": result.get("method"),
+            "error": result.get("error"), "worker_peak_mb": (result.get("memory") or {}).get("peak_mb")}
+
+
+def run_case(path_name: str, pdf_path: str, pages: int, repeat: int,
+             remote_seconds_per_page: float, upload_mbps: float) -> Dict:
+    """執行一個 (路徑, 文件) 測試（在獨立的 process 中呼叫，見 spawn_case）"""
+    import local_llamaparse
+    from local_pool import memory_snapshot, reset_peak_memory
+
+    local_llamaparse.configure(remote_seconds_per_page, upload_mbps)
+    module_name, target = PATHS[path_name]
+    module = _load_module(module_name)
+    baseline = memory_snapshot()
+
+    latencies = []
+    outcome: Dict = {}
+    per_document = reset_peak_memory()
+    with tempfile.TemporaryDirectory() as output_dir:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outcome = _run_once(module, target, pdf_path, output_dir)
+            latencies.append(time.perf_counter() - start)
+            if not outcome["success"]:
+                break
+
+    memory = memory_snapshot()
+    median = statistics.median(latencies)
+    return {
+        "path": path_name,
+        "document": os.path.basename(pdf_path),
+        "pages": pages,
+        "success": outcome.get("success", False),
+        "method": outcome.get("method"),
+        "error": outcome.get("error"),
+        "latency_seconds": round(median, 4),
+        "latencies": [round(value, 4) for value in latencies],
+        "pages_per_second": round(pages / median, 2) if median > 0 else None,
+        "baseline_rss_mb": baseline["rss_mb"],
+        "peak_rss_mb": memory["peak_mb"],
+        "peak_is_per_run": per_document,
+        "worker_peak_rss_mb": outcome.get("worker_peak_mb"),
+    }
+
+
+def spawn_case(path_name: str, pdf_path: str, pages: int, repeat: int,
+               remote_seconds_per_page: float, upload_mbps: float) -> Dict:
+    """
+    以新的 Python process 執行一個測試，回傳 run_case 的結果
+
+    使用一般的子 process 而不是 process pool：測試路徑本身會建立共用的 MarkItDown pool，
+    在 pool worker 內結束時會互相等待；子 process 的 stdout 只有最後一行結果 JSON。
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--case", path_name, pdf_path, str(pages),
+               "--repeat", str(repeat), "--remote-seconds-per-page", str(remote_seconds_per_page),
+               "--upload-mbps", str(upload_mbps)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode == 0 and lines:
+        return json.loads(lines[-1])
+    error = (completed.stderr.strip().splitlines() or [f"exit code {completed.returncode}"])[-1]
+    return {"path": path_name, "document": os.path.basename(pdf_path), "pages": pages, "success": False,
+            "method": None, "error": error, "latency_seconds": 0.0, "latencies": [],
+            "pages_per_second": None, "baseline_rss_mb": None, "peak_rss_mb": None,
+            "peak_is_per_run": False, "worker_peak_rss_mb": None}
+
+
+def _git_revision() -> Dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "--short", "HEAD"), "dirty": bool(status)}
+
+
+def latest_result(results_dir: str, exclude: Optional[str] = None) -> Optional[str]:
+    """結果目錄中最新的結果檔（檔名以時間開頭）"""
+    if not os.path.isdir(results_dir):
+        return None
+    names = sorted(name for name in os.listdir(results_dir)
+                   if name.endswith(".json") and os.path.join(results_dir, name) != exclude)
+    return os.path.join(results_dir, names[-1]) if names else None
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """
+    比較兩次結果，回傳回歸描述列表
+
+    只比較兩次都成功的 (路徑, 文件)；延遲受模擬遠端延遲影響，設定不同時不比較吞吐量。
+    """
+    regressions = []
+    same_remote = current["settings"]["remote_seconds_per_page"] == baseline["settings"]["remote_seconds_per_page"]
+    previous = {(case["path"], case["document"]): case for case in baseline["cases"]}
+    for case in current["cases"]:
+        before = previous.get((case["path"], case["document"]))
+        if not before:
+            continue
+        label = f"{case['path']} / {case['document']}"
+        if before["success"] and not case["success"]:
+            regressions.append(f"{label}: now fails")
+            continue
+        if not (before["success"] and case["success"]):
+            continue
+        if same_remote and before["pages_per_second"] and case["pages_per_second"]:
+            change = case["pages_per_second"] / before["pages_per_second"] - 1
+            if change < -threshold:
+                regressions.append(f"{label}: {before['pages_per_second']} → {case['pages_per_second']} "
+                                   f"pages/s ({change:+.0%})")
+        if before.get("peak_rss_mb") and case.get("peak_rss_mb"):
+            change = case["peak_rss_mb"] / before["peak_rss_mb"] - 1
+            if change > threshold:
+                regressions.append(f"{label}: peak RSS {before['peak_rss_mb']} → {case['peak_rss_mb']} MB "
+                                   f"({change:+.0%})")
+    return regressions
+
+
+def format_table(cases: List[Dict]) -> str:
+    lines = [f"{'path':<22} {'document':<18} {'pages':>6} {'latency s':>10} {'pages/s':>9} {'peak MB':>8}  result"]
+    for case in cases:
+        pages_per_second = f"{case['pages_per_second']:.1f}" if case["pages_per_second"] else "-"
+        peak = f"{case['peak_rss_mb']:.0f}" if case["peak_rss_mb"] else "-"
+        result = "ok" if case["success"] else "FAILED"
+        if case.get("method"):
+            result += f" ({case['method']})"
+        if not case["success"] and case.get("error"):
+            result += f": {case['error'][:60]}"
+        lines.append(f"{case['path']:<22} {case['document']:<18} {case['pages']:>6} "
+                     f"{case['latency_seconds']:>10.3f} {pages_per_second:>9} {peak:>8}  {result}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析路徑的回歸與效能測試")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="語料目錄（不存在時自動產生）")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_DIR, help="結果目錄")
+    parser.add_argument("--paths", default=",".join(PATHS), help=f"逗號分隔的路徑：{', '.join(PATHS)}")
+    parser.add_argument("--documents", help="逗號分隔的文件名稱（預設為全部）")
+    parser.add_argument("--quick", action="store_true", help="略過壓力測試文件")
+    parser.add_argument("--stress-pages", type=int, default=1000, help="壓力測試文件的頁數")
+    parser.add_argument("--repeat", type=int, default=1, help="每個測試的重複次數（取中位數）")
+    parser.add_argument("--remote-seconds-per-page", type=float, default=0.02,
+                        help="本地 LlamaParse 替身的每頁模擬延遲")
+    parser.add_argument("--upload-mbps", type=float, default=200.0, help="本地替身的模擬上傳頻寬")
+    parser.add_argument("--baseline", help="比較用的結果檔（預設為結果目錄中最新的一份）")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="回歸門檻")
+    parser.add_argument("--fail-on-regression", action="store_true", help="發現回歸時以非零狀態結束")
+    parser.add_argument("--no-save", action="store_true", help="不寫入結果檔")
+    parser.add_argument("--case", nargs=3, metavar=("PATH", "PDF", "PAGES"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # 子 process：執行單一測試並輸出結果 JSON
+        path_name, pdf_path, pages = args.case
+        case = run_case(path_name, pdf_path, int(pages), args.repeat,
+                        args.remote_seconds_per_page, args.upload_mbps)
+        print(json.dumps(case, ensure_ascii=False))
+        return
+
+    paths = [name.strip() for name in args.paths.split(",") if name.strip()]
+    unknown = [name for name in paths if name not in PATHS]
+    if unknown:
+        parser.error(f"unknown paths: {', '.join(unknown)}")
+
+    manifest = generate_corpus(args.corpus, stress_pages=args.stress_pages, include_stress=not args.quick)
+    documents = manifest["documents"]
+    if args.documents:
+        wanted = {name.strip() for name in args.documents.split(",")}
+        documents = {name: entry for name, entry in documents.items() if name in wanted}
+
+    cases = []
+    for path_name in paths:
+        for name, entry in documents.items():
+            # 每個測試一個新的 process：峰值 RSS 與 warm 狀態互不影響
+            case = spawn_case(path_name, os.path.join(args.corpus, name), entry["pages"], args.repeat,
+                              args.remote_seconds_per_page, args.upload_mbps)
+            cases.append(case)
+            print(format_table([case]).splitlines()[1], flush=True)
+
+    results = {
+        **_git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "repeat": args.repeat,
+            "remote_seconds_per_page": args.remote_seconds_per_page,
+            "upload_mbps": args.upload_mbps,
+            "corpus_seed": manifest["seed"],
+            "corpus_sha256": {name: entry["sha256"] for name, entry in documents.items()},
+        },
+        "cases": cases,
+    }
+
+    print()
+    print(format_table(cases))
+
+    result_path = None
+    if not args.no_save:
+        os.makedirs(args.results, exist_ok=True)
+        result_path = os.path.join(args.results, f"{time.strftime('%Y%m%d-%H%M%S')}-{results['commit'] or 'nogit'}.json")
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"\nresults saved to {result_path}")
+
+    baseline_path = args.baseline or latest_result(args.results, exclude=result_path)
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        print(f"compared with {os.path.basename(baseline_path)} (commit {baseline.get('commit')}): "
+              f"{len(regressions)} regression(s)")
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+LlamaParse 批次提交
+
+逐份呼叫 get_json_result() 時，每份文件各自建立工作並各自跑一個輪詢迴圈，
+數百篇短篇論文的總時間主要花在建立工作與輪詢的往返上，而不是解析本身。
+此模組以單一 event loop（背景執行緒）同時追蹤多份文件的遠端工作：
+- 同時在途的工作數固定為 concurrency，一份完成就從排程器取下一份（維持最短工作優先）
+- 完成的文件立即交回呼叫端執行緒寫檔，不必等整批結束
+- 每份文件各自套用時限（整份 + 每頁），逾時只取消該份工作
+
+llama_parse 本身也接受檔案列表（aget_json([...])），但要等整批完成才回傳、
+失敗的文件會被略過而無法對應，所以這裡改為在同一個 loop 中多工處理單檔呼叫。
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from deadlines import Deadline, count_pages
+from pdf_optimizer import optimized_upload
+
+# 同時在途的遠端工作數
+DEFAULT_CONCURRENCY = 16
+
+
+class BulkLlamaParse:
+    """
+    以單一 event loop 多工處理多份文件的 LlamaParse 工作
+
+    Args:
+        parser: LlamaParse 實例（各文件共用；需要 aget_json 或 aget_json_result）
+        concurrency: 同時在途的工作數
+        deadline_seconds: 每份文件的時限（秒）
+        page_deadline_seconds: 每頁額外增加的時限（秒）
+        optimize: 上傳前最佳化參數（pdf_optimizer.optimize_pdf），None 為上傳原檔
+    """
+
+    def __init__(self, parser, concurrency: int = DEFAULT_CONCURRENCY,
+                 deadline_seconds: Optional[float] = None, page_deadline_seconds: Optional[float] = None,
+                 optimize: Optional[Dict] = None):
+        self.parser = parser
+        self.concurrency = max(1, concurrency)
+        self.deadline_seconds = deadline_seconds
+        self.page_deadline_seconds = page_deadline_seconds
+        self.optimize = optimize
+        # 新版為 aget_json，舊版為 aget_json_result
+        self._aget = getattr(parser, "aget_json", None) or getattr(parser, "aget_json_result")
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="llamaparse-bulk", daemon=True)
+        self._thread.start()
+
+    def _timeout(self, pdf_path: str) -> Optional[float]:
+        if self.deadline_seconds is None and not self.page_deadline_seconds:
+            return None
+        return Deadline.for_document(self.deadline_seconds, self.page_deadline_seconds,
+                                     count_pages(pdf_path)).seconds
+
+    async def _parse(self, pdf_path: str) -> Dict:
+        start_time = time.time()
+        timeout = self._timeout(pdf_path)
+        # 最佳化在 loop 之外的執行緒進行，不阻塞其他文件的輪詢
+        upload = optimized_upload(pdf_path, self.optimize)
+        upload_path, report = await asyncio.to_thread(upload.__enter__)
+        try:
+            if timeout is None:
+                json_objs = await self._aget(upload_path)
+            else:
+                json_objs = await asyncio.wait_for(self._aget(upload_path), timeout)
+        except asyncio.TimeoutError:
+            return {"success": False, "error": f"解析超過時限 {timeout:.0f} 秒", "error_type": "timeout",
+                    "seconds": time.time() - start_time, "upload": report}
+        except Exception as e:
+            return {"success": False, "error": str(e), "error_type": "unknown",
+                    "seconds": time.time() - start_time, "upload": report}
+        finally:
+            upload.__exit__(None, None, None)
+
+        if not json_objs:
+            return {"success": False, "error": "No content parsed from PDF", "error_type": "empty",
+                    "seconds": time.time() - start_time, "upload": report}
+        return {
+            "success": True,
+            "pages": json_objs[0]["pages"],
+            "job_id": json_objs[0].get("job_id"),
+            "seconds": time.time() - start_time,
+            "upload": report,
+        }
+
+    def submit(self, pdf_path: str) -> Future:
+        """送出單一文件，回傳 concurrent.futures.Future（結果為結果字典）"""
+        return asyncio.run_coroutine_threadsafe(self._parse(pdf_path), self.loop)
+
+    def parse_many(self, jobs: Iterable[str]) -> Iterator[Tuple[str, Dict]]:
+        """
+        處理多份文件，依完成順序產生 (路徑, 結果)
+
+        同時在途的工作數等於 concurrency，一份完成才從 jobs 取下一份；
+        jobs 可為惰性 iterator，例如 JobScheduler.drain()。
+
+        結果字典：success / pages（LlamaParse 的頁面列表）/ seconds / upload，
+        失敗時為 error / error_type（timeout / empty / unknown）/ seconds
+        """
+        pending = iter(jobs)
+        exhausted = False
+        in_flight: Dict[Future, str] = {}
+
+        while not exhausted or in_flight:
+            while not exhausted and len(in_flight) < self.concurrency:
+                pdf_path = next(pending, None)
+                if pdf_path is None:
+                    exhausted = True
+                    break
+                in_flight[self.submit(pdf_path)] = pdf_path
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_path = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"success": False, "error": str(e), "error_type": "unknown"}
+                yield pdf_path, result
+
+    def shutdown(self) -> None:
+        """取消尚未完成的工作並停止 event loop"""
+        async def cancel_all() -> None:
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            # 等待取消完成：llama_parse 停止輪詢並關閉連線
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_all(), self.loop).result(timeout=5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        if not self.loop.is_running():
+            self.loop.close()
+
+    def __enter__(self) -> "BulkLlamaParse":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
@@ -0,0 +1,326 @@
+"""
+壓縮的結果與快取儲存
+
+解析後的 Markdown、逐頁 JSONL 與快取的引擎結果都是高度可壓縮的文字，封存多年的期刊輸出可達數 GB。
+此模組提供透明壓縮（有 zstd 時使用 zstd，否則 gzip）：
+- write_bytes / read_bytes：整個檔案壓縮為 <name>.zst 或 <name>.gz；讀取時自動找到壓縮的版本
+- 逐頁分框（framing）：<name>.pages.jsonl.gz|.zst 中每頁是一個獨立的壓縮 frame，
+  <檔名>.idx 記錄各 frame 的起始位移（與 page_store 相同的 uint64 格式），讀取單頁只需解壓一個 frame
+- 多個 gzip member / zstd frame 串接仍是合法的壓縮串流，zcat / zstdcat 可直接還原完整的 JSONL
+- archive_document / archive_directory：將既有輸出目錄轉為壓縮封存
+
+zstd 依序使用標準函式庫的 compression.zstd（Python 3.14+）或 zstandard 套件；兩者都沒有時退回 gzip。
+gzip 以 mtime=0 寫入，相同內容每次壓縮的結果相同，AtomicWriter 才能判斷內容沒有改變而不改寫檔案。
+"""
+
+import gzip
+import json
+import os
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from atomic_io import AtomicWriter
+from page_store import _OFFSET, index_path_for, pages_path_for
+
+try:
+    from compression import zstd as _zstd  # Python 3.14+
+except ImportError:
+    _zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 編碼與副檔名（讀取時依此順序尋找）
+CODECS = {"zstd": ".zst", "gzip": ".gz"}
+ZSTD_AVAILABLE = _zstd is not None or zstandard is not None
+DEFAULT_CODEC = "zstd" if ZSTD_AVAILABLE else "gzip"
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+
+
+def available_codecs() -> Tuple[str, ...]:
+    """此環境可讀寫的編碼"""
+    return tuple(codec for codec in CODECS if codec != "zstd" or ZSTD_AVAILABLE)
+
+
+def _check_codec(codec: str) -> None:
+    if codec not in CODECS:
+        raise ValueError(f"不支援的壓縮格式: {codec}")
+    if codec == "zstd" and not ZSTD_AVAILABLE:
+        raise ValueError("zstd 需要 Python 3.14+ 或 zstandard 套件（pip install zstandard）")
+
+
+def compress(data: bytes, codec: str = DEFAULT_CODEC) -> bytes:
+    """壓縮為單一 frame（gzip member / zstd frame）"""
+    _check_codec(codec)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if _zstd is not None:
+        return _zstd.compress(data, level=ZSTD_LEVEL)
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """解壓縮（可包含多個串接的 frame）"""
+    _check_codec(codec)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if _zstd is not None:
+        return _zstd.decompress(data)
+    # zstandard 的 decompress() 只處理第一個 frame，串接的 frame 需以串流讀取
+    reader = zstandard.ZstdDecompressor().decompressobj(read_across_frames=True)
+    return reader.decompress(data)
+
+
+def compressed_path_for(path: str, codec: str = DEFAULT_CODEC) -> str:
+    """未壓縮路徑對應的壓縮檔路徑"""
+    _check_codec(codec)
+    return path + CODECS[codec]
+
+
+def codec_for(path: str) -> Optional[str]:
+    """由副檔名判斷編碼，未壓縮時為 None"""
+    for codec, suffix in CODECS.items():
+        if path.endswith(suffix):
+            return codec
+    return None
+
+
+def logical_path(path: str) -> str:
+    """壓縮檔對應的未壓縮路徑（例如 paper.md.gz -> paper.md）"""
+    codec = codec_for(path)
+    return path[:-len(CODECS[codec])] if codec else path
+
+
+def find_compressed(path: str) -> Optional[Tuple[str, str]]:
+    """
+    尋找未壓縮路徑的壓縮版本（只回傳此環境可讀取的編碼）
+
+    Returns:
+        (壓縮檔路徑, 編碼)，沒有時為 None
+    """
+    for codec in available_codecs():
+        candidate = path + CODECS[codec]
+        if os.path.exists(candidate):
+            return candidate, codec
+    return None
+
+
+def exists(path: str) -> bool:
+    """未壓縮的檔案或其壓縮版本存在"""
+    return os.path.exists(path) or find_compressed(path) is not None
+
+
+def stored_path(path: str) -> str:
+    """實際儲存的檔案路徑（未壓縮優先），都不存在時丟出 FileNotFoundError"""
+    if os.path.exists(path):
+        return path
+    found = find_compressed(path)
+    if found is None:
+        raise FileNotFoundError(path)
+    return found[0]
+
+
+def write_bytes(path: str, data: bytes, codec: Optional[str] = DEFAULT_CODEC) -> Tuple[str, bool]:
+    """
+    原子地寫入壓縮檔
+
+    Args:
+        path: 未壓縮的邏輯路徑（實際寫入 path + 副檔名）
+        data: 內容
+        codec: 編碼，None 為不壓縮
+
+    Returns:
+        (實際寫入的路徑, 是否取代了既有檔案)
+    """
+    target = compressed_path_for(path, codec) if codec else path
+    writer = AtomicWriter(target, "wb")
+    try:
+        writer.write(compress(data, codec) if codec else data)
+    except BaseException:
+        writer.discard()
+        raise
+    return target, writer.commit()
+
+
+def read_bytes(path: str) -> bytes:
+    """讀取檔案內容；未壓縮的檔案不存在時讀取並解壓其壓縮版本"""
+    stored = stored_path(path)
+    with open(stored, "rb") as f:
+        data = f.read()
+    codec = codec_for(stored) if stored != path else None
+    return decompress(data, codec) if codec else data
+
+
+def read_text(path: str, encoding: str = "utf-8") -> str:
+    return read_bytes(path).decode(encoding)
+
+
+# 逐頁分框
+
+def framed_index_path(framed_path: str) -> str:
+    """逐頁壓縮檔的位移索引路徑"""
+    return framed_path + ".idx"
+
+
+def write_framed_pages(pages_path: str, records: Iterable[Dict],
+                       codec: str = DEFAULT_CODEC) -> Tuple[str, int, bool]:
+    """
+    寫入逐頁分框的壓縮 JSONL 與位移索引
+
+    Args:
+        pages_path: 未壓縮的 .pages.jsonl 路徑（實際寫入 pages_path + 副檔名）
+        records: 頁面記錄（可為 generator）
+        codec: 編碼
+
+    Returns:
+        (壓縮檔路徑, 頁數, 是否取代了既有檔案)
+    """
+    framed_path = compressed_path_for(pages_path, codec)
+    offsets = bytearray()
+    count = 0
+    pages_file = AtomicWriter(framed_path, "wb")
+    index_file = AtomicWriter(framed_index_path(framed_path), "wb")
+    try:
+        for record in records:
+            offsets += _OFFSET.pack(pages_file.tell())
+            line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+            pages_file.write(compress(line, codec))
+            count += 1
+        # 最後多記一筆結尾位移，每頁的 frame 長度都可由相鄰位移求得
+        offsets += _OFFSET.pack(pages_file.tell())
+        index_file.write(bytes(offsets))
+    except BaseException:
+        pages_file.discard()
+        index_file.discard()
+        raise
+
+    # 壓縮結果是確定的：內容相同時兩個檔案都不會改寫
+    changed = pages_file.commit()
+    index_file.commit()
+    return framed_path, count, changed
+
+
+def _framed_location(pages_path: str) -> Tuple[str, str]:
+    # 可傳入壓縮檔路徑，或未壓縮的邏輯路徑
+    codec = codec_for(pages_path)
+    if codec:
+        return pages_path, codec
+    found = find_compressed(pages_path)
+    if found is None:
+        raise FileNotFoundError(pages_path)
+    return found
+
+
+def framed_page_count(pages_path: str) -> int:
+    """由索引大小取得頁數"""
+    framed_path, _ = _framed_location(pages_path)
+    return max(0, os.path.getsize(framed_index_path(framed_path)) // _OFFSET.size - 1)
+
+
+def read_framed_page(pages_path: str, page: int) -> Dict:
+    """
+    隨機讀取第 N 頁的記錄，只解壓該頁的 frame
+
+    Args:
+        pages_path: .pages.jsonl 路徑（未壓縮或壓縮檔路徑皆可）
+        page: 頁碼（從 1 開始）
+
+    Raises:
+        IndexError: 頁碼超出範圍
+    """
+    if page < 1:
+        raise IndexError(f"頁碼必須從 1 開始: {page}")
+
+    framed_path, codec = _framed_location(pages_path)
+    with open(framed_index_path(framed_path), "rb") as idx:
+        idx.seek((page - 1) * _OFFSET.size)
+        raw = idx.read(2 * _OFFSET.size)
+    if len(raw) != 2 * _OFFSET.size:
+        raise IndexError(f"頁碼超出範圍: {page}")
+
+    start, end = _OFFSET.unpack_from(raw, 0)[0], _OFFSET.unpack_from(raw, _OFFSET.size)[0]
+    with open(framed_path, "rb") as f:
+        f.seek(start)
+        return json.loads(decompress(f.read(end - start), codec))
+
+
+def iter_framed_pages(pages_path: str) -> Iterator[Dict]:
+    """依序讀取所有頁面記錄（逐 frame 解壓，不需一次載入整份文件）"""
+    framed_path, codec = _framed_location(pages_path)
+    with open(framed_index_path(framed_path), "rb") as idx:
+        raw = idx.read()
+    offsets = [offset for (offset,) in _OFFSET.iter_unpack(raw)]
+    with open(framed_path, "rb") as f:
+        for start, end in zip(offsets, offsets[1:]):
+            f.seek(start)
+            yield json.loads(decompress(f.read(end - start), codec))
+
+
+# 封存
+
+def _iter_plain_pages(pages_path: str) -> Iterator[Dict]:
+    with open(pages_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def archive_document(md_path: str, codec: str = DEFAULT_CODEC, keep_plain: bool = False) -> Dict:
+    """
+    將一份輸出（.md 與 .pages.jsonl / .pages.idx）轉為壓縮封存
+
+    .md 壓縮為單一 frame；.pages.jsonl 逐頁分框並建立位移索引。
+    壓縮檔完整寫入後才刪除未壓縮的檔案（keep_plain 時保留）。
+
+    Returns:
+        統計字典：plain_bytes / stored_bytes / pages
+    """
+    _check_codec(codec)
+    stats = {"plain_bytes": 0, "stored_bytes": 0, "pages": 0}
+    plain_files = []
+
+    if os.path.exists(md_path):
+        with open(md_path, "rb") as f:
+            data = f.read()
+        target, _ = write_bytes(md_path, data, codec)
+        stats["plain_bytes"] += len(data)
+        stats["stored_bytes"] += os.path.getsize(target)
+        plain_files.append(md_path)
+
+    pages_path = pages_path_for(md_path)
+    if os.path.exists(pages_path):
+        framed_path, count, _ = write_framed_pages(pages_path, _iter_plain_pages(pages_path), codec)
+        stats["pages"] = count
+        stats["plain_bytes"] += os.path.getsize(pages_path)
+        stats["stored_bytes"] += os.path.getsize(framed_path) + os.path.getsize(framed_index_path(framed_path))
+        plain_files.append(pages_path)
+        plain_index = index_path_for(pages_path)
+        if os.path.exists(plain_index):
+            stats["plain_bytes"] += os.path.getsize(plain_index)
+            plain_files.append(plain_index)
+
+    if not keep_plain:
+        for path in plain_files:
+            os.remove(path)
+    return stats
+
+
+def archive_directory(output_dir: str, codec: str = DEFAULT_CODEC, keep_plain: bool = False) -> Dict:
+    """
+    封存輸出目錄中所有未壓縮的 .md 輸出
+
+    Returns:
+        統計字典：documents / pages / plain_bytes / stored_bytes
+    """
+    totals = {"documents": 0, "pages": 0, "plain_bytes": 0, "stored_bytes": 0}
+    for filename in sorted(os.listdir(output_dir)):
+        if not filename.endswith(".md"):
+            continue
+        stats = archive_document(os.path.join(output_dir, filename), codec, keep_plain)
+        totals["documents"] += 1
+        for key in ("pages", "plain_bytes", "stored_bytes"):
+            totals[key] += stats[key]
+    return totals
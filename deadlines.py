@@ -0,0 +1,190 @@
+"""
+遠端解析的時限與取消
+
+`parser.get_json_result()` 沒有逾時設定，卡住的 LlamaParse 工作會一直佔用批次 worker
+或 Streamlit session。此模組提供：
+- Deadline：整份文件時限 + 每頁額外時限，並可連結取消旗標與輪詢回呼
+- run_coroutine_with_deadline：在獨立執行緒的 event loop 執行非同步解析，
+  呼叫端定期檢查時限；逾時或取消時中止 asyncio task（停止輪詢並關閉連線）
+- llamaparse_timeout_kwargs：同樣的時限傳給 LlamaParse 伺服器端，讓遠端工作也會被終止
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """解析超過時限"""
+
+
+class ParseCancelled(Exception):
+    """使用者取消解析"""
+
+
+class Deadline:
+    """
+    解析時限
+
+    Args:
+        seconds: 時限秒數，None 表示不限時
+        cancel_event: 設定後即視為取消
+        on_poll: 每次輪詢時呼叫（例如更新 Streamlit 的狀態文字）；
+                 回呼丟出的例外會中止解析並向上傳遞
+    """
+
+    def __init__(self, seconds: Optional[float] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 on_poll: Optional[Callable[["Deadline"], None]] = None):
+        self.seconds = seconds
+        self.cancel_event = cancel_event or threading.Event()
+        self.on_poll = on_poll
+        self.started = time.monotonic()
+
+    @classmethod
+    def for_document(cls, document_seconds: Optional[float], page_seconds: Optional[float] = None,
+                     pages: Optional[int] = None, **kwargs) -> "Deadline":
+        """整份文件時限 + 每頁額外時限 × 頁數"""
+        if document_seconds is None and not page_seconds:
+            return cls(None, **kwargs)
+        total = (document_seconds or 0) + (page_seconds or 0) * (pages or 0)
+        return cls(total, **kwargs)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> Optional[float]:
+        if self.seconds is None:
+            return None
+        return max(0.0, self.seconds - self.elapsed())
+
+    def expired(self) -> bool:
+        return self.seconds is not None and self.elapsed() >= self.seconds
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    def check(self) -> None:
+        """輪詢檢查：取消或逾時時丟出例外"""
+        if self.on_poll:
+            self.on_poll(self)
+        if self.cancel_event.is_set():
+            raise ParseCancelled("解析已取消")
+        if self.expired():
+            raise DeadlineExceeded(f"解析超過時限 {self.seconds:.0f} 秒")
+
+
+def count_pages(file_path: str) -> Optional[int]:
+    """讀取 PDF 頁數（PyMuPDF 只讀 xref，不解析內容）；無法取得時回傳 None"""
+    try:
+        import fitz  # PyMuPDF
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    except Exception:
+        return None
+
+
+def llamaparse_timeout_kwargs(document_seconds: Optional[float],
+                              page_seconds: Optional[float] = None) -> Dict:
+    """LlamaParse 伺服器端工作時限參數（未設定時不傳，以相容舊版 llama_parse）"""
+    kwargs = {}
+    if document_seconds:
+        kwargs["job_timeout_in_seconds"] = document_seconds
+    if page_seconds:
+        kwargs["job_timeout_extra_time_per_page_in_seconds"] = page_seconds
+    return kwargs
+
+
+def run_coroutine_with_deadline(coro_factory: Callable[[], Awaitable[Any]],
+                                deadline: Optional[Deadline],
+                                poll_interval: float = 0.5) -> Any:
+    """
+    在獨立執行緒的 event loop 執行協程，呼叫端執行緒定期檢查時限
+
+    輪詢在呼叫端執行緒進行，因此 Deadline.on_poll 可以安全地呼叫 Streamlit；
+    若回呼因使用者操作而丟出 Streamlit 的中斷例外，同樣會取消遠端工作。
+
+    Args:
+        coro_factory: 產生協程的函數（例如 lambda: parser.aget_json(path)）
+        deadline: 時限，None 表示不限時
+        poll_interval: 輪詢間隔（秒）
+
+    Returns:
+        協程的回傳值
+
+    Raises:
+        DeadlineExceeded: 超過時限
+        ParseCancelled: 使用者取消
+    """
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(coro_factory())
+    outcome: Dict[str, Any] = {}
+
+    def runner() -> None:
+        try:
+            outcome["result"] = loop.run_until_complete(task)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=runner, name="deadline-loop", daemon=True)
+    thread.start()
+
+    try:
+        while thread.is_alive():
+            thread.join(poll_interval)
+            if thread.is_alive() and deadline is not None:
+                deadline.check()
+    except BaseException:
+        # 逾時、取消或 Streamlit 中斷：取消 task，讓 llama_parse 停止輪詢並關閉連線
+        try:
+            loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            pass  # loop 已結束
+        thread.join(timeout=5)
+        raise
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def llamaparse_json(parser, file_path: str, deadline: Optional[Deadline]) -> List[dict]:
+    """
+    以時限執行 LlamaParse 的 JSON 解析（取代阻塞的 get_json_result）
+
+    Args:
+        parser: LlamaParse 實例
+        file_path: PDF 文件路徑
+        deadline: 時限，None 時等同於 get_json_result
+
+    Returns:
+        LlamaParse 的 JSON 結果列表
+    """
+    if deadline is None:
+        return parser.get_json_result(file_path)
+    # 新版為 aget_json，舊版為 aget_json_result
+    aget = getattr(parser, "aget_json", None) or getattr(parser, "aget_json_result")
+    return run_coroutine_with_deadline(lambda: aget(file_path), deadline)
+
+
+def wait_future(future: Future, deadline: Optional[Deadline], poll_interval: float = 0.5) -> Any:
+    """
+    等待 concurrent.futures 的結果並檢查時限（例如本地 process pool 的轉換）
+
+    逾時或取消時會取消尚未開始的任務；已在 worker 中執行的文件會在背景完成後丟棄。
+    """
+    while True:
+        try:
+            return future.result(timeout=poll_interval)
+        except FutureTimeoutError:
+            if deadline is None:
+                continue
+            try:
+                deadline.check()
+            except BaseException:
+                future.cancel()
+                raise
@@ -0,0 +1,240 @@
+"""
+批次處理的時間與額度預估（--dry-run）
+
+在實際執行前估計整批需要多久、會用掉多少 LlamaParse 額度：
+- 頁數只讀取 xref / 頁面樹；頁面分類只讀取每頁的資源字典（字型、圖片），不解析內容串流
+- 大型文件只抽樣部分頁面分類，再依比例推估
+- 指定頁面範圍（--pages）時只計入、只分類選取的頁面
+- 依解析引擎與大小限制套用與實際批次相同的路由
+- 每頁耗時取自輸出目錄中既有的 .pages.jsonl（歷史實測），沒有紀錄時使用預設值
+
+數千份文件的預估只需數秒。
+"""
+
+import json
+import os
+import statistics
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from page_ranges import parse_page_ranges
+from page_store import PAGES_SUFFIX
+from pdf_optimizer import DEFAULT_UPLOAD_MBPS, upload_seconds
+from progress import DEFAULT_SECONDS_PER_PAGE, format_duration
+from scheduler import count_pdf_pages
+
+# 每頁 LlamaParse 額度（多模態模型），實際計價以 LlamaCloud 帳單為準
+DEFAULT_CREDITS_PER_PAGE = 45
+
+# 每份文件最多分類的頁數（均勻抽樣）
+SAMPLE_PAGES = 24
+
+# 單張圖片超過此像素數視為圖表頁（約 700×700）
+FIGURE_PIXELS = 500_000
+
+PAGE_CLASSES = ("text", "scanned", "figure", "blank")
+
+
+def _classify_page(doc, pno: int) -> str:
+    fonts = doc.get_page_fonts(pno)
+    images = doc.get_page_images(pno)
+    largest = max((width * height for _, _, width, height, *_ in images), default=0)
+    if not fonts:
+        return "scanned" if images else "blank"
+    if largest >= FIGURE_PIXELS:
+        return "figure"
+    return "text"
+
+
+def classify_document(file_path: str, sample_pages: int = SAMPLE_PAGES,
+                      page_ranges: Optional[str] = None) -> Dict:
+    """
+    快速分類文件頁面
+
+    Args:
+        file_path: PDF 路徑
+        sample_pages: 最多分類的頁數
+        page_ranges: 頁面範圍（例如 "1-3,12-"），只計入選取的頁面
+
+    Returns:
+        path / pages（選取的頁數）/ total_pages / size_bytes / classes（各類頁數，抽樣時為推估值）/ sampled
+    """
+    size_bytes = os.path.getsize(file_path)
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        total = count_pdf_pages(file_path) or 0
+        try:
+            pages = len(parse_page_ranges(page_ranges, total) or range(total))
+        except ValueError as e:
+            return {"path": file_path, "pages": 0, "total_pages": total, "size_bytes": size_bytes,
+                    "classes": {}, "sampled": 0, "error": str(e)}
+        return {"path": file_path, "pages": pages, "total_pages": total, "size_bytes": size_bytes,
+                "classes": {"text": pages}, "sampled": 0}
+
+    try:
+        with fitz.open(file_path) as doc:
+            total = doc.page_count
+            selected = parse_page_ranges(page_ranges, total)
+            indices = [page - 1 for page in selected] if selected else list(range(total))
+            pages = len(indices)
+            if pages <= sample_pages:
+                sample = indices
+            else:
+                step = pages / sample_pages
+                sample = [indices[int(i * step)] for i in range(sample_pages)]
+            counts = Counter(_classify_page(doc, pno) for pno in sample)
+    except Exception as e:
+        return {"path": file_path, "pages": 0, "size_bytes": size_bytes, "classes": {},
+                "sampled": 0, "error": str(e)}
+
+    # 依抽樣比例推估各類頁數，餘數分給最多的類別
+    scale = pages / len(sample) if sample else 0
+    classes = {name: int(count * scale) for name, count in counts.items()}
+    if counts:
+        classes[counts.most_common(1)[0][0]] += pages - sum(classes.values())
+    return {"path": file_path, "pages": pages, "total_pages": total, "size_bytes": size_bytes,
+            "classes": classes, "sampled": len(sample)}
+
+
+def historical_rates(output_dir: Optional[str]) -> Dict[str, float]:
+    """
+    由既有輸出的逐頁記錄取得各引擎每頁耗時的中位數
+
+    只讀取每個 .pages.jsonl 的第一行（耗時為整份文件的平均分攤）；
+    混合解析的文件各頁引擎不同，不納入。
+    """
+    samples: Dict[str, List[float]] = {}
+    if not output_dir or not os.path.isdir(output_dir):
+        return {}
+    for name in os.listdir(output_dir):
+        if not name.endswith(PAGES_SUFFIX):
+            continue
+        try:
+            with open(os.path.join(output_dir, name), "r", encoding="utf-8") as f:
+                record = json.loads(f.readline())
+        except (OSError, ValueError):
+            continue
+        if "quality" in record or not record.get("timing"):
+            continue
+        samples.setdefault(record["engine"], []).append(record["timing"]["page_seconds"])
+    return {engine: statistics.median(values) for engine, values in samples.items() if values}
+
+
+def route_document(document: Dict, engine: str, limits: Optional[Dict] = None) -> Dict[str, int]:
+    """
+    套用批次處理的路由，回傳各引擎處理的頁數（skipped 為拒絕處理）
+
+    - llamaparse：整份送 LlamaParse
+    - markitdown：MarkItDown；超過大小限制時依 oversize 改走 PyMuPDF 或拒絕
+    - hybrid：掃描頁與空白頁在本地評分不足，送 LlamaParse；其餘留在 MarkItDown
+    """
+    limits = limits or {}
+    pages = document["pages"]
+    classes = document["classes"]
+
+    if engine == "llamaparse":
+        return {"LlamaParse": pages}
+    if engine == "hybrid":
+        remote = classes.get("scanned", 0) + classes.get("blank", 0)
+        return {"MarkItDown": pages - remote, "LlamaParse": remote}
+
+    oversize = (
+        (limits.get("max_file_mb") and document["size_bytes"] / (1024 * 1024) > limits["max_file_mb"])
+        or (limits.get("max_pages") and document.get("total_pages", pages) > limits["max_pages"])
+    )
+    if oversize:
+        if limits.get("oversize") == "stream":
+            return {"PyMuPDF": pages}
+        return {"skipped": pages}
+    return {"MarkItDown": pages}
+
+
+def estimate_batch(file_paths: Iterable[str], engine: str = "llamaparse", workers: Optional[int] = None,
+                   limits: Optional[Dict] = None, output_dir: Optional[str] = None,
+                   credits_per_page: float = DEFAULT_CREDITS_PER_PAGE,
+                   upload_mbps: float = DEFAULT_UPLOAD_MBPS, page_ranges: Optional[str] = None) -> Dict:
+    """
+    預估整批的處理時間與額度
+
+    Args:
+        file_paths: PDF 路徑
+        engine: llamaparse / markitdown / hybrid（與 --engine 相同）
+        workers: 並行數；本地引擎預設為 CPU 核心數，遠端預設為 1（序列處理）
+        limits: 大小限制（max_file_mb / max_pages / oversize）
+        output_dir: 既有輸出目錄，用於取得歷史每頁耗時
+        credits_per_page: 每頁 LlamaParse 額度
+        upload_mbps: 估計上傳時間用的頻寬
+        page_ranges: 頁面範圍（與 --pages 相同），只計入選取的頁面；上傳仍為整份文件
+
+    Returns:
+        預估結果字典
+    """
+    start_time = time.time()
+    rates = {**DEFAULT_SECONDS_PER_PAGE, **historical_rates(output_dir)}
+
+    documents = 0
+    classes: Counter = Counter()
+    routed: Counter = Counter()
+    upload_bytes = 0
+    errors = []
+    for file_path in file_paths:
+        document = classify_document(file_path, page_ranges=page_ranges)
+        documents += 1
+        if document.get("error"):
+            errors.append(f"{file_path}: {document['error']}")
+            continue
+        classes.update(document["classes"])
+        route = route_document(document, engine, limits)
+        routed.update(route)
+        if route.get("LlamaParse"):
+            upload_bytes += document["size_bytes"]
+
+    local_workers = workers or os.cpu_count() or 1
+    remote_workers = workers or 1
+    engine_seconds = {name: routed[name] * rates.get(name, 0.0) for name in routed if name != "skipped"}
+    remote_seconds = engine_seconds.get("LlamaParse", 0.0) + upload_seconds(upload_bytes, upload_mbps)
+    local_seconds = sum(seconds for name, seconds in engine_seconds.items() if name != "LlamaParse")
+    if engine == "hybrid":
+        # 本地與遠端在同一個 worker 內依序執行
+        wall_seconds = (local_seconds + remote_seconds) / remote_workers
+    else:
+        wall_seconds = local_seconds / local_workers + remote_seconds / remote_workers
+
+    return {
+        "documents": documents,
+        "pages": sum(classes.values()),
+        "classes": dict(classes),
+        "routed_pages": dict(routed),
+        "seconds_per_page": {name: rates.get(name) for name in routed if name != "skipped"},
+        "historical": sorted(historical_rates(output_dir)),
+        "engine_seconds": engine_seconds,
+        "upload_seconds": upload_seconds(upload_bytes, upload_mbps),
+        "wall_seconds": wall_seconds,
+        "credits": routed.get("LlamaParse", 0) * credits_per_page,
+        "errors": errors,
+        "estimate_seconds": time.time() - start_time,
+    }
+
+
+def format_estimate(estimate: Dict) -> str:
+    """多行的預估摘要"""
+    classes = estimate["classes"]
+    lines = [
+        f"Documents: {estimate['documents']}   Pages: {estimate['pages']}",
+        "Page types: " + ", ".join(f"{name} {classes.get(name, 0)}" for name in PAGE_CLASSES),
+        "Routing:    " + ", ".join(f"{name} {pages} pages" for name, pages in estimate["routed_pages"].items()),
+    ]
+    for name, seconds in estimate["engine_seconds"].items():
+        rate = estimate["seconds_per_page"][name]
+        source = "history" if name in estimate["historical"] else "default"
+        lines.append(f"  {name}: {rate:.2f} s/page ({source}) -> {format_duration(seconds)} of work")
+    if estimate["upload_seconds"]:
+        lines.append(f"  upload: {format_duration(estimate['upload_seconds'])}")
+    lines.append(f"Estimated wall time: {format_duration(estimate['wall_seconds'])}")
+    lines.append(f"Estimated LlamaParse credits: {estimate['credits']:,.0f}")
+    for error in estimate["errors"]:
+        lines.append(f"  unreadable: {error}")
+    lines.append(f"(estimate took {estimate['estimate_seconds']:.2f}s)")
+    return "\n".join(lines)
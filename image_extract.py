@@ -0,0 +1,177 @@
+"""
+內嵌圖片擷取（與文字解析同時進行）
+
+解析指令要求模型描述每張圖，但圖片本身從未保留在輸出中。此模組以 PyMuPDF 擷取 PDF 內嵌圖片：
+- 同一 xref 在多頁重複出現時只擷取一次；內容再以 SHA-256 去重（期刊 logo、重複的圖示），
+  相同內容在 assets 目錄只寫入一次，檔名即內容雜湊，跨文件共用
+- PyMuPDF 不支援多執行緒同時操作，讀取集中在單一擷取執行緒；雜湊與寫檔（釋放 GIL）交給執行緒池
+- start_extraction() 在背景執行，呼叫端同時進行 LlamaParse / MarkItDown 解析，寫檔前才等待結果
+
+Markdown 中的圖片連結附在對應頁面的結尾，依圖片在頁面上的垂直位置排序。
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from atomic_io import AtomicWriter
+
+# 輸出目錄下的圖片子目錄（Markdown 以相對路徑連結）
+ASSETS_DIRNAME = "assets"
+# 寬或高小於此值的圖片（分隔線、間隔圖）不擷取
+MIN_IMAGE_PX = 32
+# 雜湊與寫檔的執行緒數
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+# 所有 PyMuPDF 讀取都在這一個執行緒進行
+_extractor: Optional[ThreadPoolExecutor] = None
+_extractor_lock = threading.Lock()
+# 正在寫入的圖片，避免同一內容並行寫入兩次
+_claimed = set()
+_claimed_lock = threading.Lock()
+
+
+def assets_dir_for(output_dir: str) -> str:
+    """輸出目錄對應的圖片目錄"""
+    return os.path.join(output_dir, ASSETS_DIRNAME)
+
+
+def _store(assets_dir: str, data: bytes, ext: str) -> Dict:
+    # 以內容雜湊命名；已存在時不重寫（內容必然相同）
+    digest = hashlib.sha256(data).hexdigest()
+    name = f"{digest[:24]}.{ext}"
+    path = os.path.join(assets_dir, name)
+    with _claimed_lock:
+        if path in _claimed or os.path.exists(path):
+            return {"file": name, "sha256": digest, "written": False}
+        _claimed.add(path)
+    try:
+        with AtomicWriter(path) as f:
+            f.write(data)
+    finally:
+        with _claimed_lock:
+            _claimed.discard(path)
+    return {"file": name, "sha256": digest, "written": True}
+
+
+def _page_images(page, min_px: int) -> List[Dict]:
+    # 頁面上的圖片 xref 與位置（由上而下）
+    images = []
+    for info in page.get_images(full=True):
+        xref, width, height = info[0], info[2], info[3]
+        if width < min_px or height < min_px:
+            continue
+        rects = page.get_image_rects(xref)
+        top = min((rect.y0 for rect in rects), default=0.0)
+        images.append({"xref": xref, "top": top, "width": width, "height": height})
+    images.sort(key=lambda image: image["top"])
+    return images
+
+
+def extract_images(pdf_path: str, assets_dir: str, workers: Optional[int] = None,
+                   min_px: int = MIN_IMAGE_PX) -> Dict:
+    """
+    擷取 PDF 的內嵌圖片並寫入 assets_dir（依內容去重）
+
+    Args:
+        pdf_path: PDF 路徑
+        assets_dir: 圖片目錄（可跨文件共用）
+        workers: 雜湊與寫檔的執行緒數
+        min_px: 寬或高小於此值的圖片略過
+
+    Returns:
+        擷取結果字典：pages（頁碼（從 1 開始）-> 圖片列表，每張含 file / sha256 / width / height）、
+        page_count、images（出現次數）、unique（不同內容數）、written（本次新寫入數）、seconds
+    """
+    import fitz  # PyMuPDF
+
+    start_time = time.time()
+    os.makedirs(assets_dir, exist_ok=True)
+    placements: Dict[int, List[Dict]] = {}
+    stored: Dict[int, Future] = {}
+
+    with ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS) as pool:
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+            for index in range(page_count):
+                images = _page_images(doc[index], min_px)
+                if images:
+                    placements[index + 1] = images
+                for image in images:
+                    xref = image["xref"]
+                    if xref in stored:
+                        continue
+                    # 讀取在本執行緒，雜湊與寫檔交給執行緒池
+                    extracted = doc.extract_image(xref)
+                    if not extracted or not extracted.get("image"):
+                        continue
+                    stored[xref] = pool.submit(_store, assets_dir, extracted["image"], extracted["ext"])
+
+        files = {xref: future.result() for xref, future in stored.items()}
+
+    pages: Dict[int, List[Dict]] = {}
+    for number, images in placements.items():
+        entries = [{"file": files[image["xref"]]["file"], "sha256": files[image["xref"]]["sha256"],
+                    "width": image["width"], "height": image["height"]}
+                   for image in images if image["xref"] in files]
+        if entries:
+            pages[number] = entries
+
+    return {
+        "pages": pages,
+        "page_count": page_count,
+        "images": sum(len(entries) for entries in pages.values()),
+        "unique": len({entry["sha256"] for entry in files.values()}),
+        "written": sum(entry["written"] for entry in files.values()),
+        "seconds": time.time() - start_time,
+    }
+
+
+def start_extraction(pdf_path: str, output_dir: str, workers: Optional[int] = None) -> Future:
+    """
+    在背景開始擷取圖片，回傳 Future（結果為 extract_images 的結果字典）
+
+    擷取在單一背景執行緒依序進行（PyMuPDF 讀取不可並行），呼叫端同時進行文字解析。
+    """
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-extract")
+        return _extractor.submit(extract_images, pdf_path, assets_dir_for(output_dir), workers)
+
+
+def image_markdown(entries: List[Dict], page_number: int) -> str:
+    """單頁圖片的 Markdown 連結"""
+    return "\n\n".join(f"![Page {page_number} image {i}]({ASSETS_DIRNAME}/{entry['file']})"
+                       for i, entry in enumerate(entries, start=1))
+
+
+def attach_images(pages: Iterable[str], extraction: Dict, page_total: int,
+                  page_numbers: Optional[Sequence[int]] = None) -> Iterator[str]:
+    """
+    在頁面結尾附上該頁圖片的連結
+
+    輸出頁數與 PDF 頁數不同時（本地解析未分頁），所有圖片依頁序附在最後一頁。
+
+    Args:
+        pages: 逐頁 Markdown（可為串流）
+        extraction: extract_images 的結果
+        page_total: 輸出的頁數
+        page_numbers: 各輸出頁的原始頁碼（只解析部分頁面時），None 為依序從 1 開始
+    """
+    page_images = extraction["pages"]
+    if page_numbers is not None:
+        # 只解析了部分頁面：未選取頁面的圖片不附加
+        page_images = {number: page_images[number] for number in page_numbers if number in page_images}
+    aligned = page_numbers is not None or page_total == extraction["page_count"]
+    for index, md in enumerate(pages):
+        if aligned:
+            number = page_numbers[index] if page_numbers is not None else index + 1
+            numbers = [number] if number in page_images else []
+        else:
+            numbers = sorted(page_images) if index == page_total - 1 else []
+        links = [image_markdown(page_images[number], number) for number in numbers]
+        yield "\n\n".join([md, *links]) if links else md
@@ -0,0 +1,431 @@
+"""
+本地轉換的 process pool 與記憶體防護
+
+MarkItDown（pdfminer）是 CPU 密集的純 Python 程式，在單一 process 內只能使用一個核心。
+此模組提供多 process 的轉換後端：
+- 每個 worker process 啟動時建立一個 MarkItDown 實例並重複使用（warm instance）
+- 任務只傳遞檔案路徑，由 worker 自行讀檔，不在 process 間傳送 PDF bytes
+- 使用 spawn 啟動 worker，不會複製 Streamlit 主程式的執行緒與狀態
+
+長時間批次處理時，PyMuPDF / pdfminer / llama_index 的 RSS 會持續成長，因此：
+- 每份文件回報 worker 的 RSS 與該文件期間的峰值記憶體
+- 每個 worker 處理 N 份文件後由新的 process 取代（max_tasks_per_child，只影響該 worker）
+- 任一 worker 的 RSS 超過門檻時，整批 worker 會被替換（recycle）
+- worker 異常結束（例如被 OOM killer 終止）會讓整個 executor 失效，此時以新的 executor 接手，
+  在途的文件重新送出一次，其餘文件照常處理
+- 過大的文件可拒絕處理，或改走 PyMuPDF 逐頁的串流路徑
+
+指定頁面範圍時，MarkItDown 轉換只含選取頁面的暫存 PDF，結果的 page_numbers 為原始頁碼。
+
+頁面邊界以 PDF 為準：MarkItDown 只在純文字文件（pdfminer）輸出換頁字元，含表格的文件（pdfplumber）頁面之間沒有分隔，
+因此多頁 PDF 一律逐頁複製成單頁 PDF 後分別轉換，結果的頁數一定與 PDF 相同；
+純文字文件逐頁轉換的內容與整份轉換相同，總耗時也相當，不需要先整份轉換再判斷。
+"""
+
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from deadlines import count_pages, wait_future
+from page_ranges import subset_pdf
+from page_store import split_markitdown_pages
+
+# worker process 內的 MarkItDown 實例
+_markitdown = None
+
+
+def _init_worker() -> None:
+    """worker 啟動時預先建立 MarkItDown（載入轉換器的成本只付一次）"""
+    global _markitdown
+    from markitdown import MarkItDown
+    _markitdown = MarkItDown()
+
+
+def _read_proc_status(field: str) -> Optional[int]:
+    """讀取 /proc/self/status 中的記憶體欄位（kB），非 Linux 回傳 None"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_memory() -> bool:
+    """重設本 process 的峰值 RSS（Linux clear_refs），讓峰值可以逐文件量測"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def memory_snapshot() -> Dict:
+    """
+    目前 process 的記憶體使用量
+
+    Returns:
+        rss_mb / peak_mb（無 /proc 時以 getrusage 的終身峰值代替）
+    """
+    rss_kb = _read_proc_status("VmRSS")
+    peak_kb = _read_proc_status("VmHWM")
+    if peak_kb is None:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以 bytes 回報，Linux 以 kB 回報
+        peak_kb = peak // 1024 if sys.platform == "darwin" else peak
+    return {
+        "rss_mb": round((rss_kb if rss_kb is not None else peak_kb) / 1024, 1),
+        "peak_mb": round(peak_kb / 1024, 1),
+    }
+
+
+def _tracked_call(task: Callable[..., Dict], *args) -> Dict:
+    """在 worker 內執行任務，並附上該文件的記憶體使用資訊"""
+    per_document = reset_peak_memory()
+    result = task(*args)
+    if isinstance(result, dict):
+        result["memory"] = {**memory_snapshot(), "peak_is_per_document": per_document,
+                            "pid": os.getpid()}
+    return result
+
+
+def convert_file(file_path: str, pages: Optional[Sequence[int]] = None) -> Dict:
+    """
+    使用 MarkItDown 轉換單一 PDF（在 worker process 內執行，也可直接在本 process 呼叫）
+
+    Args:
+        file_path: PDF 文件路徑
+        pages: 只轉換這些頁面（從 1 開始），None 為整份文件
+
+    Returns:
+        解析結果字典（格式與 parse_with_markitdown 相同）
+    """
+    if pages:
+        try:
+            with subset_pdf(file_path, pages) as subset_path:
+                result = convert_file(subset_path)
+        except Exception as e:
+            return {"success": False, "error": f"擷取頁面失敗: {str(e)}", "method": "MarkItDown"}
+        # 切頁結果與選取頁數不符時無法對應原始頁碼
+        if result["success"] and result["pages"] == len(pages):
+            result["page_numbers"] = list(pages)
+        return result
+
+    if _markitdown is None:
+        _init_worker()
+
+    start_time = time.time()
+    try:
+        page_total = count_pages(file_path)
+        if page_total and page_total > 1:
+            page_contents = _convert_pages(file_path)
+            content = "\n\n".join(page_contents)
+        else:
+            with open(file_path, "rb") as f:
+                result = _markitdown.convert_stream(f, file_path=file_path)
+            content = result.text_content if result and result.text_content else ""
+            page_contents = split_markitdown_pages(content)
+
+        if content.strip():
+            return {
+                "success": True,
+                "content": content,
+                "page_contents": page_contents,
+                "pages": len(page_contents),
+                "method": "MarkItDown",
+                # MarkItDown 的 PDF 轉換不提供標題
+                "title": None,
+                "seconds": time.time() - start_time
+            }
+        else:
+            return {
+                "success": False,
+                "error": "MarkItDown 無法提取內容",
+                "method": "MarkItDown"
+            }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"MarkItDown 錯誤: {str(e)}",
+            "method": "MarkItDown"
+        }
+
+
+def _convert_pages(file_path: str) -> List[str]:
+    """逐頁以 MarkItDown 轉換（每頁以 PyMuPDF 複製為單頁 PDF，只在記憶體中）"""
+    import fitz  # PyMuPDF
+
+    page_contents = []
+    with fitz.open(file_path) as doc:
+        for i in range(doc.page_count):
+            with fitz.open() as single:
+                single.insert_pdf(doc, from_page=i, to_page=i)
+                data = single.tobytes()
+            result = _markitdown.convert_stream(io.BytesIO(data), file_extension=".pdf")
+            # 無法擷取文字的頁面（例如掃描頁）保留為空白頁
+            text = result.text_content if result and result.text_content else ""
+            page_contents.append(text.replace("\f", "").strip("\n"))
+    return page_contents
+
+
+def convert_file_streaming(file_path: str, pages: Optional[Sequence[int]] = None) -> Dict:
+    """
+    大型文件的串流路徑：以 PyMuPDF 逐頁擷取文字，一次只載入一頁
+
+    pdfminer 會為整份文件建立版面物件，大型文件的峰值記憶體與頁數成正比；
+    此路徑的峰值只與單頁大小有關，但只保留純文字（不含表格結構）。
+
+    Args:
+        file_path: PDF 文件路徑
+        pages: 只擷取這些頁面（從 1 開始），None 為整份文件
+
+    Returns:
+        解析結果字典
+    """
+    start_time = time.time()
+    try:
+        import fitz  # PyMuPDF
+
+        page_contents = []
+        with fitz.open(file_path) as doc:
+            numbers: List[int] = list(pages) if pages else list(range(1, doc.page_count + 1))
+            for number in numbers:
+                page_contents.append(doc[number - 1].get_text("text").strip("\n"))
+
+        return {
+            "success": True,
+            "content": "\n\n".join(page_contents),
+            "page_contents": page_contents,
+            "pages": len(page_contents),
+            "page_numbers": numbers if pages else None,
+            "method": "PyMuPDF",
+            "seconds": time.time() - start_time
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"PyMuPDF 錯誤: {str(e)}",
+            "method": "PyMuPDF"
+        }
+
+
+def check_document_size(file_path: str, max_file_mb: Optional[float] = None,
+                        max_pages: Optional[int] = None) -> Optional[str]:
+    """
+    檢查文件是否超過大小限制（頁數只讀取 xref，不解析內容）
+
+    Returns:
+        超過限制時回傳原因，否則為 None
+    """
+    if max_file_mb:
+        size_mb = os.path.getsize(file_path) / (1024 * 1024)
+        if size_mb > max_file_mb:
+            return f"檔案 {size_mb:.1f} MB 超過上限 {max_file_mb} MB"
+
+    if max_pages:
+        try:
+            import fitz  # PyMuPDF
+            with fitz.open(file_path) as doc:
+                if doc.page_count > max_pages:
+                    return f"{doc.page_count} 頁超過上限 {max_pages} 頁"
+        except Exception:
+            pass
+
+    return None
+
+
+class LocalConversionPool:
+    """
+    轉換任務的 process pool（預設任務為 MarkItDown 轉換）
+
+    Args:
+        workers: worker 數量，預設為 CPU 核心數
+        task: 在 worker 內執行的函數（需可 pickle，回傳結果字典）
+        initializer: worker 啟動時的初始化函數
+        recycle_after: 每個 worker 處理幾份文件後由新的 process 取代
+        rss_limit_mb: 任一 worker 的 RSS 超過此值時替換整批 worker
+    """
+
+    def __init__(self, workers: Optional[int] = None, task: Callable[..., Dict] = convert_file,
+                 initializer: Optional[Callable[[], None]] = _init_worker,
+                 recycle_after: Optional[int] = None, rss_limit_mb: Optional[float] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.task = task
+        self.initializer = initializer
+        self.recycle_after = recycle_after
+        self.rss_limit_mb = rss_limit_mb
+        self.recycles = 0
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.initializer,
+            max_tasks_per_child=self.recycle_after
+        )
+
+    def _recycle(self, reason: str, only_if_broken: bool = False) -> None:
+        """
+        以新的 worker 接手後續任務；舊 worker 完成手上的文件後結束，釋放累積的記憶體
+
+        Args:
+            reason: 替換原因（輸出到 log）
+            only_if_broken: 只在目前的 executor 已失效時替換（多個任務同時發現失效時只替換一次）
+        """
+        with self._lock:
+            if only_if_broken and not self.is_broken():
+                return
+            old, self._executor = self._executor, self._new_executor()
+            self.recycles += 1
+        old.shutdown(wait=False)
+        print(f"Recycled {self.workers} worker process(es): {reason}")
+
+    def is_broken(self) -> bool:
+        """worker 異常結束後 executor 不再接受任務"""
+        return bool(self._executor._broken)
+
+    def _replace_broken(self) -> None:
+        self._recycle("worker process 異常結束", only_if_broken=True)
+
+    def _after_result(self, result: Dict) -> None:
+        """依 RSS 判斷是否需要替換整批 worker（依文件數的替換由 executor 逐個 worker 進行）"""
+        rss = (result.get("memory") or {}).get("rss_mb") if isinstance(result, dict) else None
+        if self.rss_limit_mb and rss and rss > self.rss_limit_mb:
+            self._recycle(f"worker RSS {rss:.0f} MB > {self.rss_limit_mb} MB")
+
+    def submit(self, *args, task: Optional[Callable[..., Dict]] = None) -> Future:
+        """提交單一任務，回傳 Future（結果為附帶記憶體資訊的結果字典）；executor 已失效時先替換再提交"""
+        try:
+            with self._lock:
+                return self._executor.submit(_tracked_call, task or self.task, *args)
+        except BrokenProcessPool:
+            self._replace_broken()
+            with self._lock:
+                return self._executor.submit(_tracked_call, task or self.task, *args)
+
+    def run(self, *args, deadline=None) -> Dict:
+        """
+        同步執行單一任務（呼叫端執行緒等待，工作在 worker process 執行），並依結果判斷是否替換 worker
+
+        Args:
+            args: 任務參數
+            deadline: deadlines.Deadline（可選），等待期間輪詢時限與取消旗標
+        """
+        try:
+            result = wait_future(self.submit(*args), deadline)
+        except BrokenProcessPool as e:
+            self._replace_broken()
+            return {"success": False, "error": f"worker 異常結束: {str(e)}"}
+        self._after_result(result)
+        return result
+
+    def convert(self, file_path: str, deadline=None, pages: Optional[Sequence[int]] = None) -> Dict:
+        """
+        同步轉換單一檔案（呼叫端執行緒等待，CPU 工作在 worker process 執行）
+
+        Args:
+            file_path: PDF 文件路徑
+            deadline: deadlines.Deadline（可選），等待期間輪詢時限與取消旗標
+            pages: 只轉換這些頁面（從 1 開始），None 為整份文件
+        """
+        return self.run(file_path, pages, deadline=deadline)
+
+    def convert_many(self, jobs: Iterable, task_for: Optional[Callable] = None
+                     ) -> Iterator[Tuple[object, Dict]]:
+        """
+        處理多個任務，依完成順序產生 (任務, 結果)
+
+        同時在途的任務數等於 worker 數，替換 worker 時只影響尚未送出的任務，
+        主 process 也不會一次持有所有結果。worker 異常結束時，當時在途的任務在新的 executor 上
+        逐一重新送出一次：一次只跑一份，再次失敗的就是造成異常的文件，回報錯誤，其他文件不受牽連。
+
+        Args:
+            jobs: 任務參數（單一路徑，或參數 tuple）；可為惰性 iterator，例如 JobScheduler.drain()
+            task_for: 依任務選擇要執行的函數（例如大型文件改走串流路徑），預設為 self.task
+        """
+        pending = iter(jobs)
+        exhausted = False
+        # Future -> (任務, 第幾次送出)
+        in_flight: Dict[Future, Tuple[object, int]] = {}
+        retry: List[object] = []
+
+        def send(job, attempt: int) -> None:
+            args = job if isinstance(job, tuple) else (job,)
+            task = task_for(job) if task_for else None
+            in_flight[self.submit(*args, task=task)] = (job, attempt)
+
+        while not exhausted or in_flight or retry:
+            if retry:
+                # 等在途的任務結束後才單獨重送，確認是哪一份文件造成 worker 異常結束
+                if not in_flight:
+                    send(retry.pop(0), 2)
+            # 任務在有空位時才取用，排程器可依目前執行中的工作決定下一個
+            while not retry and not exhausted and len(in_flight) < self.workers:
+                job = next(pending, None)
+                if job is None:
+                    exhausted = True
+                    break
+                send(job, 1)
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, attempt = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    self._replace_broken()
+                    if attempt == 1:
+                        retry.append(job)
+                        continue
+                    result = {"success": False, "error": f"worker 異常結束: {str(e)}"}
+                except Exception as e:
+                    result = {"success": False, "error": f"worker 錯誤: {str(e)}"}
+                self._after_result(result)
+                yield job, result
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def __enter__(self) -> "LocalConversionPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+
+_shared_pool: Optional[LocalConversionPool] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_pool(workers: Optional[int] = None, recycle_after: Optional[int] = 50,
+                    rss_limit_mb: Optional[float] = 2048) -> LocalConversionPool:
+    """
+    取得 process 層級共用的 pool（供 Streamlit 多個 session 共用 warm worker）
+
+    Args:
+        workers: 第一次建立時的 worker 數量
+        recycle_after: 每個 worker 處理幾份文件後替換
+        rss_limit_mb: worker RSS 上限
+    """
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = LocalConversionPool(workers, recycle_after=recycle_after,
+                                               rss_limit_mb=rss_limit_mb)
+        elif _shared_pool.is_broken():
+            _shared_pool._replace_broken()
+        return _shared_pool
@@ -1,14 +1,45 @@
 from llama_parse import LlamaParse
 from llama_index.core.schema import TextNode
 from typing import List
+import argparse
 import json
 import os
+import shutil
+import time
+from concurrent.futures import wait
 from dotenv import load_dotenv
+from atomic_io import AtomicWriter, file_digest
+from compressed_store import DEFAULT_CODEC, archive_directory, available_codecs
+from bulk_parse import DEFAULT_CONCURRENCY, BulkLlamaParse
+from page_store import iter_page_records, pages_path_for, write_pages
+from page_ranges import check_page_ranges, format_page_ranges, parse_page_ranges
+from postprocess import passes_for, postprocess_pages
+from image_extract import attach_images, start_extraction
+from deadlines import Deadline, DeadlineExceeded, count_pages, llamaparse_json, llamaparse_timeout_kwargs
+from local_pool import LocalConversionPool, check_document_size, convert_file, convert_file_streaming
+from quality import (QUALITY_THRESHOLD, merge_pages, pages_to_escalate, score_pages,
+                     summarize_provenance, target_pages_arg)
+from model_tiers import format_tier_report, llamaparse_json_tiered, plan_document
+from estimator import DEFAULT_CREDITS_PER_PAGE, estimate_batch, format_estimate
+from pdf_optimizer import DEFAULT_UPLOAD_MBPS, append_report, format_report, optimized_upload
+from progress import ProgressTracker, format_status_line
+import tracing
+from scheduler import JobScheduler
+from parse_service import DEFAULT_MAX_QUEUE, DEFAULT_MAX_UPLOAD_MB, DEFAULT_RESULT_TTL, serve
+from work_queue import (DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, enqueue, queue_status,
+                        run_worker)
+from search_index import default_index_path, search, update_index
+from result_cache import cache_key
+from single_flight import SingleFlight
 
 # 載入環境變數
 load_dotenv()
 
-def initialize_parser():
+ENGINE_NAME = "LlamaParse"
+MODEL_NAME = "gemini-2.5-pro"
+HYBRID_ENGINE_NAME = "MarkItDown + LlamaParse"
+
+def initialize_parser(model=MODEL_NAME, **extra_kwargs):
     # 醫療期刊解析指令
     content_guideline = """
     You are parsing a medical journal article. Pay special attention to:
@@ -23,58 +54,798 @@ def initialize_parser():
     return LlamaParse(
         result_type="markdown",
         use_vendor_multimodal_model=True,
-        vendor_multimodal_model_name="gemini-2.5-pro",  # 使用 Gemini 2.5 Pro
+        vendor_multimodal_model_name=model,  # 預設使用 Gemini 2.5 Pro
         content_guideline_instruction=content_guideline,  # 使用新的指令參數
-        invalidate_cache=True
+        invalidate_cache=True,
+        **extra_kwargs
     )
 
-def process_pdf(pdf_path, output_dir):
+def _tee_markdown(pages, f):
+    # 寫入 .md 的同時把頁面交給下一個消費者（逐頁 JSONL）
+    for md in pages:
+        f.write(md)
+        f.write('\n\n')
+        yield md
+
+def _wait_for_images(pdf_path, images):
+    # 等待背景的圖片擷取；失敗只影響圖片連結，不影響文字輸出
     try:
-        # Initialize parser
-        parser = initialize_parser()
-        
-        # Parse PDF
-        print(f"Processing {pdf_path}...")
-        json_objs = parser.get_json_result(pdf_path)
-        
+        extraction = images.result()
+    except Exception as e:
+        print(f"    image extraction failed ({str(e)}) - {os.path.basename(pdf_path)}")
+        return None
+    if extraction["images"]:
+        print(f"    images: {extraction['images']} on {len(extraction['pages'])} pages, "
+              f"{extraction['unique']} unique, {extraction['written']} new ({extraction['seconds']:.1f}s) "
+              f"- {os.path.basename(pdf_path)}")
+    return extraction
+
+def write_outputs(pdf_path, output_dir, page_mds, engine, model, elapsed, postprocess=True, page_meta=None,
+                  images=None, page_numbers=None):
+    # Create output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Save parsed content
+    output_path = os.path.join(output_dir, os.path.basename(pdf_path).replace('.pdf', '.md'))
+    pages = iter(page_mds)
+    if postprocess:
+        # 串流後處理：頁首頁尾、斷字、頁碼行、表格與空白（LLM 產生的頁面不做斷字合併）
+        engines = [meta.get("engine", engine) for meta in page_meta] if page_meta else [engine] * len(page_mds)
+        pages = postprocess_pages(pages, passes_for(engines))
+    # 圖片連結在後處理之後附加（重複的 logo 連結不會被當成頁首移除）
+    extraction = _wait_for_images(pdf_path, images) if images is not None else None
+    if extraction:
+        pages = attach_images(pages, extraction, len(page_mds), page_numbers)
+    if page_numbers:
+        # 只解析部分頁面時，逐頁記錄保留原始頁碼
+        page_meta = [{**(page_meta[i] if page_meta else {}), "page": number}
+                     for i, number in enumerate(page_numbers)]
+
+    # 逐頁 JSONL + 位移索引，供下游直接存取第 N 頁
+    # 全部先寫入暫存檔，內容有改變才原子地取代；.md 最後提交，當機時不會留下截斷的 .md
+    pages_path = pages_path_for(output_path)
+    with tracing.span("write_outputs", engine=engine) as record:
+        with AtomicWriter(output_path, 'w') as f:
+            records = iter_page_records(_tee_markdown(pages, f), engine, model, elapsed, len(page_mds), page_meta)
+            count, pages_changed = write_pages(pages_path, records)
+            md_changed = f.commit()
+        record["attributes"].update(pages=count, bytes=os.path.getsize(output_path),
+                                    changed=md_changed or pages_changed)
+
+    if md_changed or pages_changed:
+        print(f"Saved parsed content to {output_path} ({count} pages indexed in {pages_path})")
+    else:
+        print(f"Unchanged: {output_path} ({count} pages), existing files kept")
+    return output_path
+
+def llamaparse_pages(pdf_path, output_dir, deadline_seconds=None, page_deadline_seconds=None,
+                     optimize=None, target_pages=None, tiered=False):
+    # 以 LlamaParse 解析（可只解析指定頁面），回傳 LlamaParse 的頁面列表；逾時丟出 DeadlineExceeded
+    # tiered 時依頁面複雜度分派模型，各模型的工作同時進行，頁面附上 model / tier / complexity
+    # 時限同時傳給伺服器端，逾時的遠端工作會被終止
+    timeouts = llamaparse_timeout_kwargs(deadline_seconds, page_deadline_seconds)
+
+    pages = len(target_pages) if target_pages else count_pages(pdf_path)
+    deadline = None
+    if deadline_seconds or page_deadline_seconds:
+        deadline = Deadline.for_document(deadline_seconds, page_deadline_seconds, pages)
+
+    with tracing.span("llamaparse", pages=pages,
+                      target_pages=target_pages, tiered=tiered or None) as record:
+        try:
+            # 上傳前最佳化（可選）：上傳較小的副本，原檔不變
+            with optimized_upload(pdf_path, optimize) as (upload_path, report):
+                record["attributes"]["bytes"] = os.path.getsize(upload_path)
+                if report:
+                    print(f"    upload: {format_report(report)} - {os.path.basename(pdf_path)}")
+                    append_report(output_dir, report)
+                if tiered:
+                    return _tiered_pages(pdf_path, upload_path, target_pages, deadline, timeouts)
+                parser = initialize_parser(**timeouts,
+                                           **({"target_pages": target_pages_arg(target_pages)} if target_pages else {}))
+                json_objs = llamaparse_json(parser, upload_path, deadline)
+        except DeadlineExceeded:
+            record["attributes"]["error_type"] = "timeout"
+            raise
+
         if not json_objs or len(json_objs) == 0:
+            record["attributes"]["error_type"] = "empty"
             raise ValueError("No content parsed from PDF")
-            
-        json_list = json_objs[0]["pages"]
-        
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Save parsed content
-        output_path = os.path.join(output_dir, os.path.basename(pdf_path).replace('.pdf', '.md'))
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for page in json_list:
-                f.write(page['md'])
-                f.write('\n\n')
-        
-        print(f"Saved parsed content to {output_path}")
-        
-    except Exception as e:
-        print(f"Error processing {pdf_path}: {str(e)}")
+        return json_objs[0]["pages"]
+
+def _tiered_pages(pdf_path, upload_path, target_pages, deadline, timeouts):
+    # 複雜度特徵從原檔讀取（最佳化後的副本頁碼相同）
+    plan = plan_document(pdf_path, target_pages)
+
+    def make_parser(model, numbers):
+        return initialize_parser(model, target_pages=target_pages_arg(numbers), **timeouts)
+
+    start_time = time.time()
+    result = llamaparse_json_tiered(make_parser, upload_path, plan, deadline)
+    print(f"    tiers: {format_tier_report(result['report'])} - {os.path.basename(pdf_path)}")
+    # 各模型的工作同時開始，補記為 llamaparse 的子 span
+    for model, entry in result["report"]["models"].items():
+        tracing.record_span("llamaparse_tier", start_time, entry["seconds"], model=model, tier=entry["tier"],
+                            pages=entry["pages"])
+    tiers = {entry["page"]: {"tier": entry["tier"], "complexity": entry["complexity"]} for entry in plan}
+    return [{**page, **tiers.get(page["page"], {})} for page in result["pages"]]
+
+def _tier_meta(json_list):
+    # 逐頁記錄實際使用的模型與複雜度
+    return [{"model": page["model"], "tier": {"name": page.get("tier"), "complexity": page.get("complexity")}}
+            for page in json_list]
+
+def _remote_page_numbers(target_pages, json_list):
+    # 結果頁面帶有原始頁碼；沒有或不在要求範圍內時依 target_pages 的順序對應
+    return [page.get("page") if page.get("page") in target_pages else requested
+            for requested, page in zip(target_pages, json_list)]
+
+def _selected_pages(pdf_path, page_ranges):
+    # 依文件頁數解析頁面範圍（未指定時為 None，整份文件）
+    selected = parse_page_ranges(page_ranges, count_pages(pdf_path))
+    if selected:
+        print(f"    pages {format_page_ranges(selected)} ({len(selected)} selected) - {os.path.basename(pdf_path)}")
+    return selected
+
+def _traced_failure(record, e):
+    # 例外已在此處理（回傳 False），在 span 上標記失敗
+    record["status"] = "error"
+    record["attributes"]["error"] = f"{type(e).__name__}: {e}"
+
+def process_pdf(pdf_path, output_dir, postprocess=True, deadline_seconds=None, page_deadline_seconds=None,
+                optimize=None, progress=None, images=None, tiered=False, page_ranges=None):
+    with tracing.span("process_pdf", document=os.path.basename(pdf_path), page_ranges=page_ranges) as record:
+        try:
+            # Parse PDF
+            print(f"Processing {pdf_path}...")
+            start_time = time.time()
+            selected = _selected_pages(pdf_path, page_ranges)
+            try:
+                json_list = llamaparse_pages(pdf_path, output_dir, deadline_seconds, page_deadline_seconds,
+                                             optimize, target_pages=selected, tiered=tiered)
+            except DeadlineExceeded as e:
+                print(f"{e}: {pdf_path}, falling back to local MarkItDown")
+                tracing.mark("fallback", from_engine=ENGINE_NAME, to_engine="MarkItDown", reason="timeout")
+                if progress:
+                    progress.fallback(ENGINE_NAME, "MarkItDown", "timeout", pdf_path)
+                return process_pdf_fallback(pdf_path, output_dir, postprocess, images, page_ranges)
+            elapsed = time.time() - start_time
+
+            write_outputs(pdf_path, output_dir, [page['md'] for page in json_list],
+                          ENGINE_NAME, MODEL_NAME, elapsed, postprocess, images=images,
+                          page_meta=_tier_meta(json_list) if tiered else None,
+                          page_numbers=_remote_page_numbers(selected, json_list) if selected else None)
+            return True
+
+        except Exception as e:
+            print(f"Error processing {pdf_path}: {str(e)}")
+            _traced_failure(record, e)
+            return False
+
+def process_pdf_hybrid(pdf_path, output_dir, postprocess=True, deadline_seconds=None,
+                       page_deadline_seconds=None, optimize=None, quality_threshold=QUALITY_THRESHOLD,
+                       progress=None, images=None, tiered=False, page_ranges=None):
+    # 本地優先：MarkItDown 解析並逐頁評分，只有低於門檻的頁面送 LlamaParse
+    with tracing.span("process_pdf_hybrid", document=os.path.basename(pdf_path),
+                      quality_threshold=quality_threshold, page_ranges=page_ranges) as record:
+        try:
+            print(f"Processing {pdf_path} (local first)...")
+            start_time = time.time()
+            selected = _selected_pages(pdf_path, page_ranges)
+            local = _convert_local(pdf_path, selected)
+            if not local["success"]:
+                print(f"    {local['error']}, sending whole document to LlamaParse")
+                return process_pdf(pdf_path, output_dir, postprocess, deadline_seconds, page_deadline_seconds,
+                                   optimize, progress, images, tiered, page_ranges)
+
+            local_pages = local["page_contents"]
+            scores = score_pages(local_pages)
+            escalate = pages_to_escalate(scores, quality_threshold)
+            record["attributes"].update(pages=len(local_pages), escalated=len(escalate))
+            expected = len(selected) if selected else count_pages(pdf_path)
+            if expected not in (None, len(local_pages)):
+                # 本地切頁與 PDF 頁數不符時無法逐頁對應，整份送遠端
+                print("    local page split does not match the PDF, sending whole document to LlamaParse")
+                return process_pdf(pdf_path, output_dir, postprocess, deadline_seconds, page_deadline_seconds,
+                                   optimize, progress, images, tiered, page_ranges)
+
+            # 本地結果的第 i 頁對應的原始頁碼（只解析部分頁面時不是 i）
+            numbers = selected or list(range(1, len(local_pages) + 1))
+            positions = {number: i + 1 for i, number in enumerate(numbers)}
+            remote_pages = {}
+            remote_models = {}
+            if escalate:
+                target_pages = [numbers[i - 1] for i in escalate]
+                print(f"    escalating {len(escalate)}/{len(local_pages)} low-quality pages: {target_pages}")
+                try:
+                    json_list = llamaparse_pages(pdf_path, output_dir, deadline_seconds, page_deadline_seconds,
+                                                 optimize, target_pages=target_pages, tiered=tiered)
+                    for number, page in zip(_remote_page_numbers(target_pages, json_list), json_list):
+                        remote_pages[positions[number]] = page.get("md", "")
+                        remote_models[positions[number]] = page.get("model", MODEL_NAME)
+                except Exception as e:
+                    print(f"    LlamaParse failed ({str(e)}), keeping local output for those pages")
+                    tracing.mark("fallback", from_engine=ENGINE_NAME, to_engine=local["method"],
+                                 reason="remote error", pages=len(escalate))
+                    if progress:
+                        progress.fallback(ENGINE_NAME, local["method"], "remote error", pdf_path)
+
+            pages, provenance = merge_pages(local_pages, local["method"], scores,
+                                            remote_pages, ENGINE_NAME, MODEL_NAME)
+            for number, model in remote_models.items():
+                provenance[number - 1]["model"] = model
+            elapsed = time.time() - start_time
+            engine = ENGINE_NAME if remote_pages else local["method"]
+            print(f"    provenance: {summarize_provenance(provenance)}")
+            write_outputs(pdf_path, output_dir, pages, engine, MODEL_NAME if remote_pages else None,
+                          elapsed, postprocess, page_meta=provenance, images=images,
+                          page_numbers=selected)
+            return True
+
+        except Exception as e:
+            print(f"Error processing {pdf_path}: {str(e)}")
+            _traced_failure(record, e)
+            return False
+
+def _convert_local(pdf_path, pages=None):
+    # 在本 process 內以 MarkItDown 轉換，記錄為 markitdown span
+    with tracing.span("markitdown") as record:
+        result = convert_file(pdf_path, pages)
+        record["attributes"]["pages"] = result.get("pages")
+        if not result["success"]:
+            record["status"] = "error"
+            record["attributes"]["error"] = result["error"]
+    return result
+
+def process_pdf_fallback(pdf_path, output_dir, postprocess=True, images=None, page_ranges=None):
+    # 備援路徑：在本 process 內以 MarkItDown 轉換
+    with tracing.span("process_pdf_fallback", document=os.path.basename(pdf_path),
+                      page_ranges=page_ranges) as record:
+        try:
+            selected = _selected_pages(pdf_path, page_ranges)
+        except ValueError as e:
+            print(f"Error processing {pdf_path}: {str(e)}")
+            _traced_failure(record, e)
+            return False
+        result = _convert_local(pdf_path, selected)
+        if not result["success"]:
+            print(f"Error processing {pdf_path}: {result['error']}")
+            record["status"] = "error"
+            return False
+        write_outputs(pdf_path, output_dir, result["page_contents"],
+                      result["method"], None, result["seconds"], postprocess, images=images,
+                      page_numbers=result.get("page_numbers"))
+        return True
+
+def _process_pdf_task(pdf_path, output_dir, postprocess=True, deadlines=None, optimize=None,
+                      quality_threshold=None, extract_images=False, tiered=False, page_ranges=None):
+    # 在 worker process 內執行 LlamaParse，讓 llama_index 累積的記憶體隨 worker 回收
+    # 備援事件收集後隨結果傳回主 process
+    deadlines = deadlines or {}
+    progress = ProgressTracker()
+    images = start_extraction(pdf_path, output_dir) if extract_images else None
+    if quality_threshold is not None:
+        success = process_pdf_hybrid(pdf_path, output_dir, postprocess, optimize=optimize,
+                                     quality_threshold=quality_threshold, progress=progress, images=images,
+                                     tiered=tiered, page_ranges=page_ranges, **deadlines)
+    else:
+        success = process_pdf(pdf_path, output_dir, postprocess, optimize=optimize, progress=progress,
+                              images=images, tiered=tiered, page_ranges=page_ranges, **deadlines)
+    return {"success": success, "fallbacks": progress.fallbacks}
+
+def _print_memory(pdf_path, result):
+    memory = result.get("memory")
+    if memory:
+        scope = "document peak" if memory["peak_is_per_document"] else "worker peak"
+        print(f"    memory: {memory['rss_mb']:.0f} MB RSS, {memory['peak_mb']:.0f} MB {scope} "
+              f"(pid {memory['pid']}) - {os.path.basename(pdf_path)}")
+
+def _submit_pending(progress, scheduler, engine):
+    # 批次開始時送出所有待處理文件的頁數，ETA 以整批的頁面吞吐量計算
+    for job in scheduler.pending_jobs():
+        progress.submit(job["pages"], engine, job["path"])
+
+def _document_done(progress, scheduler, pdf_path, engine, result=None):
+    # 重播 worker 內的備援事件，並以實際耗時將該文件的頁面標記為完成
+    for event in (result or {}).get("fallbacks", []):
+        progress.fallback(event["from_engine"], event["to_engine"], event["reason"], event["document"])
+    job = scheduler.finish(pdf_path)
+    progress.complete(job["pages"], engine, pdf_path, job["finished_at"] - job["started_at"])
+
+def _print_status(event):
+    # 批次模式只在文件完成與備援時輸出一行狀態
+    if event["event"] in ("complete", "fallback"):
+        print(format_status_line(event))
+
+def _with_images(jobs, output_dir, extract_images, images):
+    # 送出解析的同時在背景開始擷取圖片（Future 存入 images，寫檔時取用）
+    for pdf_path in jobs:
+        if extract_images:
+            images[pdf_path] = start_extraction(pdf_path, output_dir)
+        yield pdf_path
+
+def process_pdfs_local(scheduler, output_dir, workers=None, postprocess=True, limits=None, progress=None,
+                       extract_images=False, page_ranges=None):
+    # MarkItDown 本地轉換：多個 worker process 平行處理，每個 worker 保有 warm 的 MarkItDown
+    limits = limits or {}
+    routes = {}
+    selections = {}
+    for job in scheduler.pending_jobs():
+        pdf_path = job["path"]
+        try:
+            selections[pdf_path] = _selected_pages(pdf_path, page_ranges)
+        except ValueError as e:
+            print(f"Skipping {pdf_path}: {str(e)}")
+            scheduler.discard(pdf_path)
+            continue
+        reason = check_document_size(pdf_path, limits.get("max_file_mb"), limits.get("max_pages"))
+        if reason is None:
+            routes[pdf_path] = convert_file
+        elif limits.get("oversize") == "stream":
+            print(f"Streaming {pdf_path} page by page: {reason}")
+            routes[pdf_path] = convert_file_streaming
+        else:
+            print(f"Skipping {pdf_path}: {reason}")
+            scheduler.discard(pdf_path)
+
+    with LocalConversionPool(workers, recycle_after=limits.get("recycle_after"),
+                             rss_limit_mb=limits.get("rss_limit_mb")) as pool:
+        print(f"Converting {len(scheduler)} PDFs locally with {pool.workers} worker processes...")
+        _submit_pending(progress, scheduler, "MarkItDown")
+        images = {}
+        jobs = ((pdf_path, selections.get(pdf_path))
+                for pdf_path in _with_images(scheduler.drain(), output_dir, extract_images, images))
+        for (pdf_path, _), result in pool.convert_many(jobs, task_for=lambda job: routes.get(job[0])):
+            _document_done(progress, scheduler, pdf_path, "MarkItDown")
+            _print_memory(pdf_path, result)
+            document_images = images.pop(pdf_path, None)
+            # 轉換在 worker process 完成，依回報的耗時補記
+            seconds = result.get("seconds") or 0.0
+            with tracing.span("process_pdf_local", start=time.time() - seconds,
+                              document=os.path.basename(pdf_path)) as record:
+                tracing.record_span("markitdown", record["start"], seconds, pages=result.get("pages"),
+                                    error=result.get("error"), pid=(result.get("memory") or {}).get("pid"))
+                if not result["success"]:
+                    print(f"Error processing {pdf_path}: {result['error']}")
+                    record["status"] = "error"
+                    continue
+                try:
+                    write_outputs(pdf_path, output_dir, result["page_contents"],
+                                  result["method"], None, result["seconds"], postprocess, images=document_images,
+                                  page_numbers=result.get("page_numbers"))
+                except Exception as e:
+                    print(f"Error processing {pdf_path}: {str(e)}")
+                    _traced_failure(record, e)
+
+def process_pdfs_remote(scheduler, output_dir, workers, postprocess=True, limits=None, deadlines=None,
+                        optimize=None, quality_threshold=None, progress=None, extract_images=False, tiered=False,
+                        page_ranges=None):
+    # LlamaParse 在可回收的 worker process 中執行（網路等待為主，worker 數可大於核心數）
+    limits = limits or {}
+    with LocalConversionPool(workers, task=_process_pdf_task, initializer=None,
+                             recycle_after=limits.get("recycle_after"),
+                             rss_limit_mb=limits.get("rss_limit_mb")) as pool:
+        label = HYBRID_ENGINE_NAME if quality_threshold is not None else ENGINE_NAME
+        _submit_pending(progress, scheduler, label)
+        jobs = scheduler.drain(lambda job: (job["path"], output_dir, postprocess, deadlines, optimize,
+                                            quality_threshold, extract_images, tiered, page_ranges))
+        for job, result in pool.convert_many(jobs):
+            _document_done(progress, scheduler, job[0], label, result)
+            _print_memory(job[0], result)
 
-def batch_process_pdfs(pdf_dir, output_dir):
+def process_pdfs_bulk(scheduler, output_dir, concurrency=DEFAULT_CONCURRENCY, postprocess=True, deadlines=None,
+                      optimize=None, progress=None, extract_images=False):
+    # 單一 event loop 同時追蹤多份文件的 LlamaParse 工作，完成的文件立即在本執行緒寫檔
+    deadlines = deadlines or {}
+    parser = initialize_parser(**llamaparse_timeout_kwargs(deadlines.get("deadline_seconds"),
+                                                          deadlines.get("page_deadline_seconds")))
+    with BulkLlamaParse(parser, concurrency, optimize=optimize, **deadlines) as bulk:
+        print(f"Submitting {len(scheduler)} PDFs to LlamaParse, {bulk.concurrency} jobs in flight...")
+        _submit_pending(progress, scheduler, ENGINE_NAME)
+        images = {}
+        jobs = _with_images(scheduler.drain(), output_dir, extract_images, images)
+        for pdf_path, result in bulk.parse_many(jobs):
+            document_images = images.pop(pdf_path, None)
+            report = result.get("upload")
+            if report:
+                print(f"    upload: {format_report(report)} - {os.path.basename(pdf_path)}")
+                append_report(output_dir, report)
+            # 遠端工作在共用的 event loop 中完成，依回報的耗時補記
+            seconds = result.get("seconds") or 0.0
+            with tracing.span("process_pdf_bulk", start=time.time() - seconds,
+                              document=os.path.basename(pdf_path)) as record:
+                tracing.record_span("llamaparse", record["start"], seconds, error_type=result.get("error_type"),
+                                    pages=len(result.get("pages") or []) or None, job_id=result.get("job_id"))
+                if result["success"]:
+                    try:
+                        write_outputs(pdf_path, output_dir, [page['md'] for page in result["pages"]],
+                                      ENGINE_NAME, MODEL_NAME, result["seconds"], postprocess,
+                                      images=document_images)
+                    except Exception as e:
+                        print(f"Error processing {pdf_path}: {str(e)}")
+                        _traced_failure(record, e)
+                elif result["error_type"] == "timeout":
+                    print(f"{result['error']}: {pdf_path}, falling back to local MarkItDown")
+                    tracing.mark("fallback", from_engine=ENGINE_NAME, to_engine="MarkItDown", reason="timeout")
+                    progress.fallback(ENGINE_NAME, "MarkItDown", "timeout", pdf_path)
+                    process_pdf_fallback(pdf_path, output_dir, postprocess, document_images)
+                else:
+                    print(f"Error processing {pdf_path}: {result['error']}")
+                    record["status"] = "error"
+            _document_done(progress, scheduler, pdf_path, ENGINE_NAME)
+
+def list_pdfs(pdf_dir):
+    return [os.path.join(pdf_dir, filename) for filename in os.listdir(pdf_dir)
+            if filename.endswith('.pdf')]
+
+def batch_process_pdfs(pdf_dir, output_dir, engine="llamaparse", workers=None, postprocess=True,
+                       limits=None, deadlines=None, schedule="sjf", aging_rate=0.0, optimize=None,
+                       quality_threshold=QUALITY_THRESHOLD, bulk=None, extract_images=False, tiered=False,
+                       page_ranges=None):
     if not os.path.exists(pdf_dir):
         print(f"Error: Directory '{pdf_dir}' does not exist")
         return
-        
-    for filename in os.listdir(pdf_dir):
-        if filename.endswith('.pdf'):
-            pdf_path = os.path.join(pdf_dir, filename)
-            process_pdf(pdf_path, output_dir)
+
+    pdf_paths = list_pdfs(pdf_dir)
+
+    # 依頁數與檔案大小排程；並行時保留約四分之一的通道給大型文件
+    lanes = workers or (os.cpu_count() if engine == "markitdown" else 0)
+    if bulk and engine != "llamaparse":
+        # 批次提交只用於整份送 LlamaParse；本地與 hybrid 依 --workers 並行
+        print(f"--bulk only applies to --engine llamaparse; --bulk is ignored for {engine}")
+        bulk = None
+    if tiered and bulk:
+        # 批次提交共用單一 parser（單一模型），分級時改為逐份處理
+        print("Model tiering uses one LlamaParse job per model; --bulk is ignored")
+        bulk = None
+    if page_ranges and bulk:
+        # 批次提交共用單一 parser，無法逐份指定 target_pages
+        print("Page ranges are resolved per document; --bulk is ignored")
+        bulk = None
+    if engine == "llamaparse" and bulk:
+        lanes = bulk
+    scheduler = JobScheduler(schedule, aging_rate=aging_rate,
+                             large_lanes=max(1, lanes // 4) if lanes else 0)
+    # 指定頁面範圍時，排程成本與進度的頁數只計入選取的頁面
+    scheduler.add_paths(pdf_paths, page_ranges)
+
+    # 進度事件：每份文件完成或觸發備援時輸出一行狀態（含每頁耗時與 ETA）
+    progress = ProgressTracker(_print_status)
+    label = HYBRID_ENGINE_NAME if engine == "hybrid" else ENGINE_NAME
+
+    if engine == "markitdown":
+        process_pdfs_local(scheduler, output_dir, workers, postprocess, limits, progress, extract_images,
+                           page_ranges)
+    elif engine == "llamaparse" and bulk:
+        process_pdfs_bulk(scheduler, output_dir, bulk, postprocess, deadlines, optimize, progress, extract_images)
+    elif workers:
+        # hybrid：本地優先，只有低品質頁面送 LlamaParse
+        threshold = quality_threshold if engine == "hybrid" else None
+        process_pdfs_remote(scheduler, output_dir, workers, postprocess, limits, deadlines, optimize, threshold,
+                            progress, extract_images, tiered, page_ranges)
+    else:
+        _submit_pending(progress, scheduler, label)
+        for pdf_path in scheduler.drain():
+            images = start_extraction(pdf_path, output_dir) if extract_images else None
+            if engine == "hybrid":
+                process_pdf_hybrid(pdf_path, output_dir, postprocess, optimize=optimize,
+                                   quality_threshold=quality_threshold, progress=progress, images=images,
+                                   tiered=tiered, page_ranges=page_ranges, **(deadlines or {}))
+            else:
+                process_pdf(pdf_path, output_dir, postprocess, optimize=optimize, progress=progress,
+                            images=images, tiered=tiered, page_ranges=page_ranges, **(deadlines or {}))
+            _document_done(progress, scheduler, pdf_path, label)
+
+    completed = scheduler.completed
+    if completed:
+        mean_wait = sum(job["finished_at"] - job["enqueued_at"] for job in completed) / len(completed)
+        print(f"Processed {len(completed)} PDFs ({schedule}); mean time-to-result {mean_wait:.1f}s")
+
+    # 增量更新全文檢索索引（只重新索引有變動的輸出）
+    if os.path.isdir(output_dir):
+        stats = update_index(default_index_path(output_dir), output_dir)
+        print(f"Search index updated: {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['removed']} removed, {stats['unchanged']} unchanged")
+
+def process_document(pdf_path, output_dir, engine="llamaparse", postprocess=True, deadlines=None, optimize=None,
+                     quality_threshold=QUALITY_THRESHOLD, extract_images=False, tiered=False, page_ranges=None):
+    # 單份文件的完整解析（分散式 worker 與 HTTP 服務共用），輸出寫入 output_dir
+    deadlines = deadlines or {}
+    # 圖片寫入 output_dir 的 assets/，隨其他輸出一起提交
+    images = start_extraction(pdf_path, output_dir) if extract_images else None
+    try:
+        if engine == "markitdown":
+            return process_pdf_fallback(pdf_path, output_dir, postprocess, images, page_ranges)
+        if engine == "hybrid":
+            return process_pdf_hybrid(pdf_path, output_dir, postprocess, optimize=optimize,
+                                      quality_threshold=quality_threshold, images=images, tiered=tiered,
+                                      page_ranges=page_ranges, **deadlines)
+        return process_pdf(pdf_path, output_dir, postprocess, optimize=optimize, images=images, tiered=tiered,
+                           page_ranges=page_ranges, **deadlines)
+    finally:
+        # 解析失敗時也等擷取結束，暫存目錄刪除後不會再有寫入
+        if images is not None:
+            wait([images])
+
+def run_queue_worker(queue_dir, engine="llamaparse", postprocess=True, deadlines=None, optimize=None,
+                     quality_threshold=QUALITY_THRESHOLD, lease_seconds=DEFAULT_LEASE_SECONDS,
+                     max_attempts=DEFAULT_MAX_ATTEMPTS, extract_images=False, tiered=False, page_ranges=None):
+    # 分散式 worker：從共用佇列認領工作，輸出先寫入暫存目錄，確認仍持有租約後才提交
+    def process(pdf_path, staging_dir):
+        return process_document(pdf_path, staging_dir, engine, postprocess, deadlines, optimize,
+                                quality_threshold, extract_images, tiered, page_ranges)
+
+    stats = run_worker(queue_dir, process, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    print(f"Worker finished: {stats['completed']} completed, {stats['failed']} failed, "
+          f"{stats['lost']} lost leases; queue: {queue_status(queue_dir)}")
+
+def _copy_outputs(source_pdf, source_dir, pdf_path, output_dir):
+    # 合併的請求：複製相同文件的輸出，以本次上傳的檔名命名
+    source_stem = os.path.basename(source_pdf)[:-4]
+    stem = os.path.basename(pdf_path)[:-4]
+    for root, _, names in os.walk(source_dir):
+        target_dir = os.path.normpath(os.path.join(output_dir, os.path.relpath(root, source_dir)))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in names:
+            target = stem + name[len(source_stem):] if name.startswith(source_stem + ".") else name
+            shutil.copy2(os.path.join(root, name), os.path.join(target_dir, target))
+
+def _service_task(pdf_path, output_dir, options):
+    # 在 worker process 內解析單份上傳的文件
+    return {"success": process_document(pdf_path, output_dir, **options)}
+
+def serve_parsing(host="127.0.0.1", port=8000, work_dir="parse_service", engine="llamaparse", concurrency=4,
+                  max_queue=DEFAULT_MAX_QUEUE, max_upload_mb=DEFAULT_MAX_UPLOAD_MB, result_ttl=DEFAULT_RESULT_TTL,
+                  postprocess=True, deadlines=None, optimize=None, quality_threshold=QUALITY_THRESHOLD,
+                  extract_images=False, tiered=False, limits=None, page_ranges=None):
+    # HTTP 解析服務：每份上傳的文件在可回收的 worker process 中解析（與批次相同的記憶體防護）
+    limits = limits or {}
+    options = {"engine": engine, "postprocess": postprocess, "deadlines": deadlines, "optimize": optimize,
+               "quality_threshold": quality_threshold, "extract_images": extract_images, "tiered": tiered,
+               "page_ranges": page_ranges}
+    # 同時上傳的相同文件（內容雜湊 + 解析設定）只解析一次
+    inflight = SingleFlight()
+    with LocalConversionPool(concurrency, task=_service_task, initializer=None,
+                             recycle_after=limits.get("recycle_after"),
+                             rss_limit_mb=limits.get("rss_limit_mb")) as pool:
+        def parse(pdf_path, output_dir):
+            result = pool.run(pdf_path, output_dir, options)
+            _print_memory(pdf_path, result)
+            return result["success"]
+
+        def process(pdf_path, output_dir):
+            key = cache_key(file_digest(pdf_path), engine, "", options)
+            # 失敗的結果不共用（可能是暫時性問題），等待中的相同請求各自重試
+            outcome, coalesced = inflight.run(key, lambda publish: {"success": parse(pdf_path, output_dir),
+                                                                    "pdf_path": pdf_path, "output_dir": output_dir},
+                                              shareable=lambda outcome: outcome["success"])
+            if not coalesced:
+                return outcome["success"]
+            try:
+                _copy_outputs(outcome["pdf_path"], outcome["output_dir"], pdf_path, output_dir)
+            except FileNotFoundError:
+                # 相同文件的結果已被刪除（過期或 DELETE），改為自行解析
+                return parse(pdf_path, output_dir)
+            print(f"Coalesced {os.path.basename(pdf_path)} with an identical in-flight upload")
+            return True
+
+        serve(process, host, port, work_dir, concurrency=concurrency, max_queue=max_queue,
+              max_upload_mb=max_upload_mb, result_ttl=result_ttl)
+
+def search_parsed(output_dir, query, limit=20, by_document=False, raw=False):
+    index_path = default_index_path(output_dir)
+    if not os.path.exists(index_path):
+        update_index(index_path, output_dir)
+
+    start_time = time.time()
+    results = search(index_path, query, limit=limit, by_document=by_document, raw=raw)
+    elapsed_ms = (time.time() - start_time) * 1000
+
+    for hit in results:
+        location = f"page {hit['page']}" if hit['page'] else "document"
+        print(f"{hit['path']} ({location})")
+        print(f"    {' '.join(hit['snippet'].split())}")
+    print(f"{len(results)} result(s) in {elapsed_ms:.1f} ms")
+
+def archive_outputs(output_dir, codec=DEFAULT_CODEC, keep_plain=False):
+    start_time = time.time()
+    stats = archive_directory(output_dir, codec=codec, keep_plain=keep_plain)
+    ratio = stats["stored_bytes"] / stats["plain_bytes"] if stats["plain_bytes"] else 0.0
+    print(f"Archived {stats['documents']} document(s), {stats['pages']} page(s) with {codec}: "
+          f"{stats['plain_bytes'] / 1e6:.2f} MB -> {stats['stored_bytes'] / 1e6:.2f} MB "
+          f"({ratio:.1%}) in {time.time() - start_time:.1f}s")
+
+def show_traces(trace_file, trace_id=None, document=None, slowest=5):
+    # 文字瀑布圖：指定 trace / 文件，或列出最慢的幾份文件
+    if not os.path.exists(trace_file):
+        print(f"Trace file not found: {trace_file}")
+        return
+    traces = tracing.group_traces(tracing.load_spans(trace_file))
+    summaries = [tracing.trace_summary(records) for records in traces.values()]
+    if trace_id:
+        selected = [summary for summary in summaries if summary["trace_id"].startswith(trace_id)]
+    elif document:
+        selected = [summary for summary in summaries if document in (summary["document"] or "")]
+    else:
+        selected = sorted(summaries, key=lambda summary: summary["seconds"], reverse=True)[:slowest]
+    for summary in selected:
+        print(tracing.format_waterfall(traces[summary["trace_id"]]))
+        print()
+    print(f"{len(selected)} of {len(summaries)} trace(s) in {trace_file}")
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="醫療期刊 PDF 批次解析")
+    parser.add_argument("--pdf-dir", default="medical_journals", help="PDF 來源目錄")
+    parser.add_argument("--output-dir", default="parsed_journals", help="Markdown 輸出目錄")
+    parser.add_argument("--engine", choices=["llamaparse", "markitdown", "hybrid"], default="llamaparse",
+                        help="解析引擎：LlamaParse（遠端）、MarkItDown（本地），"
+                             "或 hybrid（本地優先，低品質頁面送 LlamaParse）")
+    parser.add_argument("--quality-threshold", type=float, default=QUALITY_THRESHOLD,
+                        help="hybrid 模式下，品質分數低於此值（0–1）的頁面送 LlamaParse")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="本地轉換的 worker process 數量（預設為 CPU 核心數）")
+    parser.add_argument("--bulk", type=int, nargs="?", const=DEFAULT_CONCURRENCY, default=None,
+                        help="llamaparse 引擎：以單一 event loop 同時追蹤 N 份文件的遠端工作"
+                             f"（未指定 N 時為 {DEFAULT_CONCURRENCY}）")
+    parser.add_argument("--no-postprocess", action="store_true", help="不進行後處理")
+    parser.add_argument("--schedule", choices=["sjf", "priority", "fifo"], default="sjf",
+                        help="排程策略：最短工作優先、優先等級或原始順序")
+    parser.add_argument("--aging-rate", type=float, default=0.0,
+                        help="每等待一秒抵銷的成本（頁），避免大型文件餓死")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="每份文件的 LlamaParse 時限（秒），逾時改用 MarkItDown")
+    parser.add_argument("--page-deadline", type=float, default=None,
+                        help="每頁額外增加的時限（秒）")
+    parser.add_argument("--recycle-after", type=int, default=50,
+                        help="每個 worker 處理幾份文件後替換（0 為不替換）")
+    parser.add_argument("--rss-limit-mb", type=float, default=2048,
+                        help="worker RSS 超過此值時替換（0 為不限制）")
+    parser.add_argument("--max-file-mb", type=float, default=None, help="單一 PDF 大小上限")
+    parser.add_argument("--max-pages", type=int, default=None, help="單一 PDF 頁數上限")
+    parser.add_argument("--oversize", choices=["refuse", "stream"], default="stream",
+                        help="超過上限的文件：拒絕處理，或以 PyMuPDF 逐頁串流擷取")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只預估處理時間與 LlamaParse 額度，不實際解析")
+    parser.add_argument("--credits-per-page", type=float, default=DEFAULT_CREDITS_PER_PAGE,
+                        help="預估用的每頁 LlamaParse 額度")
+    parser.add_argument("--optimize-upload", action="store_true",
+                        help="上傳 LlamaParse 前以 PyMuPDF 清除未使用物件並重新壓縮")
+    parser.add_argument("--max-image-dpi", type=int, default=None,
+                        help="上傳前將超過此 DPI 的圖片降採樣（需搭配 --optimize-upload）")
+    parser.add_argument("--upload-mbps", type=float, default=DEFAULT_UPLOAD_MBPS,
+                        help="估計上傳時間用的頻寬（Mbps）")
+    parser.add_argument("--model-tiering", action="store_true",
+                        help="依頁面複雜度（表格、圖表、方程式、掃描）分派 Gemini flash-lite / flash / pro，"
+                             "各模型同時解析")
+    parser.add_argument("--trace", nargs="?", const="", default=None, metavar="FILE",
+                        help="記錄每份文件的解析 span（引擎嘗試、備援、寫檔）到 JSONL，"
+                             "未指定 FILE 時為輸出目錄的 traces.jsonl")
+    parser.add_argument("--extract-images", action="store_true",
+                        help="與解析同時擷取內嵌圖片（依內容去重）到輸出目錄的 assets/，並在 Markdown 中連結")
+    parser.add_argument("--pages", type=check_page_ranges, default=None, metavar="RANGES",
+                        help="只解析這些頁面（從 1 開始），例如 1-3,12-15 或 5-（第 5 頁到最後）；"
+                             "本地引擎轉換只含這些頁面的副本，LlamaParse 以 target_pages 指定")
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    search_parser = subparsers.add_parser("search", help="搜尋已解析的文件")
+    search_parser.add_argument("query", help="查詢關鍵字（多個詞為 AND）")
+    search_parser.add_argument("--limit", type=int, default=20, help="最多回傳筆數")
+    search_parser.add_argument("--documents", action="store_true", help="依文件彙整結果")
+    search_parser.add_argument("--raw", action="store_true", help="使用 FTS5 查詢語法")
+
+    subparsers.add_parser("index", help="增量更新全文檢索索引")
+
+    # 分散式批次處理：協調者加入佇列，各節點執行 worker（只需要共用檔案系統）
+    enqueue_parser = subparsers.add_parser("enqueue", help="將 --pdf-dir 中的 PDF 加入共用佇列")
+    enqueue_parser.add_argument("--queue", required=True, help="共用檔案系統上的佇列目錄")
+    enqueue_parser.add_argument("--requeue-done", action="store_true", help="已完成或失敗的文件重新處理")
+
+    worker_parser = subparsers.add_parser("worker", help="從共用佇列認領並處理文件，佇列清空後結束")
+    worker_parser.add_argument("--queue", required=True, help="共用檔案系統上的佇列目錄")
+    worker_parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                               help="租約長度（秒），worker 每 1/3 租約續約一次")
+    worker_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                               help="每份文件的最大嘗試次數")
+
+    status_parser = subparsers.add_parser("queue-status", help="顯示共用佇列的狀態")
+    status_parser.add_argument("--queue", required=True, help="共用檔案系統上的佇列目錄")
+
+    trace_parser = subparsers.add_parser("trace", help="以瀑布圖檢視解析追蹤（預設列出最慢的文件）")
+    trace_parser.add_argument("--id", help="trace id（可只給開頭）")
+    trace_parser.add_argument("--document", help="只顯示檔名包含此字串的文件")
+    trace_parser.add_argument("--slowest", type=int, default=5, help="未指定 --id / --document 時顯示最慢的 N 份")
+
+    archive_parser = subparsers.add_parser("archive", help="將輸出目錄的 .md / .pages.jsonl 轉為壓縮封存")
+    archive_parser.add_argument("--codec", choices=available_codecs(), default=DEFAULT_CODEC,
+                                help="壓縮格式（zstd 需要 Python 3.14+ 或 zstandard 套件）")
+    archive_parser.add_argument("--keep-plain", action="store_true", help="保留未壓縮的檔案")
+
+    # HTTP 服務：其他系統以 POST /jobs 上傳 PDF，佇列已滿時回傳 429
+    serve_parser = subparsers.add_parser("serve", help="啟動 HTTP 解析服務")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="監聽位址")
+    serve_parser.add_argument("--port", type=int, default=8000, help="監聽埠")
+    serve_parser.add_argument("--work-dir", default="parse_service", help="上傳暫存與結果目錄")
+    serve_parser.add_argument("--concurrency", type=int, default=4, help="同時解析的文件數（worker process 數）")
+    serve_parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                              help="排隊中的文件數上限，超過時回傳 429")
+    serve_parser.add_argument("--max-upload-mb", type=float, default=DEFAULT_MAX_UPLOAD_MB,
+                              help="單一上傳大小上限，超過時回傳 413")
+    serve_parser.add_argument("--result-ttl", type=float, default=DEFAULT_RESULT_TTL,
+                              help="完成的結果保留秒數")
+
+    return parser
 
 if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+
     # Configuration
-    PDF_DIR = "medical_journals"  # Directory containing PDFs
-    OUTPUT_DIR = "parsed_journals"  # Directory to save markdown files
+    PDF_DIR = args.pdf_dir  # Directory containing PDFs
+    OUTPUT_DIR = args.output_dir  # Directory to save markdown files
     
     # Create directories if they don't exist
     os.makedirs(PDF_DIR, exist_ok=True)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    
-    # Process all PDFs in directory
-    batch_process_pdfs(PDF_DIR, OUTPUT_DIR) 
\ No newline at end of file
+
+    # 追蹤輸出：--trace 或 PDF2MD_TRACE_FILE；worker process 透過環境變數寫入同一檔案
+    trace_file = (args.trace or os.path.join(OUTPUT_DIR, "traces.jsonl")) if args.trace is not None \
+        else os.environ.get(tracing.TRACE_FILE_ENV)
+    if trace_file and args.command != "trace":
+        tracing.configure(trace_file)
+
+    if args.command == "search":
+        search_parsed(OUTPUT_DIR, args.query, limit=args.limit, by_document=args.documents, raw=args.raw)
+    elif args.command == "trace":
+        show_traces(trace_file or os.path.join(OUTPUT_DIR, "traces.jsonl"), args.id, args.document, args.slowest)
+    elif args.command == "index":
+        stats = update_index(default_index_path(OUTPUT_DIR), OUTPUT_DIR)
+        print(f"Search index updated: {stats}")
+    elif args.command == "enqueue":
+        added = enqueue(args.queue, list_pdfs(PDF_DIR), OUTPUT_DIR, requeue_done=args.requeue_done)
+        print(f"Enqueued {added} PDFs; queue: {queue_status(args.queue)}")
+    elif args.command == "queue-status":
+        print(f"Queue {args.queue}: {queue_status(args.queue)}")
+    elif args.command == "archive":
+        archive_outputs(OUTPUT_DIR, codec=args.codec, keep_plain=args.keep_plain)
+    else:
+        # Process all PDFs in directory
+        limits = {
+            "recycle_after": args.recycle_after or None,
+            "rss_limit_mb": args.rss_limit_mb or None,
+            "max_file_mb": args.max_file_mb,
+            "max_pages": args.max_pages,
+            "oversize": args.oversize,
+        }
+        deadlines = {
+            "deadline_seconds": args.deadline,
+            "page_deadline_seconds": args.page_deadline,
+        }
+        optimize = None
+        if args.optimize_upload:
+            optimize = {"max_image_dpi": args.max_image_dpi, "upload_mbps": args.upload_mbps}
+        if args.dry_run:
+            bulk_lanes = args.bulk if args.engine == "llamaparse" else None
+            estimate = estimate_batch(list_pdfs(PDF_DIR), engine=args.engine, workers=args.workers or bulk_lanes,
+                                      limits=limits, output_dir=OUTPUT_DIR,
+                                      credits_per_page=args.credits_per_page, upload_mbps=args.upload_mbps,
+                                      page_ranges=args.pages)
+            print(format_estimate(estimate))
+        elif args.command == "serve":
+            serve_parsing(args.host, args.port, args.work_dir, engine=args.engine, concurrency=args.concurrency,
+                          max_queue=args.max_queue, max_upload_mb=args.max_upload_mb, result_ttl=args.result_ttl,
+                          postprocess=not args.no_postprocess, deadlines=deadlines, optimize=optimize,
+                          quality_threshold=args.quality_threshold, extract_images=args.extract_images,
+                          tiered=args.model_tiering, limits=limits, page_ranges=args.pages)
+        elif args.command == "worker":
+            run_queue_worker(args.queue, engine=args.engine, postprocess=not args.no_postprocess,
+                             deadlines=deadlines, optimize=optimize, quality_threshold=args.quality_threshold,
+                             lease_seconds=args.lease_seconds, max_attempts=args.max_attempts,
+                             extract_images=args.extract_images, tiered=args.model_tiering,
+                             page_ranges=args.pages)
+        else:
+            batch_process_pdfs(PDF_DIR, OUTPUT_DIR, engine=args.engine, workers=args.workers,
+                               postprocess=not args.no_postprocess, limits=limits, deadlines=deadlines,
+                               schedule=args.schedule, aging_rate=args.aging_rate, optimize=optimize,
+                               quality_threshold=args.quality_threshold, bulk=args.bulk,
+                               extract_images=args.extract_images, tiered=args.model_tiering,
+                               page_ranges=args.pages)
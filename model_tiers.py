@@ -0,0 +1,267 @@
+"""
+逐頁模型分級（Gemini 各版本）
+
+整份文件使用同一個模型時，純文字頁面也要付出 pro 模型的延遲與額度。
+此模組以 PyMuPDF 讀取每頁的便宜特徵，計算複雜度分數，將每頁分派到能處理它的最便宜模型：
+- 表格：水平格線（含只有上中下三條線的期刊表格）圍出的區域內的字數
+- 圖表：圖片與向量繪圖佔頁面的面積比例
+- 方程式：數學符號與希臘字母的字數
+- 掃描頁：幾乎沒有文字層、整頁為圖片
+
+各模型各自以 target_pages 送出一個 LlamaParse 工作，所有工作同時進行；
+pro 只處理密集的表格與圖表頁，混合文件的總時間約為最慢的一組，而不是整份都用 pro。
+每頁耗時與額度為估計值，實際計價以 LlamaCloud 帳單為準。
+"""
+
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from deadlines import Deadline, run_coroutine_with_deadline
+
+# 由便宜到昂貴；max_complexity 為該模型處理的複雜度上限
+MODEL_TIERS = [
+    {"tier": "lite", "model": "gemini-2.5-flash-lite", "max_complexity": 0.1,
+     "credits_per_page": 10, "seconds_per_page": 1.5},
+    {"tier": "flash", "model": "gemini-2.5-flash", "max_complexity": 0.45,
+     "credits_per_page": 20, "seconds_per_page": 3.0},
+    {"tier": "pro", "model": "gemini-2.5-pro", "max_complexity": 1.0,
+     "credits_per_page": 45, "seconds_per_page": 8.0},
+]
+
+# 各特徵達到此值時該項分數為滿分
+TABLE_WORDS_DENSE = 120
+FIGURE_AREA_DENSE = 0.4
+EQUATION_GLYPHS_DENSE = 30
+# 掃描頁的固定分數（需要辨識，但版面通常單純）
+SCANNED_COMPLEXITY = 0.3
+
+# 水平格線：寬度至少為頁寬的比例、同一表格內相鄰格線的最大間距（pt）
+RULE_MIN_WIDTH = 0.3
+RULE_MAX_GAP = 60
+# 向量圖：非格線的繪圖項目達到此數才視為圖表
+VECTOR_MIN_ITEMS = 20
+
+_MATH_RANGES = (
+    (0x0391, 0x03C9),    # 希臘字母
+    (0x2190, 0x21FF),    # 箭頭
+    (0x2200, 0x22FF),    # 數學運算子
+    (0x27C0, 0x27EF),
+    (0x2980, 0x2AFF),
+    (0x1D400, 0x1D7FF),  # 數學字母數字
+)
+_MATH_CHARS = set("±×÷√∞≈≠≤≥∑∫∂")
+
+
+def _is_math_glyph(ch: str) -> bool:
+    if ch in _MATH_CHARS:
+        return True
+    code = ord(ch)
+    return any(low <= code <= high for low, high in _MATH_RANGES)
+
+
+def _rule_groups(rules: List[tuple]) -> List[tuple]:
+    # 相鄰的水平格線歸為同一個表格，回傳各表格的 (上緣, 下緣)
+    groups = []
+    for y in sorted(rules):
+        if groups and y - groups[-1][1] <= RULE_MAX_GAP:
+            groups[-1][1] = y
+            groups[-1][2] += 1
+        else:
+            groups.append([y, y, 1])
+    return [(top, bottom) for top, bottom, count in groups if count >= 2 and bottom > top]
+
+
+def page_features(page) -> Dict:
+    """
+    單頁的複雜度特徵（不做版面分析，每頁約數毫秒）
+
+    Returns:
+        text_chars / tables / table_words / figure_area / equation_glyphs / scanned
+    """
+    import fitz  # PyMuPDF
+
+    area = abs(page.rect) or 1.0
+    text = page.get_text("text")
+    text_chars = len(text.strip())
+
+    image_area = 0.0
+    for info in page.get_images(full=True):
+        for rect in page.get_image_rects(info[0]):
+            image_area += abs(rect & page.rect)
+
+    rules = []
+    vector_items = 0
+    vector_box = fitz.Rect()
+    for path in page.get_drawings():
+        for item in path["items"]:
+            if item[0] == "l" and abs(item[1].y - item[2].y) < 1:
+                width, y = abs(item[2].x - item[1].x), item[1].y
+            elif item[0] == "re" and item[1].height < 2:
+                width, y = item[1].width, item[1].y0
+            else:
+                vector_items += 1
+                vector_box |= path["rect"]
+                continue
+            if width >= RULE_MIN_WIDTH * page.rect.width:
+                rules.append(y)
+
+    tables = _rule_groups(rules)
+    table_words = 0
+    if tables:
+        for word in page.get_text("words"):
+            middle = (word[1] + word[3]) / 2
+            if any(top <= middle <= bottom for top, bottom in tables):
+                table_words += 1
+
+    vector_area = abs(vector_box & page.rect) if vector_items >= VECTOR_MIN_ITEMS else 0.0
+    scanned = text_chars < 20 and image_area >= 0.5 * area
+    return {
+        "text_chars": text_chars,
+        "tables": len(tables),
+        "table_words": table_words,
+        "figure_area": 0.0 if scanned else round(min(1.0, (image_area + vector_area) / area), 3),
+        "equation_glyphs": sum(1 for ch in text if _is_math_glyph(ch)),
+        "scanned": scanned,
+    }
+
+
+def complexity_score(features: Dict) -> float:
+    """0–1 的複雜度分數：密集表格或大面積圖表各自即達 0.5"""
+    if features["scanned"]:
+        return SCANNED_COMPLEXITY
+    score = (0.5 * min(1.0, features["table_words"] / TABLE_WORDS_DENSE)
+             + 0.5 * min(1.0, features["figure_area"] / FIGURE_AREA_DENSE)
+             + 0.3 * min(1.0, features["equation_glyphs"] / EQUATION_GLYPHS_DENSE))
+    return round(min(1.0, score), 3)
+
+
+def choose_tier(score: float, tiers: Sequence[Dict] = MODEL_TIERS) -> Dict:
+    """能處理此複雜度的最便宜模型"""
+    for tier in tiers:
+        if score <= tier["max_complexity"]:
+            return tier
+    return tiers[-1]
+
+
+def plan_document(pdf_path: str, pages: Optional[Sequence[int]] = None,
+                  tiers: Sequence[Dict] = MODEL_TIERS) -> List[Dict]:
+    """
+    為每頁選擇模型
+
+    Args:
+        pdf_path: PDF 路徑
+        pages: 只規劃這些頁面（從 1 開始），None 為整份文件
+        tiers: 模型分級設定
+
+    Returns:
+        逐頁計畫：page / complexity / features / tier / model
+    """
+    import fitz  # PyMuPDF
+
+    plan = []
+    with fitz.open(pdf_path) as doc:
+        numbers = pages if pages is not None else range(1, doc.page_count + 1)
+        for number in numbers:
+            features = page_features(doc[number - 1])
+            score = complexity_score(features)
+            tier = choose_tier(score, tiers)
+            plan.append({"page": number, "complexity": score, "features": features,
+                         "tier": tier["tier"], "model": tier["model"]})
+    return plan
+
+
+def group_by_model(plan: Sequence[Dict], tiers: Sequence[Dict] = MODEL_TIERS) -> Dict[str, List[int]]:
+    """各模型負責的頁碼（依分級順序）"""
+    groups: Dict[str, List[int]] = {tier["model"]: [] for tier in tiers}
+    for entry in plan:
+        groups.setdefault(entry["model"], []).append(entry["page"])
+    return {model: numbers for model, numbers in groups.items() if numbers}
+
+
+def tier_report(plan: Sequence[Dict], seconds: Optional[Dict[str, float]] = None,
+                tiers: Sequence[Dict] = MODEL_TIERS) -> Dict:
+    """
+    各模型的頁數、耗時與估計額度，並與整份使用最高級模型比較
+
+    Args:
+        plan: plan_document 的結果
+        seconds: 各模型實際的工作耗時；未提供時以每頁估計值計算（預估）
+    """
+    by_model = {tier["model"]: tier for tier in tiers}
+    top = tiers[-1]
+    models = {}
+    for model, numbers in group_by_model(plan, tiers).items():
+        tier = by_model.get(model, top)
+        models[model] = {
+            "tier": tier["tier"],
+            "pages": len(numbers),
+            "credits": len(numbers) * tier["credits_per_page"],
+            "seconds": (seconds or {}).get(model, len(numbers) * tier["seconds_per_page"]),
+        }
+    pages = len(plan)
+    return {
+        "models": models,
+        "credits": sum(entry["credits"] for entry in models.values()),
+        # 各模型的工作同時進行，總時間為最慢的一組
+        "seconds": max((entry["seconds"] for entry in models.values()), default=0.0),
+        "single_model_credits": pages * top["credits_per_page"],
+        "single_model_seconds": pages * top["seconds_per_page"],
+        "measured": seconds is not None,
+    }
+
+
+def format_tier_report(report: Dict) -> str:
+    """一行摘要，例如 gemini-2.5-flash-lite 10p 12.0s 100cr | ... | total 230cr vs 900cr all-pro"""
+    parts = [f"{model} {entry['pages']}p {entry['seconds']:.1f}s {entry['credits']:.0f}cr"
+             for model, entry in report["models"].items()]
+    parts.append(f"total {report['credits']:.0f}cr vs {report['single_model_credits']:.0f}cr single-model")
+    return " | ".join(parts)
+
+
+def llamaparse_json_tiered(make_parser: Callable[[str, List[int]], object], file_path: str,
+                           plan: Sequence[Dict], deadline: Optional[Deadline] = None,
+                           tiers: Sequence[Dict] = MODEL_TIERS) -> Dict:
+    """
+    各模型同時解析各自的頁面，依頁碼合併
+
+    所有工作在同一個 event loop 中並行，時限與取消由呼叫端執行緒輪詢（Streamlit 可安全更新畫面）。
+
+    Args:
+        make_parser: make_parser(model, page_numbers) -> LlamaParse 實例（以 target_pages 限定頁面）
+        file_path: 上傳的 PDF 路徑
+        plan: plan_document 的結果
+        deadline: 整份文件的時限與取消旗標
+
+    Returns:
+        pages（依頁碼排序的 LlamaParse 頁面，各附 model）、report（tier_report，耗時為實測）
+
+    Raises:
+        DeadlineExceeded / ParseCancelled: 逾時或取消（所有工作一起中止）
+        Exception: 任一模型的工作失敗時，丟出該錯誤
+    """
+    groups = group_by_model(plan, tiers)
+
+    async def timed(model: str, numbers: List[int]):
+        parser = make_parser(model, numbers)
+        # 新版為 aget_json，舊版為 aget_json_result
+        aget = getattr(parser, "aget_json", None) or getattr(parser, "aget_json_result")
+        start_time = time.monotonic()
+        json_objs = await aget(file_path)
+        return model, numbers, json_objs, time.monotonic() - start_time
+
+    async def gather():
+        return await asyncio.gather(*(timed(model, numbers) for model, numbers in groups.items()))
+
+    pages = []
+    seconds = {}
+    for model, numbers, json_objs, elapsed in run_coroutine_with_deadline(gather, deadline):
+        if not json_objs:
+            raise ValueError(f"No content parsed from PDF ({model})")
+        seconds[model] = elapsed
+        # 結果頁面帶有原始頁碼；沒有或不在要求範圍內時依要求的順序對應
+        for requested, page in zip(numbers, json_objs[0]["pages"]):
+            number = page.get("page") if page.get("page") in numbers else requested
+            pages.append({**page, "page": number, "model": model})
+    pages.sort(key=lambda page: page["page"])
+    return {"pages": pages, "report": tier_report(plan, seconds, tiers)}
@@ -0,0 +1,128 @@
+"""
+頁面範圍選擇與快速預覽
+
+很多時候只需要摘要與結果表格，不必解析整份 PDF。頁面範圍以 "1-3,12-15" 指定（頁碼從 1 開始）：
+- parse_page_ranges()：解析範圍字串並依文件頁數截斷；"12-" 表示第 12 頁到最後一頁
+- format_page_ranges()：頁碼列表轉回精簡的範圍字串（顯示與記錄用）
+- 遠端引擎以 LlamaParse 的 target_pages 只解析選取的頁面（quality.target_pages_arg）
+- 本地引擎（MarkItDown / pdfminer）無法指定頁面：subset_pdf() 以 PyMuPDF 將選取的頁面複製為暫存 PDF 後轉換，
+  結果附上 page_numbers（原始頁碼），逐頁記錄與圖片連結沿用原始頁碼
+- split_preview()：快速預覽先解析選取範圍的前 N 頁，其餘頁面之後再解析
+"""
+
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+_RANGE = re.compile(r"(\d+)(?:(-)(\d*))?")
+
+
+def _parts(spec: str) -> Iterator[Tuple[int, Optional[int]]]:
+    # (起始頁, 結束頁)；開放式範圍（"12-"）的結束頁為 None
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        match = _RANGE.fullmatch(part)
+        if match is None:
+            raise ValueError(f"無法解析頁面範圍: {part}")
+        start = int(match.group(1))
+        end = None if match.group(2) and not match.group(3) else int(match.group(3) or start)
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"頁面範圍無效: {part}")
+        yield start, end
+
+
+def check_page_ranges(spec: str) -> str:
+    """檢查範圍字串的格式（argparse type 用），回傳原字串"""
+    if not list(_parts(spec)):
+        raise ValueError(f"沒有指定任何頁面: {spec}")
+    return spec
+
+
+def parse_page_ranges(spec: Optional[str], page_count: Optional[int] = None) -> Optional[List[int]]:
+    """
+    解析頁面範圍
+
+    Args:
+        spec: 範圍字串，例如 "1-3,12-15" 或 "5-"；None 或空字串為整份文件
+        page_count: 文件頁數；超出的頁面會被捨棄，開放式範圍需要此值
+
+    Returns:
+        排序、去重的頁碼列表；未指定範圍時為 None
+
+    Raises:
+        ValueError: 格式錯誤，或選取的頁面都不在文件中
+    """
+    if not spec or not spec.strip():
+        return None
+    pages = set()
+    for start, end in _parts(spec):
+        if end is None:
+            if page_count is None:
+                raise ValueError(f"無法取得頁數，不能使用開放式範圍: {start}-")
+            end = page_count
+        if page_count is not None:
+            end = min(end, page_count)
+        pages.update(range(start, end + 1))
+    if not pages:
+        raise ValueError(f"頁面範圍 {spec} 不在文件的 {page_count} 頁之內")
+    return sorted(pages)
+
+
+def format_page_ranges(pages: Sequence[int]) -> str:
+    """頁碼列表轉為精簡的範圍字串，例如 [1, 2, 3, 12] -> "1-3,12" """
+    parts = []
+    numbers = sorted(set(pages))
+    i = 0
+    while i < len(numbers):
+        j = i
+        while j + 1 < len(numbers) and numbers[j + 1] == numbers[j] + 1:
+            j += 1
+        parts.append(str(numbers[i]) if i == j else f"{numbers[i]}-{numbers[j]}")
+        i = j + 1
+    return ",".join(parts)
+
+
+def split_preview(pages: Optional[Sequence[int]], page_count: int,
+                  preview_pages: int) -> Tuple[List[int], List[int]]:
+    """
+    快速預覽：將選取的頁面分為先解析的前 N 頁與其餘頁面
+
+    Args:
+        pages: 選取的頁碼，None 為整份文件
+        page_count: 文件頁數
+        preview_pages: 先解析的頁數
+
+    Returns:
+        (預覽頁碼, 其餘頁碼)
+    """
+    selected = list(pages) if pages is not None else list(range(1, page_count + 1))
+    return selected[:preview_pages], selected[preview_pages:]
+
+
+@contextmanager
+def subset_pdf(file_path: str, pages: Optional[Sequence[int]]) -> Iterator[str]:
+    """
+    只含選取頁面的暫存 PDF（with 區塊結束後刪除）；未指定頁面時直接回傳原檔
+
+    副本放在暫存目錄中並保留原檔名，本地引擎的輸出標題不受影響。
+    """
+    if not pages:
+        yield file_path
+        return
+
+    import fitz  # PyMuPDF
+
+    tmp_dir = tempfile.mkdtemp(prefix="pdf2md-pages-")
+    try:
+        output_path = os.path.join(tmp_dir, os.path.basename(file_path))
+        with fitz.open(file_path) as doc:
+            doc.select([page - 1 for page in pages])
+            # 清除未選取頁面留下的物件
+            doc.save(output_path, garbage=3, deflate=True)
+        yield output_path
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
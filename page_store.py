@@ -0,0 +1,322 @@
+"""
+逐頁 JSONL 輸出格式與位移索引
+
+每份解析結果除了 .md 之外，另外輸出兩個檔案：
+- <name>.pages.jsonl：每行一頁的 JSON 記錄（頁碼、引擎、模型、Markdown、耗時）
+- <name>.pages.idx：每頁記錄在 JSONL 中的起始位元組位移（little-endian uint64 陣列），最後多一筆 JSONL 的總大小
+
+下游工具（例如 RAG 匯入）可以用索引直接 seek 到第 N 頁，不必讀取或重新切分整個檔案。
+read_page 依記錄位置讀取；find_page 依原始頁碼讀取（只解析部分頁面時兩者不同）。
+已封存（compressed_store）的輸出只剩壓縮版本時，page_count / read_page / find_page / iter_pages 自動改讀壓縮檔。
+
+兩個檔案都以暫存檔寫入後原子地取代；重跑時若頁面內容（不含耗時）沒有改變，既有檔案不會被改寫。
+索引在 JSONL 之後才取代，讀取時以索引的結尾位移比對 JSONL 的大小：兩次取代之間、寫入中斷或舊格式的索引
+都對不上 JSONL，此時由 JSONL 重建索引，不會讀到錯誤的記錄。
+"""
+
+import hashlib
+import io
+import json
+import os
+import struct
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from atomic_io import AtomicWriter
+
+PAGES_SUFFIX = ".pages.jsonl"
+INDEX_SUFFIX = ".pages.idx"
+
+# 每筆位移以 8 bytes 無號整數儲存
+_OFFSET = struct.Struct("<Q")
+
+
+def pages_path_for(md_path: str) -> str:
+    """由 .md 輸出路徑推得對應的 .pages.jsonl 路徑"""
+    base, _ = os.path.splitext(md_path)
+    return base + PAGES_SUFFIX
+
+
+def index_path_for(pages_path: str) -> str:
+    """由 .pages.jsonl 路徑推得對應的位移索引路徑"""
+    if pages_path.endswith(PAGES_SUFFIX):
+        return pages_path[:-len(PAGES_SUFFIX)] + INDEX_SUFFIX
+    return pages_path + ".idx"
+
+
+def make_page_record(page: int, engine: str, model: Optional[str], markdown: str,
+                     page_seconds: float, document_seconds: float) -> Dict:
+    """
+    建立單頁記錄
+
+    Args:
+        page: 頁碼（從 1 開始）
+        engine: 解析引擎名稱（LlamaParse / MarkItDown ...）
+        model: 使用的模型，本地引擎為 None
+        markdown: 該頁的 Markdown 內容
+        page_seconds: 該頁耗時（遠端引擎無逐頁計時，為整份文件耗時的平均分攤）
+        document_seconds: 整份文件的解析耗時
+
+    Returns:
+        頁面記錄字典
+    """
+    return {
+        "page": page,
+        "engine": engine,
+        "model": model,
+        "markdown": markdown,
+        "timing": {
+            "page_seconds": round(page_seconds, 4),
+            "document_seconds": round(document_seconds, 4),
+        },
+    }
+
+
+def iter_page_records(pages: Iterable[str], engine: str, model: Optional[str],
+                      document_seconds: float, page_total: int,
+                      page_meta: Optional[List[Dict]] = None) -> Iterator[Dict]:
+    """
+    逐頁產生頁面記錄（串流版本），耗時依總頁數平均分攤
+
+    page_meta 為逐頁覆寫的欄位（例如混合解析時每頁的 engine / model / quality）。
+    """
+    per_page = document_seconds / page_total if page_total else 0.0
+    for i, md in enumerate(pages):
+        record = make_page_record(i + 1, engine, model, md, per_page, document_seconds)
+        if page_meta:
+            record.update(page_meta[i])
+        yield record
+
+
+def records_from_pages(pages: List[str], engine: str, model: Optional[str],
+                       document_seconds: float, page_meta: Optional[List[Dict]] = None) -> List[Dict]:
+    """將頁面 Markdown 列表轉為頁面記錄，耗時依頁數平均分攤"""
+    return list(iter_page_records(pages, engine, model, document_seconds, len(pages), page_meta))
+
+
+def _content_line(record: Dict) -> bytes:
+    # 比較內容時不含耗時：同樣的結果每次重跑耗時都不同
+    content = {key: value for key, value in record.items() if key != "timing"}
+    return json.dumps(content, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def pages_digest(pages_path: str) -> Optional[str]:
+    """頁面內容（不含耗時）的 SHA-256，檔案不存在時為 None"""
+    digest = hashlib.sha256()
+    try:
+        with open(pages_path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    digest.update(_content_line(json.loads(line)))
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def write_pages(pages_path: str, records: Iterable[Dict]) -> Tuple[int, bool]:
+    """
+    寫入逐頁 JSONL 與位移索引
+
+    先寫入暫存檔；頁面內容（不含耗時）與既有檔案相同時不取代，既有檔案與 mtime 維持不變。
+
+    Args:
+        pages_path: .pages.jsonl 輸出路徑
+        records: 頁面記錄（可為 generator，逐筆寫出不需全部載入記憶體）
+
+    Returns:
+        (寫入的頁數, 是否取代了既有檔案)
+    """
+    offsets = bytearray()
+    count = 0
+    content = hashlib.sha256()
+    pages_file = AtomicWriter(pages_path, "wb")
+    index_file = AtomicWriter(index_path_for(pages_path), "wb")
+    try:
+        for record in records:
+            offsets += _OFFSET.pack(pages_file.tell())
+            pages_file.write(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+            pages_file.write(b"\n")
+            content.update(_content_line(record))
+            count += 1
+        # 結尾位移 = JSONL 大小，讀取端據此確認索引屬於目前的 JSONL
+        offsets += _OFFSET.pack(pages_file.tell())
+        index_file.write(bytes(offsets))
+    except BaseException:
+        pages_file.discard()
+        index_file.discard()
+        raise
+
+    # 索引的位移對應 JSONL 的位元組，兩者一起取代或一起保留；索引最後取代
+    changed = content.hexdigest() != pages_digest(pages_path)
+    pages_file.commit(replace=changed)
+    if changed:
+        index_file.commit(replace=True)
+    else:
+        # 保留既有 JSONL 時新索引的位移不適用（耗時欄位長度不同）；既有索引不符時由 JSONL 重建
+        index_file.discard()
+        with open(pages_path, "rb") as f, _open_index(f, pages_path):
+            pass
+    return count, changed
+
+
+def dumps_pages(records: Iterable[Dict]) -> str:
+    """將頁面記錄序列化為 JSONL 字串（供下載按鈕使用）"""
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+
+def _scan_offsets(pages_file: BinaryIO) -> bytes:
+    # 逐行掃描 JSONL 產生位移索引（含結尾位移）
+    offsets = bytearray()
+    position = 0
+    pages_file.seek(0)
+    for line in pages_file:
+        if line.strip():
+            offsets += _OFFSET.pack(position)
+        position += len(line)
+    offsets += _OFFSET.pack(position)
+    return bytes(offsets)
+
+
+def build_index(pages_path: str) -> int:
+    """
+    為既有的 .pages.jsonl 重建位移索引（例如從網頁下載的 JSONL）
+
+    Returns:
+        索引的頁數
+    """
+    with open(pages_path, "rb") as f:
+        offsets = _scan_offsets(f)
+
+    with AtomicWriter(index_path_for(pages_path), "wb") as f:
+        f.write(offsets)
+
+    return len(offsets) // _OFFSET.size - 1
+
+
+def _open_index(pages_file: BinaryIO, pages_path: str) -> BinaryIO:
+    """
+    開啟與已開啟的 JSONL 相符的位移索引（結尾位移須等於 JSONL 大小）
+
+    不符時由 JSONL 重建並寫回；目錄無法寫入時只回傳記憶體中的索引。
+    """
+    size = os.fstat(pages_file.fileno()).st_size
+    try:
+        idx = open(index_path_for(pages_path), "rb")
+    except FileNotFoundError:
+        idx = None
+    if idx is not None:
+        length = idx.seek(0, os.SEEK_END)
+        if length >= _OFFSET.size and length % _OFFSET.size == 0:
+            idx.seek(length - _OFFSET.size)
+            if _OFFSET.unpack(idx.read(_OFFSET.size))[0] == size:
+                idx.seek(0)
+                return idx
+        idx.close()
+
+    offsets = _scan_offsets(pages_file)
+    try:
+        with AtomicWriter(index_path_for(pages_path), "wb") as f:
+            f.write(offsets)
+    except OSError:
+        pass
+    return io.BytesIO(offsets)
+
+
+def _archived(pages_path: str) -> bool:
+    # compressed_store 匯入本模組，延遲匯入避免循環
+    from compressed_store import find_compressed
+    return find_compressed(pages_path) is not None
+
+
+def page_count(pages_path: str) -> int:
+    """由索引大小取得頁數，不需讀取 JSONL"""
+    if not os.path.exists(pages_path) and _archived(pages_path):
+        from compressed_store import framed_page_count
+        return framed_page_count(pages_path)
+    with open(pages_path, "rb") as f, _open_index(f, pages_path) as idx:
+        return idx.seek(0, os.SEEK_END) // _OFFSET.size - 1
+
+
+def read_page(pages_path: str, page: int) -> Dict:
+    """
+    隨機讀取第 N 頁的記錄
+
+    Args:
+        pages_path: .pages.jsonl 路徑
+        page: 頁碼（從 1 開始）
+
+    Returns:
+        頁面記錄字典
+
+    Raises:
+        IndexError: 頁碼超出範圍
+    """
+    if page < 1:
+        raise IndexError(f"頁碼必須從 1 開始: {page}")
+    if not os.path.exists(pages_path) and _archived(pages_path):
+        from compressed_store import read_framed_page
+        return read_framed_page(pages_path, page)
+
+    # 索引與 JSONL 由同一組已開啟的檔案讀取，讀取期間被取代也不會混用新舊版本
+    with open(pages_path, "rb") as f, _open_index(f, pages_path) as idx:
+        idx.seek((page - 1) * _OFFSET.size)
+        raw = idx.read(2 * _OFFSET.size)
+        if len(raw) != 2 * _OFFSET.size:
+            raise IndexError(f"頁碼超出範圍: {page}")
+        start, end = _OFFSET.unpack_from(raw, 0)[0], _OFFSET.unpack_from(raw, _OFFSET.size)[0]
+        f.seek(start)
+        return json.loads(f.read(end - start))
+
+
+def find_page(pages_path: str, page: int) -> Dict:
+    """
+    依原始頁碼（記錄的 page 欄位）讀取頁面記錄
+
+    整份文件的輸出第 N 筆記錄就是第 N 頁；只解析部分頁面（--pages）的輸出頁碼遞增但不連續，
+    此時以二分搜尋定位，只讀取 O(log n) 筆記錄。
+
+    Raises:
+        IndexError: 文件中沒有該頁
+    """
+    total = page_count(pages_path)
+    if 1 <= page <= total:
+        record = read_page(pages_path, page)
+        if record.get("page", page) == page:
+            return record
+    low, high = 1, total
+    while low <= high:
+        middle = (low + high) // 2
+        record = read_page(pages_path, middle)
+        number = record.get("page", middle)
+        if number == page:
+            return record
+        if number < page:
+            low = middle + 1
+        else:
+            high = middle - 1
+    raise IndexError(f"文件中沒有第 {page} 頁")
+
+
+def iter_pages(pages_path: str) -> Iterator[Dict]:
+    """依序讀取所有頁面記錄"""
+    if not os.path.exists(pages_path) and _archived(pages_path):
+        from compressed_store import iter_framed_pages
+        yield from iter_framed_pages(pages_path)
+        return
+    with open(pages_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def split_markitdown_pages(text: str) -> List[str]:
+    """
+    將 MarkItDown（pdfminer）的輸出依換頁字元切分為頁面列表
+
+    pdfminer 以 form feed (\\f) 分隔頁面；含表格的文件（pdfplumber）沒有換頁字元，整份會成為單頁，
+    多頁 PDF 因此由 local_pool.convert_file 逐頁轉換，整份轉換的輸出只有單頁文件會以此函數切分。
+    """
+    pages = text.split("\f")
+    # 最後一頁之後通常只剩空白
+    if len(pages) > 1 and not pages[-1].strip():
+        pages = pages[:-1]
+    return [p.strip("\n") for p in pages]
@@ -0,0 +1,429 @@
+"""
+HTTP 解析服務（無瀏覽器的程式化入口）
+
+Streamlit 介面需要瀏覽器，命令列只能處理整個目錄。此模組以標準函式庫提供 HTTP 服務，
+其他系統可逐份送出 PDF、查詢狀態並下載結果；解析本身由呼叫端提供的 process 函數執行，
+與批次、分散式 worker 使用同一套解析核心：
+
+    POST   /jobs?filename=a.pdf     上傳 PDF（request body 為檔案內容），回傳 202 與工作 id
+    GET    /jobs/<id>               工作狀態（queued / running / done / failed）與排隊位置
+    GET    /jobs/<id>/result        下載 Markdown；?format=jsonl 為逐頁 JSONL，?page=N 為第 N 頁的記錄
+    DELETE /jobs/<id>               取消排隊中的工作，或刪除已完成工作的結果
+    GET    /health                  佇列長度、執行中工作數與累計統計
+
+背壓（backpressure）：
+- 排隊中（含上傳中）的工作數有上限；佇列已滿時立即回傳 429 與 Retry-After，不讀取上傳內容
+- Retry-After 依最近工作的平均耗時與排隊長度估計
+- 上傳與下載都以固定大小的區塊串流，記憶體用量與檔案大小無關
+
+工作狀態保存在記憶體中，服務重啟後排隊中的工作會遺失；需要持久佇列時使用 work_queue。
+"""
+
+import json
+import os
+import queue
+import re
+import shutil
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from page_store import find_page, pages_path_for
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_MAX_UPLOAD_MB = 200
+# 完成的工作結果保留時間（秒）與筆數上限，超過時刪除最舊的結果
+DEFAULT_RESULT_TTL = 24 * 3600
+DEFAULT_MAX_FINISHED = 1000
+# 串流上傳與下載的區塊大小
+CHUNK_SIZE = 1024 * 1024
+# 尚無完成的工作時，估計 Retry-After 用的每份耗時（秒）
+DEFAULT_JOB_SECONDS = 30.0
+
+_FINISHED = ("done", "failed", "cancelled")
+_JOB_PATH = re.compile(r"^/jobs/([0-9a-f]{32})(/result)?$")
+
+
+def safe_filename(name: Optional[str]) -> str:
+    """上傳檔名只保留檔名部分與安全字元，並確保以 .pdf 結尾（輸出檔名由此推得）"""
+    base = os.path.basename((name or "").replace("\\", "/"))
+    base = re.sub(r"[^\w.\-]+", "_", base).strip("._") or "document"
+    if not base.lower().endswith(".pdf"):
+        base += ".pdf"
+    return base[:-4] + ".pdf"
+
+
+class ParseService:
+    """
+    有界佇列 + 固定數量 worker 執行緒的解析服務
+
+    Args:
+        process: process(pdf_path, output_dir) -> 是否成功；輸出寫入 output_dir
+        work_dir: 上傳暫存（uploads/）與結果（results/<工作 id>/）的目錄
+        concurrency: 同時解析的文件數
+        max_queue: 排隊中（含上傳中）的工作數上限，超過時拒絕
+        max_upload_mb: 單一上傳的大小上限
+        result_ttl: 完成的工作結果保留秒數
+        max_finished: 完成的工作最多保留筆數
+    """
+
+    def __init__(self, process: Callable[[str, str], bool], work_dir: str,
+                 concurrency: int = DEFAULT_CONCURRENCY, max_queue: int = DEFAULT_MAX_QUEUE,
+                 max_upload_mb: float = DEFAULT_MAX_UPLOAD_MB, result_ttl: float = DEFAULT_RESULT_TTL,
+                 max_finished: int = DEFAULT_MAX_FINISHED):
+        self.process = process
+        self.uploads_dir = os.path.join(work_dir, "uploads")
+        self.results_dir = os.path.join(work_dir, "results")
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(1, max_queue)
+        self.max_upload_bytes = int(max_upload_mb * 1024 * 1024)
+        self.result_ttl = result_ttl
+        self.max_finished = max_finished
+        # 每個排隊名額在上傳開始前取得，worker 取出工作時歸還
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._closing = False
+        self._mean_seconds: Optional[float] = None
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    def start(self) -> None:
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._worker, name=f"parse-service-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """停止接受新工作；執行中的文件完成後結束，排隊中的工作標記為取消"""
+        with self._lock:
+            self._closing = True
+            for job in self._jobs.values():
+                if job["state"] == "queued":
+                    job["state"] = "cancelled"
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    # 提交
+
+    def reserve(self) -> bool:
+        """取得一個排隊名額；佇列已滿或服務關閉中時回傳 False（呼叫端回應 429 / 503）"""
+        if self._closing or not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats["rejected"] += 1
+            return False
+        return True
+
+    def release(self) -> None:
+        """上傳失敗時歸還名額"""
+        self._slots.release()
+
+    def new_upload(self, filename: Optional[str]) -> Dict:
+        """建立工作記錄與上傳路徑（尚未排隊）"""
+        job_id = uuid.uuid4().hex
+        filename = safe_filename(filename)
+        upload_dir = os.path.join(self.uploads_dir, job_id)
+        os.makedirs(upload_dir, exist_ok=True)
+        return {"id": job_id, "filename": filename,
+                "upload_path": os.path.join(upload_dir, filename),
+                "output_dir": os.path.join(self.results_dir, job_id)}
+
+    def enqueue(self, job: Dict, size: int) -> Dict:
+        """上傳完成後排隊，回傳工作狀態"""
+        job.update({"state": "queued", "bytes": size, "submitted_at": time.time(),
+                    "started_at": None, "finished_at": None, "error": None})
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self.stats["accepted"] += 1
+        self._queue.put(job["id"])
+        self._expire()
+        return self.status(job["id"])
+
+    def discard_upload(self, job: Dict) -> None:
+        shutil.rmtree(os.path.dirname(job["upload_path"]), ignore_errors=True)
+
+    # 執行
+
+    def _worker(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            self._slots.release()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["state"] != "queued":
+                    continue
+                job["state"] = "running"
+                job["started_at"] = time.time()
+            self._run(job)
+
+    def _run(self, job: Dict) -> None:
+        error = None
+        try:
+            success = self.process(job["upload_path"], job["output_dir"])
+            if success and not os.path.exists(self.result_path(job)):
+                success, error = False, "no output written"
+            elif not success:
+                error = "parse failed"
+        except Exception as e:
+            success, error = False, str(e)
+        finally:
+            self.discard_upload(job)
+
+        finished_at = time.time()
+        with self._lock:
+            job["state"] = "done" if success else "failed"
+            job["error"] = error
+            job["finished_at"] = finished_at
+            self.stats["completed" if success else "failed"] += 1
+            seconds = finished_at - job["started_at"]
+            # 指數移動平均，供 Retry-After 估計
+            self._mean_seconds = seconds if self._mean_seconds is None else 0.8 * self._mean_seconds + 0.2 * seconds
+        if not success:
+            shutil.rmtree(job["output_dir"], ignore_errors=True)
+
+    def _expire(self) -> None:
+        # 刪除過期或超過筆數上限的已完成工作
+        now = time.time()
+        expired = []
+        with self._lock:
+            finished = [job for job in self._jobs.values() if job["state"] in _FINISHED]
+            overflow = len(finished) - self.max_finished
+            for i, job in enumerate(finished):
+                if i < overflow or now - (job["finished_at"] or now) > self.result_ttl:
+                    expired.append(self._jobs.pop(job["id"]))
+        for job in expired:
+            shutil.rmtree(job["output_dir"], ignore_errors=True)
+
+    # 查詢
+
+    def result_path(self, job: Dict, fmt: str = "md") -> str:
+        md_path = os.path.join(job["output_dir"], job["filename"][:-4] + ".md")
+        return pages_path_for(md_path) if fmt == "jsonl" else md_path
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """工作狀態（不含伺服器路徑）；排隊中的工作附上排隊位置"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = {key: job[key] for key in ("id", "filename", "state", "bytes", "submitted_at",
+                                                "started_at", "finished_at", "error")}
+            if job["state"] == "queued":
+                status["position"] = 1 + sum(1 for other in self._jobs.values()
+                                             if other["state"] == "queued"
+                                             and other["submitted_at"] < job["submitted_at"])
+            return status
+
+    def cancel(self, job_id: str) -> Optional[bool]:
+        """取消排隊中的工作或刪除已完成的結果；工作不存在為 None，執行中為 False"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["state"] == "running":
+                return False
+            if job["state"] == "queued":
+                job["state"] = "cancelled"
+                job["finished_at"] = time.time()
+            else:
+                del self._jobs[job_id]
+        self.discard_upload(job)
+        shutil.rmtree(job["output_dir"], ignore_errors=True)
+        return True
+
+    def retry_after(self) -> int:
+        """依平均耗時與排隊長度估計名額空出的秒數"""
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job["state"] == "queued")
+            seconds = self._mean_seconds or DEFAULT_JOB_SECONDS
+        return max(1, round(seconds * (queued // self.concurrency + 1)))
+
+    def health(self) -> Dict:
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job["state"]] = states.get(job["state"], 0) + 1
+            return {"queued": states.get("queued", 0), "running": states.get("running", 0),
+                    "concurrency": self.concurrency, "max_queue": self.max_queue,
+                    "mean_job_seconds": self._mean_seconds, "closing": self._closing, **self.stats}
+
+
+class ParseRequestHandler(BaseHTTPRequestHandler):
+    """ParseService 的 HTTP 介面（self.server.service）"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "pdf2md"
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reject(self, status: int, error: str, headers: Optional[Dict] = None) -> None:
+        # request body 未讀取，回應後關閉連線
+        self.close_connection = True
+        self._send_json(status, {"error": error}, {**(headers or {}), "Connection": "close"})
+
+    def _send_file(self, path: str, content_type: str, filename: str) -> None:
+        size = os.path.getsize(path)
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(size))
+        self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def do_GET(self) -> None:
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send_json(HTTPStatus.OK, service.health())
+        match = _JOB_PATH.match(url.path)
+        job = service.get(match.group(1)) if match else None
+        if job is None:
+            return self._send_json(HTTPStatus.NOT_FOUND, {"error": "job not found"})
+        status = service.status(job["id"])
+        if not match.group(2):
+            return self._send_json(HTTPStatus.OK, status)
+
+        if status["state"] != "done":
+            headers = {} if status["state"] in _FINISHED else {"Retry-After": str(service.retry_after())}
+            return self._send_json(HTTPStatus.CONFLICT, status, headers)
+        query = parse_qs(url.query)
+        stem = job["filename"][:-4]
+        try:
+            if "page" in query:
+                return self._send_json(HTTPStatus.OK, find_page(service.result_path(job, "jsonl"),
+                                                                int(query["page"][0])))
+            if query.get("format", ["md"])[0] == "jsonl":
+                return self._send_file(service.result_path(job, "jsonl"), "application/jsonl",
+                                       f"{stem}.pages.jsonl")
+            return self._send_file(service.result_path(job), "text/markdown; charset=utf-8", f"{stem}.md")
+        except ValueError:
+            return self._send_json(HTTPStatus.BAD_REQUEST, {"error": "invalid page"})
+        except IndexError as e:
+            return self._send_json(HTTPStatus.NOT_FOUND, {"error": str(e)})
+        except FileNotFoundError:
+            # 結果在下載前被刪除（DELETE 或過期）
+            return self._send_json(HTTPStatus.GONE, {"error": "result expired"})
+
+    def do_POST(self) -> None:
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path != "/jobs":
+            return self._reject(HTTPStatus.NOT_FOUND, "not found")
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            return self._reject(HTTPStatus.LENGTH_REQUIRED, "Content-Length required")
+        length = int(length)
+        if length > service.max_upload_bytes:
+            return self._reject(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                f"upload exceeds {service.max_upload_bytes} bytes")
+        if not service.reserve():
+            if service.health()["closing"]:
+                return self._reject(HTTPStatus.SERVICE_UNAVAILABLE, "service is shutting down")
+            return self._reject(HTTPStatus.TOO_MANY_REQUESTS, "queue is full",
+                                {"Retry-After": str(service.retry_after())})
+
+        filename = parse_qs(url.query).get("filename", [None])[0] or self.headers.get("X-Filename")
+        job = service.new_upload(filename)
+        try:
+            # 逐區塊寫入暫存檔，不在記憶體中持有整份 PDF
+            remaining = length
+            with open(job["upload_path"], "wb") as f:
+                while remaining:
+                    chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ConnectionError("upload truncated")
+                    if remaining == length and not chunk.startswith(b"%PDF-"):
+                        raise ValueError("not a PDF")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        except ValueError as e:
+            service.release()
+            service.discard_upload(job)
+            return self._reject(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, str(e))
+        except (ConnectionError, OSError):
+            service.release()
+            service.discard_upload(job)
+            self.close_connection = True
+            return
+
+        status = service.enqueue(job, length)
+        self._send_json(HTTPStatus.ACCEPTED, status, {"Location": f"/jobs/{job['id']}"})
+
+    def do_DELETE(self) -> None:
+        match = _JOB_PATH.match(urlparse(self.path).path)
+        cancelled = self.server.service.cancel(match.group(1)) if match and not match.group(2) else None
+        if cancelled is None:
+            return self._send_json(HTTPStatus.NOT_FOUND, {"error": "job not found"})
+        if not cancelled:
+            return self._send_json(HTTPStatus.CONFLICT, {"error": "job is running"})
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class ParseHTTPServer(ThreadingHTTPServer):
+    """每個連線一個執行緒；解析的並行度由 ParseService 的 worker 數決定"""
+
+    daemon_threads = True
+
+    def __init__(self, address, service: ParseService):
+        super().__init__(address, ParseRequestHandler)
+        self.service = service
+
+
+def serve(process: Callable[[str, str], bool], host: str = "127.0.0.1", port: int = 8000,
+          work_dir: str = "parse_service", **options) -> None:
+    """
+    啟動 HTTP 解析服務，直到 Ctrl-C 或 SIGTERM
+
+    Args:
+        process: process(pdf_path, output_dir) -> 是否成功
+        host / port: 監聽位址
+        work_dir: 上傳暫存與結果目錄
+        options: ParseService 的其他參數（concurrency / max_queue / max_upload_mb / result_ttl）
+    """
+    service = ParseService(process, work_dir, **options)
+    service.start()
+    server = ParseHTTPServer((host, port), service)
+    try:
+        # SIGTERM 與 Ctrl-C 相同：停止接受連線，等執行中的文件完成
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+    except ValueError:
+        pass
+    print(f"Parse service listening on http://{host}:{server.server_address[1]} "
+          f"({service.concurrency} workers, queue limit {service.max_queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Shutting down: waiting for running jobs...")
+        service.stop()
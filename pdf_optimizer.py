@@ -0,0 +1,152 @@
+"""
+上傳前的 PDF 最佳化
+
+許多期刊 PDF 因為內嵌高解析度圖片與未使用的物件而達 30–80 MB，上傳到 LlamaParse 的時間
+往往比解析本身還長。此模組在本地以 PyMuPDF 產生較小的上傳用副本：
+- 清除未使用的物件並合併重複的物件（garbage collection）
+- 以 deflate 重新壓縮內容、圖片與字型串流
+- 可選：將超過指定 DPI 的圖片降採樣
+
+每份文件回報節省的位元組與估計節省的上傳時間，並比對最佳化前後的文字層，
+確認送出的內容沒有改變。原始檔案不會被修改。
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+# 估計上傳時間用的頻寬（Mbps）
+DEFAULT_UPLOAD_MBPS = 20.0
+
+# 每份文件的最佳化記錄（輸出目錄下）
+REPORT_FILENAME = "upload_optimization.jsonl"
+
+# 節省比例低於此值時直接上傳原檔（避免為了幾 KB 改變檔案）
+MIN_SAVINGS_RATIO = 0.02
+
+
+def _page_text_lengths(file_path: str) -> list:
+    import fitz  # PyMuPDF
+    with fitz.open(file_path) as doc:
+        return [len(page.get_text("text")) for page in doc]
+
+
+def upload_seconds(size_bytes: int, upload_mbps: float = DEFAULT_UPLOAD_MBPS) -> float:
+    """以指定頻寬估計上傳時間（秒）"""
+    return size_bytes * 8 / (upload_mbps * 1_000_000)
+
+
+def optimize_pdf(file_path: str, output_path: str, max_image_dpi: Optional[int] = None,
+                 image_quality: int = 80, upload_mbps: float = DEFAULT_UPLOAD_MBPS,
+                 verify_text: bool = True) -> Dict:
+    """
+    產生最佳化的 PDF 副本
+
+    Args:
+        file_path: 原始 PDF 路徑
+        output_path: 最佳化副本的輸出路徑
+        max_image_dpi: 圖片超過此 DPI 時降採樣至此 DPI，None 為不降採樣
+        image_quality: 降採樣後的 JPEG 品質
+        upload_mbps: 估計上傳時間用的頻寬
+        verify_text: 比對最佳化前後每頁的文字長度
+
+    Returns:
+        最佳化記錄字典；若副本沒有明顯變小，use_optimized 為 False，應上傳原檔
+    """
+    import fitz  # PyMuPDF
+
+    start_time = time.time()
+    original_bytes = os.path.getsize(file_path)
+    downsampled = False
+
+    with fitz.open(file_path) as doc:
+        if max_image_dpi and hasattr(doc, "rewrite_images"):
+            # 只處理超過門檻的圖片，其餘維持原樣（PyMuPDF 1.24.10 以上）
+            doc.rewrite_images(dpi_threshold=max_image_dpi + 1, dpi_target=max_image_dpi,
+                               quality=image_quality)
+            downsampled = True
+        doc.save(output_path, garbage=4, clean=True, deflate=True,
+                 deflate_images=True, deflate_fonts=True, use_objstms=1)
+
+    optimized_bytes = os.path.getsize(output_path)
+    bytes_saved = original_bytes - optimized_bytes
+    ratio = bytes_saved / original_bytes if original_bytes else 0.0
+
+    report = {
+        "file": os.path.basename(file_path),
+        "original_bytes": original_bytes,
+        "optimized_bytes": optimized_bytes,
+        "bytes_saved": max(0, bytes_saved),
+        "ratio_saved": round(max(0.0, ratio), 4),
+        "max_image_dpi": max_image_dpi if downsampled else None,
+        "upload_seconds_saved": round(upload_seconds(max(0, bytes_saved), upload_mbps), 2),
+        "upload_mbps": upload_mbps,
+        "optimize_seconds": round(time.time() - start_time, 3),
+        "use_optimized": ratio >= MIN_SAVINGS_RATIO,
+    }
+
+    if verify_text:
+        # 文字層應完全相同；不同時改用原檔，避免影響解析品質
+        report["text_preserved"] = _page_text_lengths(file_path) == _page_text_lengths(output_path)
+        report["use_optimized"] = report["use_optimized"] and report["text_preserved"]
+
+    if not report["use_optimized"]:
+        report["upload_seconds_saved"] = 0.0
+
+    return report
+
+
+@contextmanager
+def optimized_upload(file_path: str, options: Optional[Dict] = None
+                     ) -> Iterator[Tuple[str, Optional[Dict]]]:
+    """
+    取得要上傳的檔案路徑（with 區塊結束後刪除暫存副本）
+
+    副本放在暫存目錄中並保留原檔名，遠端結果中的檔名不受影響。
+
+    Args:
+        file_path: 原始 PDF 路徑
+        options: optimize_pdf 的參數（max_image_dpi / image_quality / upload_mbps），None 為不最佳化
+
+    Yields:
+        (上傳路徑, 最佳化記錄)；未最佳化或失敗時為 (原始路徑, None 或含 error 的記錄)
+    """
+    if options is None:
+        yield file_path, None
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix="pdf2md-upload-")
+    try:
+        output_path = os.path.join(tmp_dir, os.path.basename(file_path))
+        try:
+            report = optimize_pdf(file_path, output_path, **options)
+        except Exception as e:
+            # 最佳化失敗不影響解析，直接上傳原檔
+            report = {"file": os.path.basename(file_path), "use_optimized": False,
+                      "error": f"PDF 最佳化失敗: {str(e)}"}
+        yield (output_path if report["use_optimized"] else file_path), report
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def append_report(output_dir: str, report: Dict) -> None:
+    """將最佳化記錄附加到輸出目錄的 upload_optimization.jsonl"""
+    os.makedirs(output_dir, exist_ok=True)
+    record = {**report, "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(os.path.join(output_dir, REPORT_FILENAME), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def format_report(report: Dict) -> str:
+    """單行摘要"""
+    if report.get("error"):
+        return report["error"]
+    if not report["use_optimized"]:
+        reason = "文字層不一致" if report.get("text_preserved") is False else "節省有限"
+        return f"未使用最佳化副本（{reason}）"
+    return (f"{report['original_bytes'] / 1048576:.1f} MB → {report['optimized_bytes'] / 1048576:.1f} MB "
+            f"(-{report['ratio_saved']:.0%})，估計上傳節省 {report['upload_seconds_saved']:.1f} 秒")
@@ -0,0 +1,318 @@
+"""
+Markdown 後處理管線
+
+由多個可組合的串流處理步驟（pass）構成，每個步驟接收頁面 iterator 並產生處理後的頁面：
+- strip_running_headers：偵測跨頁重複的頁首／頁尾並移除
+- drop_page_numbers：移除頁面邊緣的頁碼行
+- dehyphenate：合併因換行而斷開的英文單字（鄰近頁面的拼法或已知複合詞保留連字號）
+- normalize_tables：修正 Markdown 表格的空行、欄位間距與缺少的分隔列
+- normalize_whitespace：移除行尾空白、合併多餘空行
+
+所有步驟皆為線性時間；頁首頁尾偵測與斷字合併需要保留固定大小的頁面視窗，其餘一次只處理一頁，
+峰值記憶體與總頁數無關。LLM 產生的 Markdown（LlamaParse）沒有版面斷字，passes_for() 對這些頁面略過斷字合併。
+"""
+
+import math
+import re
+from collections import Counter, deque
+from functools import partial, reduce
+from typing import Callable, Collection, Iterable, Iterator, List, Optional, Sequence
+
+PagePass = Callable[[Iterable[str]], Iterator[str]]
+
+# 頁首頁尾只檢查每頁開頭與結尾的前幾個非空行
+EDGE_LINES = 3
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+_LETTERS = re.compile(r"[^\W\d_]")
+_PAGE_NUMBER = re.compile(
+    r"^\s*(?:[-–—]\s*)?(?:page\s+|p\.\s*|第\s*)?\d{1,4}(?:\s*(?:/|of)\s*\d{1,4})?\s*(?:頁)?(?:\s*[-–—])?\s*$",
+    re.IGNORECASE
+)
+_HYPHEN_BREAK = re.compile(r"([A-Za-z]{2,})-\n[ \t]*([a-z]{2,})")
+_WORD = re.compile(r"[A-Za-z]+")
+# 同一行內的連字號複合詞（不含行尾斷字）
+_COMPOUND = re.compile(r"\b[A-Za-z]+-[A-Za-z]+\b")
+_BLANK_RUN = re.compile(r"\n{3,}")
+_TABLE_SEPARATOR_CELL = re.compile(r"^:?-{3,}:?$")
+
+# 斷字處的後半段為這些詞時通常是複合詞（"placebo-controlled"、"open-label"、"follow-up"）
+_COMPOUND_TAILS = {
+    "up", "based", "related", "controlled", "label", "blind", "blinded", "term", "dependent",
+    "specific", "free", "induced", "associated", "adjusted", "matched", "reported", "sectional",
+    "inferiority", "treat", "year", "years", "month", "week",
+}
+_KNOWN_COMPOUNDS = {
+    "dose-response", "intention-to", "head-to", "all-cause", "well-being", "self-care",
+    "real-world", "real-time", "first-line", "second-line", "third-line", "risk-benefit",
+}
+
+# 輸出為 LLM 產生的 Markdown 的引擎（沒有版面斷字）
+LLM_ENGINES = {"LlamaParse"}
+
+
+def _is_header_candidate(line: str) -> bool:
+    """表格列、Markdown 標題與沒有文字的行不視為頁首頁尾（頁碼由 drop_page_numbers 處理）"""
+    stripped = line.strip()
+    if not stripped or stripped.startswith(("|", "#")):
+        return False
+    return len(_LETTERS.findall(stripped)) >= 3
+
+
+def _edge_indices(lines: List[str]) -> List[int]:
+    nonblank = [i for i, line in enumerate(lines) if line.strip()]
+    # 短頁面只看第一行與最後一行，避免整頁內容都被當成邊緣
+    depth = min(EDGE_LINES, max(1, len(nonblank) // 4))
+    return [i for i in set(nonblank[:depth] + nonblank[-depth:])
+            if _is_header_candidate(lines[i])]
+
+
+def _edge_keys(page: str) -> set:
+    """取出頁面邊緣行的正規化鍵值（數字以 # 取代，讓含頁碼的頁首也能比對）"""
+    lines = page.splitlines()
+    return {_normalize_line(lines[i]) for i in _edge_indices(lines)}
+
+
+def _normalize_line(line: str) -> str:
+    return _SPACES.sub(" ", _DIGITS.sub("#", line.strip().lower()))
+
+
+def strip_running_headers(pages: Iterable[str], window: int = 8,
+                          min_ratio: float = 0.6) -> Iterator[str]:
+    """
+    移除跨頁重複出現的頁首／頁尾
+
+    以滑動視窗統計邊緣行出現的頁數（前後各約 window/2 頁），
+    某行在視窗中出現比例達 min_ratio（且至少 2 頁）即視為頁首頁尾。
+    記憶體只保留視窗內的頁面。
+
+    Args:
+        pages: 頁面 iterator
+        window: 視窗大小（頁）
+        min_ratio: 判定為重複的最低出現比例
+    """
+    lookahead = max(1, window // 2)
+    lookback = max(1, window - lookahead)
+    counts: Counter = Counter()
+    history: deque = deque()
+    pending: deque = deque()
+
+    def emit() -> str:
+        page, keys = pending.popleft()
+        total = len(history) + len(pending) + 1
+        threshold = max(2, math.ceil(min_ratio * total))
+
+        lines = page.splitlines()
+        edge_idx = set(_edge_indices(lines))
+        kept = [
+            line for i, line in enumerate(lines)
+            if i not in edge_idx or counts[_normalize_line(line)] < threshold
+        ]
+
+        history.append(keys)
+        if len(history) > lookback:
+            old = history.popleft()
+            counts.subtract(old)
+            # 移除歸零的鍵值，計數表的大小只與視窗內的頁面有關
+            for key in old:
+                if counts[key] <= 0:
+                    del counts[key]
+        return "\n".join(kept)
+
+    for page in pages:
+        keys = _edge_keys(page)
+        counts.update(keys)
+        pending.append((page, keys))
+        if len(pending) > lookahead:
+            yield emit()
+
+    while pending:
+        yield emit()
+
+
+def drop_page_numbers(pages: Iterable[str]) -> Iterator[str]:
+    """移除頁面開頭或結尾單獨成行的頁碼（如 "12"、"Page 3 of 10"、"- 7 -"）"""
+    for page in pages:
+        lines = page.splitlines()
+        nonblank = [i for i, line in enumerate(lines) if line.strip()]
+        edge_idx = set(nonblank[:2] + nonblank[-2:])
+        yield "\n".join(
+            line for i, line in enumerate(lines)
+            if not (i in edge_idx and _PAGE_NUMBER.match(line))
+        )
+
+
+def _spellings(page: str):
+    """頁面中單字與同一行內連字號複合詞的出現次數（小寫）"""
+    return (Counter(word.lower() for word in _WORD.findall(page)),
+            Counter(word.lower() for word in _COMPOUND.findall(page)))
+
+
+def dehyphenate(pages: Iterable[str], skip: Collection[int] = (), window: int = 8) -> Iterator[str]:
+    """
+    處理行尾以連字號斷開的單字（下一行以小寫開頭時）
+
+    依前後各約 window/2 頁中的拼法決定："treat-\nment" 在鄰近頁面以 "treatment" 出現就合併，
+    以 "placebo-controlled" 出現就保留連字號只移除換行；鄰近頁面沒有線索時，
+    只有已知的複合詞保留連字號，其餘合併（"random-\nized" -> "randomized"）。
+    記憶體只保留視窗內的頁面與詞頻。
+
+    Args:
+        pages: 頁面 iterator
+        skip: 不處理的頁面索引（從 0 開始，例如 LLM 產生的頁面）
+        window: 視窗大小（頁）
+    """
+    lookahead = max(1, window // 2)
+    lookback = max(1, window - lookahead)
+    words: Counter = Counter()
+    compounds: Counter = Counter()
+    history: deque = deque()
+    pending: deque = deque()
+
+    def join(match: re.Match) -> str:
+        head, tail = match.group(1), match.group(2)
+        joined, compound = head + tail, f"{head}-{tail}"
+        seen_joined, seen_compound = words[joined.lower()], compounds[compound.lower()]
+        if seen_joined != seen_compound:
+            return joined if seen_joined > seen_compound else compound
+        if tail.lower() in _COMPOUND_TAILS or compound.lower() in _KNOWN_COMPOUNDS:
+            return compound
+        return joined
+
+    def emit() -> str:
+        index, page, counts = pending.popleft()
+        if index not in skip and "-\n" in page:
+            page = _HYPHEN_BREAK.sub(join, page)
+
+        history.append(counts)
+        if len(history) > lookback:
+            for counter, old in zip((words, compounds), history.popleft()):
+                counter.subtract(old)
+                # 移除歸零的詞，詞頻表的大小只與視窗內的詞彙有關
+                for word in old:
+                    if counter[word] <= 0:
+                        del counter[word]
+        return page
+
+    for index, page in enumerate(pages):
+        counts = _spellings(page)
+        words.update(counts[0])
+        compounds.update(counts[1])
+        pending.append((index, page, counts))
+        if len(pending) > lookahead:
+            yield emit()
+
+    while pending:
+        yield emit()
+
+
+def _is_table_row(line: str) -> bool:
+    stripped = line.strip()
+    return stripped.startswith("|") and stripped.count("|") >= 2
+
+
+def _split_cells(line: str) -> List[str]:
+    stripped = line.strip()
+    if stripped.startswith("|"):
+        stripped = stripped[1:]
+    if stripped.endswith("|"):
+        stripped = stripped[:-1]
+    return [cell.strip() for cell in stripped.split("|")]
+
+
+def _format_table(rows: List[str]) -> List[str]:
+    """整理一個表格區塊：統一欄位間距、補齊欄數、必要時插入分隔列"""
+    cells = [_split_cells(row) for row in rows]
+    has_separator = len(cells) > 1 and all(
+        _TABLE_SEPARATOR_CELL.match(cell) for cell in cells[1] if cell
+    ) and any(cells[1])
+    width = max(len(row) for row in cells)
+
+    formatted = []
+    for i, row in enumerate(cells):
+        row = row + [""] * (width - len(row))
+        if i == 1 and has_separator:
+            row = [cell if cell else "---" for cell in row]
+        formatted.append("| " + " | ".join(row) + " |")
+
+    if not has_separator:
+        formatted.insert(1, "| " + " | ".join(["---"] * width) + " |")
+    return formatted
+
+
+def normalize_tables(pages: Iterable[str]) -> Iterator[str]:
+    """修正表格：移除列與列之間的空行、統一儲存格間距、補齊欄數與分隔列"""
+    for page in pages:
+        if "|" not in page:
+            yield page
+            continue
+
+        lines = page.splitlines()
+        out: List[str] = []
+        i = 0
+        while i < len(lines):
+            if not _is_table_row(lines[i]):
+                out.append(lines[i])
+                i += 1
+                continue
+
+            rows = []
+            while i < len(lines):
+                if _is_table_row(lines[i]):
+                    rows.append(lines[i])
+                    i += 1
+                # 表格列之間夾雜的單一空行（MarkItDown 常見）
+                elif not lines[i].strip() and i + 1 < len(lines) and _is_table_row(lines[i + 1]):
+                    i += 1
+                else:
+                    break
+            out.extend(_format_table(rows) if len(rows) > 1 else rows)
+
+        yield "\n".join(out)
+
+
+def normalize_whitespace(pages: Iterable[str]) -> Iterator[str]:
+    """移除行尾空白與不換行空白，連續三個以上的換行合併為一個空行"""
+    for page in pages:
+        page = page.replace(" ", " ")
+        page = "\n".join(line.rstrip() for line in page.splitlines())
+        yield _BLANK_RUN.sub("\n\n", page).strip("\n")
+
+
+DEFAULT_PASSES: List[PagePass] = [
+    strip_running_headers,
+    drop_page_numbers,
+    dehyphenate,
+    normalize_tables,
+    normalize_whitespace,
+]
+
+
+def passes_for(engines: Sequence[Optional[str]]) -> List[PagePass]:
+    """
+    依各頁的來源引擎選擇處理步驟：LLM 產生的頁面不做斷字合併
+
+    Args:
+        engines: 各頁的引擎名稱（混合解析時各頁不同）
+    """
+    llm_pages = {i for i, engine in enumerate(engines) if engine in LLM_ENGINES}
+    if not llm_pages:
+        return DEFAULT_PASSES
+    if len(llm_pages) == len(engines):
+        return [step for step in DEFAULT_PASSES if step is not dehyphenate]
+    return [partial(dehyphenate, skip=llm_pages) if step is dehyphenate else step for step in DEFAULT_PASSES]
+
+
+def postprocess_pages(pages: Iterable[str], passes: List[PagePass] = None) -> Iterator[str]:
+    """
+    依序套用後處理步驟
+
+    Args:
+        pages: 頁面 Markdown iterator
+        passes: 處理步驟列表，預設為 DEFAULT_PASSES
+
+    Returns:
+        處理後的頁面 iterator（惰性求值，逐頁產生）
+    """
+    return reduce(lambda stream, step: step(stream), passes or DEFAULT_PASSES, iter(pages))
@@ -0,0 +1,80 @@
+"""
+逐頁分段預覽（Streamlit 大型文件）
+
+整份 Markdown 一次送進 st.markdown，500 頁以上的輸出會讓瀏覽器凍結；
+只顯示前 2000 字元又看不到後面的頁面，還可能在表格中間截斷。
+此模組把逐頁結果切成預覽段落，介面每次只渲染目前視窗內的幾段：
+- 以頁為單位；單頁過長時（例如本地解析未分頁、整份文件成為一頁）在空行處再切分
+- 切分只發生在段落之間，表格（連續的 | 列）與程式碼區塊不會被截斷
+- 全文搜尋回傳命中的段落，供跳頁使用
+
+渲染成本只與視窗大小有關，與文件總頁數無關。
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+# 單一預覽段落的字元上限（超過時在段落邊界切分）
+MAX_SECTION_CHARS = 12000
+
+
+def _split_page(text: str, max_chars: int) -> List[str]:
+    if len(text) <= max_chars:
+        return [text]
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    in_fence = False
+    for block in text.split("\n\n"):
+        # 單一段落（例如一個巨大的表格）本身超過上限時不再切分，維持結構完整；程式碼區塊內不切分
+        if current and not in_fence and size + len(block) > max_chars:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(block)
+        size += len(block) + 2
+        if block.count("```") % 2:
+            in_fence = not in_fence
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def preview_sections(pages: Sequence[str], max_chars: int = MAX_SECTION_CHARS,
+                     page_numbers: Optional[Sequence[int]] = None) -> List[Dict]:
+    """
+    將逐頁內容切成預覽段落
+
+    Args:
+        pages: 逐頁 Markdown
+        max_chars: 單一段落的字元上限
+        page_numbers: 各頁的原始頁碼（只解析部分頁面時），None 為依序從 1 開始
+
+    Returns:
+        依頁序排列的預覽段落：page（原始頁碼）/ part（該頁第幾段）/ parts（該頁共幾段）/ text
+    """
+    numbers = page_numbers if page_numbers and len(page_numbers) == len(pages) else range(1, len(pages) + 1)
+    sections = []
+    for number, text in zip(numbers, pages):
+        chunks = _split_page(text, max_chars)
+        sections.extend({"page": number, "part": part, "parts": len(chunks), "text": chunk}
+                        for part, chunk in enumerate(chunks, start=1))
+    return sections
+
+
+def section_label(section: Dict) -> str:
+    """段落的顯示名稱，例如「第 3 頁」或「第 1 頁（2/5）」"""
+    if section["parts"] == 1:
+        return f"第 {section['page']} 頁"
+    return f"第 {section['page']} 頁（{section['part']}/{section['parts']}）"
+
+
+def find_sections(sections: Sequence[Dict], query: str) -> List[int]:
+    """
+    搜尋預覽段落（不分大小寫）
+
+    Returns:
+        命中段落的索引
+    """
+    needle = query.strip().lower()
+    if not needle:
+        return []
+    return [i for i, section in enumerate(sections) if needle in section["text"].lower()]
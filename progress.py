@@ -0,0 +1,260 @@
+"""
+解析進度事件
+
+解析層在狀態改變時發出事件（不需要 UI 輪詢）：
+- submit：頁面送出解析（含使用的引擎）
+- complete：頁面完成
+- engine：目前使用的引擎改變
+- fallback：觸發備援（例如 LlamaParse 逾時改用 MarkItDown）
+- tick：等待遠端結果期間的時間更新（由既有的時限輪詢觸發，不另外輪詢）
+
+ETA 以已觀察到的每頁耗時計算；尚無完成頁面時，使用同一引擎先前的每頁耗時。
+Streamlit 以事件更新進度條，批次模式則輸出精簡的狀態行。
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import tracing
+
+ProgressListener = Callable[[Dict], None]
+
+# 尚未觀察到任何頁面時的每頁耗時估計（秒）
+DEFAULT_SECONDS_PER_PAGE = {
+    "LlamaParse": 6.0,
+    "MarkItDown": 0.3,
+    "PyMuPDF": 0.05,
+}
+
+
+class ProgressTracker:
+    """
+    追蹤頁面送出與完成的數量，並將事件傳給監聽者
+
+    Args:
+        listener: 接收事件字典的函數（可選，也可之後以 add_listener 加入）
+        seconds_per_page: 各引擎的每頁耗時估計，覆寫 DEFAULT_SECONDS_PER_PAGE
+        clock: 時間來源
+    """
+
+    def __init__(self, listener: Optional[ProgressListener] = None,
+                 seconds_per_page: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.listeners: List[ProgressListener] = [listener] if listener else []
+        self.seconds_per_page = {**DEFAULT_SECONDS_PER_PAGE, **(seconds_per_page or {})}
+        self.clock = clock
+        self.started = clock()
+        self.engine: Optional[str] = None
+        self.document: Optional[str] = None
+        self.pages_submitted = 0
+        self.pages_completed = 0
+        self.documents_submitted = 0
+        self.documents_completed = 0
+        self.fallbacks: List[Dict] = []
+        # 各引擎實際完成的頁數與耗時，用於更新每頁耗時估計
+        self._engine_pages: Dict[str, int] = {}
+        self._engine_seconds: Dict[str, float] = {}
+        self._engine_started: Optional[float] = None
+        self._switched = False
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: ProgressListener) -> None:
+        self.listeners.append(listener)
+
+    def elapsed(self) -> float:
+        return self.clock() - self.started
+
+    def _waited(self) -> float:
+        return self.clock() - (self._engine_started or self.started)
+
+    def rate(self) -> Optional[float]:
+        """
+        目前的每頁耗時（秒）
+
+        穩定狀態下為實際吞吐量（已耗時 / 已完成頁數，並行時自然反映 worker 數）；
+        剛切換引擎、尚無該引擎的完成頁面時，使用該引擎的每頁耗時估計。
+        """
+        if self.pages_completed and not self._switched:
+            return self.elapsed() / self.pages_completed
+        return self.seconds_per_page.get(self.engine or "")
+
+    def eta(self) -> Optional[float]:
+        """剩餘時間估計（秒）"""
+        remaining = self.pages_submitted - self.pages_completed
+        if remaining <= 0:
+            return 0.0
+        rate = self.rate()
+        if rate is None:
+            return None
+        if self.pages_completed and not self._switched:
+            return remaining * rate
+        # 等待新引擎的第一批結果：估計總時間扣除已等待的時間
+        return max(0.0, remaining * rate - self._waited())
+
+    def fraction(self) -> float:
+        """完成比例（0–1）；等待結果期間依已等待時間與 ETA 推估，未完成前不超過 0.95"""
+        if not self.pages_submitted:
+            return 0.0
+        remaining = self.pages_submitted - self.pages_completed
+        if remaining <= 0:
+            return 1.0
+        partial = 0.0
+        eta = self.eta()
+        if self._switched and eta is not None:
+            waited = self._waited()
+            partial = waited / (waited + eta) if waited + eta > 0 else 0.0
+        done = self.pages_completed + remaining * partial
+        return min(0.95, done / self.pages_submitted)
+
+    def snapshot(self, event: str, message: Optional[str] = None) -> Dict:
+        return {
+            "event": event,
+            "document": self.document,
+            "engine": self.engine,
+            "pages_submitted": self.pages_submitted,
+            "pages_completed": self.pages_completed,
+            "documents_submitted": self.documents_submitted,
+            "documents_completed": self.documents_completed,
+            "fallbacks": len(self.fallbacks),
+            "elapsed": self.elapsed(),
+            "seconds_per_page": self.rate(),
+            "eta": self.eta(),
+            "fraction": self.fraction(),
+            "message": message,
+        }
+
+    def _emit(self, event: str, message: Optional[str] = None) -> None:
+        snapshot = self.snapshot(event, message)
+        for listener in self.listeners:
+            listener(snapshot)
+
+    def submit(self, pages: int, engine: Optional[str] = None, document: Optional[str] = None) -> None:
+        """頁面送出解析；document 不為 None 時同時計為一份新文件"""
+        with self._lock:
+            self.pages_submitted += pages or 0
+            if document is not None:
+                self.document = document
+                self.documents_submitted += 1
+            if engine and (engine != self.engine or not self.pages_completed):
+                self.engine = engine
+                self._engine_started = self.clock()
+                self._switched = True
+        self._emit("submit")
+
+    def complete(self, pages: Optional[int] = None, engine: Optional[str] = None,
+                 document: Optional[str] = None, seconds: Optional[float] = None) -> None:
+        """
+        頁面完成
+
+        Args:
+            pages: 完成的頁數，None 為所有尚未完成的頁面
+            engine: 處理這些頁面的引擎
+            document: 完成的文件（不為 None 時計為一份完成的文件）
+            seconds: 這些頁面的實際耗時，用於更新該引擎的每頁耗時估計
+        """
+        with self._lock:
+            if pages is None:
+                pages = max(0, self.pages_submitted - self.pages_completed)
+            self.pages_completed += pages
+            if document is not None:
+                self.document = document
+                self.documents_completed += 1
+            self._switched = False
+            if engine:
+                self.engine = engine
+            engine = self.engine
+            if engine and pages and seconds is not None:
+                self._engine_pages[engine] = self._engine_pages.get(engine, 0) + pages
+                self._engine_seconds[engine] = self._engine_seconds.get(engine, 0.0) + seconds
+                self.seconds_per_page[engine] = self._engine_seconds[engine] / self._engine_pages[engine]
+        self._emit("complete")
+
+    def set_engine(self, engine: str, message: Optional[str] = None) -> None:
+        """目前使用的引擎改變（例如本地優先模式開始送出難頁）"""
+        with self._lock:
+            self.engine = engine
+            self._engine_started = self.clock()
+            self._switched = True
+        self._emit("engine", message)
+
+    def fallback(self, from_engine: str, to_engine: str, reason: str,
+                 document: Optional[str] = None) -> None:
+        """觸發備援：後續頁面改由 to_engine 處理"""
+        with self._lock:
+            self.fallbacks.append({"from_engine": from_engine, "to_engine": to_engine,
+                                   "reason": reason, "document": document or self.document})
+            self.engine = to_engine
+            self._engine_started = self.clock()
+            self._switched = True
+        self._emit("fallback", f"{from_engine} → {to_engine}: {reason}")
+
+    def tick(self, *_args) -> None:
+        """等待期間更新時間與 ETA（可直接作為 Deadline 的 on_poll）"""
+        self._emit("tick")
+
+    def observed_rates(self) -> Dict[str, float]:
+        """實際觀察到的各引擎每頁耗時，可作為下一次的 seconds_per_page"""
+        return {engine: self._engine_seconds[engine] / pages
+                for engine, pages in self._engine_pages.items() if pages}
+
+
+def tracked(progress: ProgressTracker, engine: str, parse: Callable[[], Dict],
+            pages: Optional[int] = None) -> Dict:
+    """
+    以進度事件包裝一次解析呼叫：切換到 engine，成功時將頁面標記為完成並記錄每頁耗時；
+    每次呼叫記錄為一個 span（名稱為引擎名稱小寫，失敗時附上 error_type）
+
+    Args:
+        progress: 進度追蹤器
+        engine: 引擎名稱
+        parse: 執行解析的函數，回傳結果字典（含 success）
+        pages: 這次解析涵蓋的頁數，None 為所有尚未完成的頁面
+    """
+    if progress.engine != engine:
+        progress.set_engine(engine)
+    start_time = time.time()
+    with tracing.span(engine.lower(), pages=pages) as record:
+        result = parse()
+        if result.get("pages"):
+            record["attributes"]["pages"] = result["pages"]
+        if not result.get("success"):
+            record["status"] = "error"
+            record["attributes"].update(error_type=result.get("error_type", "unknown"), error=result.get("error"))
+    if result.get("success"):
+        progress.complete(pages, engine, seconds=time.time() - start_time)
+    return result
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+def format_status_line(event: Dict) -> str:
+    """
+    精簡的單行狀態，例如：
+    [3/12 docs] 45/310 pages | LlamaParse | 2.1 s/page | elapsed 01:34 | ETA 09:16 | 1 fallback
+    """
+    parts = []
+    if event["documents_submitted"]:
+        parts.append(f"[{event['documents_completed']}/{event['documents_submitted']} docs] "
+                     f"{event['pages_completed']}/{event['pages_submitted']} pages")
+    else:
+        parts.append(f"{event['pages_completed']}/{event['pages_submitted']} pages")
+    if event["engine"]:
+        parts.append(event["engine"])
+    if event["seconds_per_page"] is not None:
+        parts.append(f"{event['seconds_per_page']:.1f} s/page")
+    parts.append(f"elapsed {format_duration(event['elapsed'])}")
+    parts.append(f"ETA {format_duration(event['eta'])}")
+    if event["fallbacks"]:
+        parts.append(f"{event['fallbacks']} fallback{'s' if event['fallbacks'] > 1 else ''}")
+    line = " | ".join(parts)
+    if event.get("message"):
+        line += f" - {event['message']}"
+    return line
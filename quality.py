@@ -0,0 +1,158 @@
+"""
+逐頁輸出品質評分（本地優先、低品質頁面送 LlamaParse）
+
+本地解析（MarkItDown / PyMuPDF）對純文字頁面通常已足夠，問題集中在少數頁面：
+掃描頁（沒有文字層）、字型編碼錯誤造成的亂碼、以及版面複雜而被打散的表格。
+此模組以便宜的文字統計為每頁評分，只把低於門檻的頁面送去遠端多模態解析：
+- 文字密度：可讀字元過少（掃描頁、整頁圖表）
+- 亂碼比例：替換字元、pdfminer 的 (cid:N)、私用區與控制字元
+- 空白頁
+- 表格列欄數不一致（表格結構被打散）
+
+評分只依賴頁面 Markdown 本身，每頁為線性時間。
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence
+
+# 低於此分數的頁面送遠端解析
+QUALITY_THRESHOLD = 0.6
+
+# 可讀字元少於此數視為文字密度不足（一般期刊內文頁約 2000–5000 字元）
+MIN_TEXT_CHARS = 200
+
+_CID = re.compile(r"\(cid:\d+\)")
+_READABLE = re.compile(r"[^\W_]", re.UNICODE)
+
+
+def _is_garbled_char(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        ch == "\ufffd"
+        or 0xE000 <= code <= 0xF8FF  # 私用區（未對應的字型字元）
+        or (code < 32 and ch not in "\n\r\t\f")
+    )
+
+
+def _table_row_cells(line: str) -> int:
+    stripped = line.strip().strip("|")
+    return stripped.count("|") + 1
+
+
+def _broken_table_rows(lines: List[str]) -> tuple:
+    """回傳 (表格列數, 欄數與表頭不一致的列數)"""
+    rows = broken = 0
+    header_cells: Optional[int] = None
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("|") and stripped.count("|") >= 2:
+            cells = _table_row_cells(stripped)
+            rows += 1
+            if header_cells is None:
+                header_cells = cells
+            elif cells != header_cells:
+                broken += 1
+        else:
+            header_cells = None
+    return rows, broken
+
+
+def score_page(markdown: str, min_text_chars: int = MIN_TEXT_CHARS) -> Dict:
+    """
+    評估單頁解析品質
+
+    Args:
+        markdown: 該頁的 Markdown
+        min_text_chars: 文字密度門檻
+
+    Returns:
+        評分字典：score（0–1）/ text_chars / garbled_ratio / table_rows / broken_table_rows / reasons
+    """
+    text = markdown or ""
+    readable = len(_READABLE.findall(text))
+    cid_chars = sum(len(m) for m in _CID.findall(text))
+    garbled = cid_chars + sum(1 for ch in text if _is_garbled_char(ch))
+    garbled_ratio = garbled / max(1, readable + garbled)
+    table_rows, broken_rows = _broken_table_rows(text.splitlines())
+
+    reasons = []
+    if readable == 0:
+        score = 0.0
+        reasons.append("empty")
+    else:
+        # 各項指標取乘積：任何一項很差都會讓整頁低於門檻
+        density = min(1.0, readable / min_text_chars)
+        garbled_factor = max(0.0, 1.0 - 5 * garbled_ratio)
+        table_factor = 1.0 - 0.5 * (broken_rows / table_rows) if table_rows else 1.0
+        score = density * garbled_factor * table_factor
+
+        if density < 1.0:
+            reasons.append("low_text_density")
+        if garbled_ratio > 0.02:
+            reasons.append("garbled")
+        if table_rows and broken_rows:
+            reasons.append("broken_table")
+
+    return {
+        "score": round(score, 3),
+        "text_chars": readable,
+        "garbled_ratio": round(garbled_ratio, 4),
+        "table_rows": table_rows,
+        "broken_table_rows": broken_rows,
+        "reasons": reasons,
+    }
+
+
+def score_pages(pages: Sequence[str], min_text_chars: int = MIN_TEXT_CHARS) -> List[Dict]:
+    """逐頁評分"""
+    return [score_page(page, min_text_chars) for page in pages]
+
+
+def pages_to_escalate(scores: Sequence[Dict], threshold: float = QUALITY_THRESHOLD) -> List[int]:
+    """低於門檻的頁碼（從 1 開始）"""
+    return [i + 1 for i, s in enumerate(scores) if s["score"] < threshold]
+
+
+def target_pages_arg(pages: Sequence[int]) -> str:
+    """LlamaParse target_pages 參數（從 0 開始、以逗號分隔）"""
+    return ",".join(str(page - 1) for page in pages)
+
+
+def merge_pages(local_pages: Sequence[str], local_engine: str, scores: Sequence[Dict],
+                remote_pages: Dict[int, str], remote_engine: str,
+                remote_model: Optional[str]) -> tuple:
+    """
+    合併本地與遠端頁面，並產生逐頁來源記錄
+
+    Args:
+        local_pages: 本地解析的頁面
+        local_engine: 本地引擎名稱
+        scores: score_pages 的結果
+        remote_pages: 遠端解析成功的頁面 {頁碼: Markdown}
+        remote_engine / remote_model: 遠端引擎與模型
+
+    Returns:
+        (合併後的頁面列表, 逐頁來源記錄列表)；來源記錄包含 engine / model / quality
+    """
+    merged = []
+    provenance = []
+    for i, page in enumerate(local_pages):
+        number = i + 1
+        quality = scores[i]
+        if number in remote_pages:
+            merged.append(remote_pages[number])
+            provenance.append({"engine": remote_engine, "model": remote_model,
+                               "quality": {**quality, "escalated": True}})
+        else:
+            merged.append(page)
+            provenance.append({"engine": local_engine, "model": None,
+                               "quality": {**quality, "escalated": False}})
+    return merged, provenance
+
+
+def summarize_provenance(provenance: Sequence[Dict]) -> Dict:
+    """各引擎處理的頁數，例如 {"MarkItDown": 18, "LlamaParse": 2}"""
+    counts: Dict[str, int] = {}
+    for entry in provenance:
+        counts[entry["engine"]] = counts.get(entry["engine"], 0) + 1
+    return counts
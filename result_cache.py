@@ -0,0 +1,208 @@
+"""
+解析結果快取（Streamlit 各 session 共用）
+
+Streamlit 每次互動（點下載按鈕、調整側邊欄）都會重新執行整個腳本，
+結果若只存在按鈕分支內就會消失；不同 session 開啟同一篇論文也會重新送 LlamaParse / MarkItDown。
+此模組提供 process 層級、有容量上限的結果快取：
+- 鍵：檔案內容 SHA-256 + 解析模式 + 模型 + 提示詞 + 其他影響輸出的設定
+- 記憶體層：LRU，依筆數與序列化後的大小限制
+- 磁碟層（可選）：每筆一個壓縮的 JSON 檔（<鍵>.json.zst，沒有 zstd 時為 .json.gz），
+  依總大小（壓縮後）淘汰最久未使用者；伺服器重啟後仍可命中。舊版未壓縮的 <鍵>.json 仍可讀取
+
+只快取完整成功的結果；取消、逾時或備援產生的結果不寫入，避免暫時性問題被固定下來。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from atomic_io import AtomicWriter
+from compressed_store import CODECS, DEFAULT_CODEC, compress, decompress, find_compressed
+
+# 記憶體層上限
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 磁碟層上限與位置（PDF2MD_CACHE_DIR 設為空字串時停用磁碟層）
+DEFAULT_MAX_DISK_BYTES = 1024 * 1024 * 1024
+DEFAULT_CACHE_DIR = os.environ.get("PDF2MD_CACHE_DIR", ".parse_cache")
+
+
+def file_hash(data) -> str:
+    """上傳內容（bytes / memoryview）的 SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_key(content_hash: str, mode: str, model: str, settings: Optional[Dict] = None) -> str:
+    """
+    組合快取鍵
+
+    Args:
+        content_hash: 檔案內容的 SHA-256
+        mode: 解析模式
+        model: Gemini 模型
+        settings: 其他影響輸出的設定（提示詞、品質門檻、上傳最佳化等），需可序列化為 JSON
+    """
+    payload = json.dumps({"file": content_hash, "mode": mode, "model": model, "settings": settings or {}},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    執行緒安全、有容量上限的解析結果快取
+
+    Args:
+        max_entries: 記憶體層最多筆數
+        max_bytes: 記憶體層序列化後的總大小上限
+        directory: 磁碟層目錄，None 為只用記憶體
+        max_disk_bytes: 磁碟層總大小上限
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 directory: Optional[str] = None, max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, Tuple[Dict, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    @staticmethod
+    def _is_entry(name: str) -> bool:
+        return name.endswith(".json") or any(name.endswith(".json" + suffix) for suffix in CODECS.values())
+
+    def _remember(self, key: str, result: Dict, size: int) -> None:
+        # 呼叫端持有 _lock
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+
+    def _read_disk(self, key: str) -> Optional[Tuple[Dict, int]]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        found = find_compressed(path)
+        try:
+            if found is not None:
+                path, codec = found
+                with open(path, "rb") as f:
+                    data = decompress(f.read(), codec)
+            else:
+                with open(path, "rb") as f:
+                    data = f.read()
+            result = json.loads(data)
+        except (OSError, ValueError, EOFError):
+            return None
+        # 更新 mtime，磁碟層依最近使用時間淘汰
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result, len(data)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """取得快取結果（淺複本），沒有時為 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+
+        loaded = self._read_disk(key)
+        with self._lock:
+            if loaded is None:
+                self.misses += 1
+                return None
+            self._remember(key, *loaded)
+            self.hits += 1
+            return dict(loaded[0])
+
+    def put(self, key: str, result: Dict) -> None:
+        """寫入成功的解析結果（需可序列化為 JSON）"""
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._remember(key, result, len(data))
+
+        if self.directory:
+            stored = compress(data, DEFAULT_CODEC)
+            if len(stored) > self.max_disk_bytes:
+                return
+            try:
+                with AtomicWriter(self._path(key) + CODECS[DEFAULT_CODEC]) as f:
+                    f.write(stored)
+                self._evict_disk()
+            except OSError:
+                # 磁碟層只是加速，寫入失敗時保留記憶體層即可
+                pass
+
+    def _evict_disk(self) -> None:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if self._is_entry(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        """清除記憶體層與磁碟層"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if self._is_entry(name):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        pass
+
+    def stats(self) -> Dict:
+        """命中統計與目前用量"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+_shared_cache: Optional[ResultCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache(directory: Optional[str] = DEFAULT_CACHE_DIR) -> ResultCache:
+    """
+    取得 process 層級共用的結果快取（供 Streamlit 多個 session 共用）
+
+    Args:
+        directory: 第一次建立時的磁碟層目錄，None 或空字串為只用記憶體
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResultCache(directory=directory or None)
+        return _shared_cache
@@ -0,0 +1,241 @@
+"""
+批次處理的工作排程
+
+`os.listdir` 的順序與文件大小無關，排在前面的 600 頁教科書會拖慢後面所有短篇論文。
+此模組：
+- 以頁數與檔案大小估計工作成本（頁數只讀取 PDF 的 xref／頁面樹，不解析內容）；
+  指定頁面範圍（--pages）時以選取的頁數計算，進度與 ETA 也只計入這些頁面
+- 支援 fifo、最短工作優先（sjf）與優先等級（priority）三種排序
+- aging：等待越久的工作有效成本越低，大型工作不會被持續插隊而餓死
+- 並行時保留部分通道給大型工作（由大到小），其餘通道跑小型工作，降低平均完成時間與尾端延遲
+"""
+
+import heapq
+import itertools
+import os
+import re
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from page_ranges import parse_page_ranges
+
+# 成本估計：每頁與每 MB（上傳）的相對秒數
+PAGE_COST = 1.0
+MB_COST = 0.5
+
+# 優先等級（priority 排序）：小於等於此頁數為 0、1，其餘為 2
+PRIORITY_CLASSES = (20, 100)
+
+_COUNT = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b", re.S)
+
+
+def _count_pages_raw(file_path: str, chunk_size: int = 1 << 20) -> Optional[int]:
+    """
+    不依賴 PyMuPDF 的頁數估計：掃描頁面樹節點的 /Count，取最大值（即根節點）
+
+    壓縮的 object stream 中的頁面樹無法以此方式讀取，此時回傳 None。
+    """
+    best = None
+    tail = b""
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            data = tail + chunk
+            for match in _COUNT.finditer(data):
+                count = int(match.group(1) or match.group(2))
+                best = count if best is None else max(best, count)
+            tail = data[-256:]
+    return best
+
+
+def count_pdf_pages(file_path: str) -> Optional[int]:
+    """讀取 PDF 頁數：優先使用 PyMuPDF（只讀 xref），否則掃描頁面樹"""
+    try:
+        import fitz  # PyMuPDF
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    except ImportError:
+        pass
+    except Exception:
+        return None
+
+    try:
+        return _count_pages_raw(file_path)
+    except OSError:
+        return None
+
+
+def estimate_job(file_path: str, page_ranges: Optional[str] = None) -> Dict:
+    """
+    估計單一 PDF 的處理成本
+
+    Args:
+        file_path: PDF 路徑
+        page_ranges: 頁面範圍（例如 "1-3,12-"），只計入選取的頁面
+
+    Returns:
+        工作字典：path / pages / size_bytes / cost / priority
+    """
+    size_bytes = os.path.getsize(file_path)
+    pages = count_pdf_pages(file_path)
+    if pages is None:
+        # 無法讀取頁數時，以平均每頁 100 KB 粗估
+        pages = max(1, size_bytes // (100 * 1024))
+    if page_ranges:
+        try:
+            selected = len(parse_page_ranges(page_ranges, pages))
+        except ValueError:
+            # 範圍不在文件內：處理時會略過，成本沿用整份文件
+            selected = pages
+        # 上傳成本依選取的比例分攤
+        size_bytes = size_bytes * selected // pages
+        pages = selected
+
+    priority = len(PRIORITY_CLASSES)
+    for level, limit in enumerate(PRIORITY_CLASSES):
+        if pages <= limit:
+            priority = level
+            break
+
+    return {
+        "path": file_path,
+        "pages": pages,
+        "size_bytes": size_bytes,
+        "cost": pages * PAGE_COST + size_bytes / (1024 * 1024) * MB_COST,
+        "priority": priority,
+    }
+
+
+class JobScheduler:
+    """
+    工作排程器
+
+    aging 的有效成本為 cost - aging_rate × 等待秒數；因為所有工作的等待時間以相同速率增加，
+    排序鍵可化為 cost + aging_rate × 加入時間，以 heap 維持 O(log n) 的取出。
+
+    Args:
+        policy: "fifo"、"sjf" 或 "priority"（先依優先等級，同等級內最短優先）
+        aging_rate: 每等待一秒抵銷的成本
+        large_lanes: 並行時保留給大型工作的通道數（0 為不保留）
+        large_threshold: 成本高於此值視為大型工作，預設為優先等級上限對應的成本
+        clock: 時間來源
+    """
+
+    def __init__(self, policy: str = "sjf", aging_rate: float = 0.0, large_lanes: int = 0,
+                 large_threshold: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if policy not in ("fifo", "sjf", "priority"):
+            raise ValueError(f"未知的排程策略: {policy}")
+        self.policy = policy
+        self.aging_rate = aging_rate
+        self.large_lanes = large_lanes
+        self.large_threshold = large_threshold if large_threshold is not None else PRIORITY_CLASSES[-1] * PAGE_COST
+        self.clock = clock
+        self._counter = itertools.count()
+        self._small: List = []
+        self._large: List = []
+        self._running: Dict[str, Dict] = {}
+        self._removed: set = set()
+        self._discarded: set = set()
+        self._pending = 0
+        self.completed: List[Dict] = []
+
+    def _key(self, job: Dict) -> tuple:
+        order = next(self._counter)
+        if self.policy == "fifo":
+            return (0, order, order)
+        aged = job["cost"] + self.aging_rate * job["enqueued_at"]
+        level = job["priority"] if self.policy == "priority" else 0
+        return (level, aged, order)
+
+    def add(self, job: Dict) -> None:
+        """加入一個工作（estimate_job 的結果）"""
+        job = {**job, "enqueued_at": self.clock()}
+        self._pending += 1
+        heapq.heappush(self._small, (self._key(job), job))
+        if self.large_lanes and job["cost"] > self.large_threshold:
+            # 大型通道由大到小，讓最長的工作最早開始、與小型工作並行
+            heapq.heappush(self._large, ((-job["cost"], next(self._counter)), job))
+
+    def add_paths(self, file_paths: Iterable[str], page_ranges: Optional[str] = None) -> None:
+        for file_path in file_paths:
+            self.add(estimate_job(file_path, page_ranges))
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def _pop(self, heap: List) -> Optional[Dict]:
+        # 同一個工作同時在兩個 heap 中，被另一邊取走的以 lazy deletion 略過
+        while heap:
+            _, job = heapq.heappop(heap)
+            if job["path"] in self._discarded:
+                continue
+            if job["path"] in self._removed:
+                self._removed.discard(job["path"])
+                continue
+            return job
+        return None
+
+    def next_job(self) -> Optional[Dict]:
+        """取出下一個要執行的工作，並標記為執行中"""
+        running_large = sum(1 for job in self._running.values() if job["cost"] > self.large_threshold)
+        job = None
+        if self.large_lanes and running_large < self.large_lanes:
+            job = self._pop(self._large)
+        if job is None:
+            job = self._pop(self._small)
+        if job is None:
+            return None
+        self._pending -= 1
+
+        if self.large_lanes and job["cost"] > self.large_threshold:
+            # 另一個 heap 中的同一工作待取出時略過
+            self._removed.add(job["path"])
+        job["started_at"] = self.clock()
+        self._running[job["path"]] = job
+        return job
+
+    def finish(self, file_path: str) -> Optional[Dict]:
+        """標記工作完成，回傳含等待與執行時間的工作字典"""
+        job = self._running.pop(file_path, None)
+        if job is not None:
+            job["finished_at"] = self.clock()
+            self.completed.append(job)
+        return job
+
+    def pending_jobs(self) -> List[Dict]:
+        """尚未開始的工作（依排程順序）"""
+        return [job for _, job in sorted(self._small)
+                if job["path"] not in self._removed and job["path"] not in self._discarded]
+
+    def discard(self, file_path: str) -> None:
+        """移除尚未開始的工作（例如超過大小限制而拒絕處理）"""
+        if file_path not in self._discarded and any(job["path"] == file_path for _, job in self._small):
+            self._discarded.add(file_path)
+            self._pending -= 1
+
+    def drain(self, to_task: Callable[[Dict], object] = lambda job: job["path"]) -> Iterator[object]:
+        """
+        依排程順序逐一產生任務（惰性；每次被取用時才決定下一個工作）
+
+        Args:
+            to_task: 將工作字典轉成任務參數
+        """
+        while True:
+            job = self.next_job()
+            if job is None:
+                return
+            yield to_task(job)
+
+
+def order_paths(file_paths: Iterable[str], policy: str = "sjf", aging_rate: float = 0.0) -> List[str]:
+    """序列處理用：依排程策略排序檔案路徑"""
+    scheduler = JobScheduler(policy, aging_rate=aging_rate)
+    scheduler.add_paths(file_paths)
+    ordered = []
+    for path in scheduler.drain():
+        scheduler.finish(path)
+        ordered.append(path)
+    return ordered
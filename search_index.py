@@ -0,0 +1,208 @@
+"""
+已解析文件的全文檢索索引（SQLite FTS5）
+
+- 以頁為單位建立索引：有 .pages.jsonl 時逐頁索引，否則整份 .md 視為單一頁（page = 0）
+- 增量更新：只重新索引修改時間或大小改變的輸出，已刪除的輸出會從索引移除
+- 已封存（.md.gz / .md.zst）的輸出以原本的 .md 路徑索引，讀取時自動解壓
+- 查詢可回傳頁層級結果，或依文件彙整
+"""
+
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Tuple
+
+from compressed_store import CODECS, available_codecs, exists, logical_path, read_text, stored_path
+from page_store import iter_pages, pages_path_for
+
+INDEX_FILENAME = "search_index.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    title TEXT,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    pages INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    content,
+    doc_id UNINDEXED,
+    page UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def default_index_path(output_dir: str) -> str:
+    """輸出目錄下的預設索引路徑"""
+    return os.path.join(output_dir, INDEX_FILENAME)
+
+
+def open_index(db_path: str) -> sqlite3.Connection:
+    """開啟（必要時建立）索引資料庫"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _iter_document_pages(md_path: str) -> Iterator[Tuple[int, str]]:
+    """依序產生 (頁碼, 內容)，優先使用逐頁 JSONL"""
+    pages_path = pages_path_for(md_path)
+    if exists(pages_path):
+        for record in iter_pages(pages_path):
+            yield record["page"], record.get("markdown", "")
+    else:
+        yield 0, read_text(md_path)
+
+
+def _index_document(conn: sqlite3.Connection, md_path: str, stat: os.stat_result) -> None:
+    """（重新）索引單一文件"""
+    row = conn.execute("SELECT id FROM documents WHERE path = ?", (md_path,)).fetchone()
+    if row:
+        doc_id = row["id"]
+        conn.execute("DELETE FROM pages_fts WHERE doc_id = ?", (doc_id,))
+    else:
+        title = os.path.splitext(os.path.basename(md_path))[0]
+        cursor = conn.execute(
+            "INSERT INTO documents (path, title, mtime_ns, size, pages) VALUES (?, ?, 0, 0, 0)",
+            (md_path, title)
+        )
+        doc_id = cursor.lastrowid
+
+    count = 0
+    for page, content in _iter_document_pages(md_path):
+        conn.execute(
+            "INSERT INTO pages_fts (content, doc_id, page) VALUES (?, ?, ?)",
+            (content, doc_id, page)
+        )
+        count += 1
+
+    conn.execute(
+        "UPDATE documents SET mtime_ns = ?, size = ?, pages = ? WHERE id = ?",
+        (stat.st_mtime_ns, stat.st_size, count, doc_id)
+    )
+
+
+def update_index(db_path: str, output_dir: str) -> Dict[str, int]:
+    """
+    增量更新索引
+
+    Args:
+        db_path: 索引資料庫路徑
+        output_dir: 解析結果目錄（*.md）
+
+    Returns:
+        統計字典：added / updated / removed / unchanged
+    """
+    stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    conn = open_index(db_path)
+    try:
+        known = {
+            row["path"]: (row["mtime_ns"], row["size"])
+            for row in conn.execute("SELECT path, mtime_ns, size FROM documents")
+        }
+
+        # 未壓縮的 .md 與封存的 .md.gz / .md.zst 都以 .md 路徑索引
+        suffixes = tuple(".md" + CODECS[codec] for codec in available_codecs())
+        documents = sorted({logical_path(os.path.join(output_dir, filename))
+                            for filename in os.listdir(output_dir)
+                            if filename.endswith(".md") or filename.endswith(suffixes)})
+
+        seen = set()
+        with conn:
+            for md_path in documents:
+                seen.add(md_path)
+                stat = os.stat(stored_path(md_path))
+
+                # .md 與 .pages.jsonl 都可能被改寫，以較新者為準
+                pages_path = pages_path_for(md_path)
+                if exists(pages_path):
+                    pages_stat = os.stat(stored_path(pages_path))
+                    if pages_stat.st_mtime_ns > stat.st_mtime_ns:
+                        stat = pages_stat
+
+                previous = known.get(md_path)
+                if previous == (stat.st_mtime_ns, stat.st_size):
+                    stats["unchanged"] += 1
+                    continue
+
+                _index_document(conn, md_path, stat)
+                stats["updated" if previous else "added"] += 1
+
+            for md_path in set(known) - seen:
+                row = conn.execute("SELECT id FROM documents WHERE path = ?", (md_path,)).fetchone()
+                conn.execute("DELETE FROM pages_fts WHERE doc_id = ?", (row["id"],))
+                conn.execute("DELETE FROM documents WHERE id = ?", (row["id"],))
+                stats["removed"] += 1
+    finally:
+        conn.close()
+
+    return stats
+
+
+def to_fts_query(query: str) -> str:
+    """將一般關鍵字轉為 FTS5 查詢：每個詞加上引號，避免 '-'、':' 等被當成語法"""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"' for term in terms if term)
+
+
+def search(db_path: str, query: str, limit: int = 20, by_document: bool = False,
+           raw: bool = False) -> List[Dict]:
+    """
+    全文檢索
+
+    Args:
+        db_path: 索引資料庫路徑
+        query: 查詢字串（多個詞為 AND）
+        limit: 最多回傳筆數
+        by_document: 是否依文件彙整（每份文件只回傳最佳的一頁）
+        raw: 直接使用 FTS5 查詢語法（NEAR、OR、前綴 * 等）
+
+    Returns:
+        結果列表，每筆包含 path / title / page / snippet / score
+    """
+    fts_query = query if raw else to_fts_query(query)
+    if not fts_query:
+        return []
+
+    conn = open_index(db_path)
+    try:
+        if by_document:
+            # bm25() 不能在聚合中直接使用，先物化每頁分數再依文件取最佳頁；
+            # snippet 只為最後留下的頁面計算（SQLite bare column 規則：MIN() 時 rid 取自同一列）
+            sql = """
+                WITH hits AS MATERIALIZED (
+                    SELECT rowid AS rid, doc_id, bm25(pages_fts) AS score
+                    FROM pages_fts WHERE pages_fts MATCH ?
+                ),
+                best AS (
+                    SELECT rid, MIN(score) AS score, COUNT(*) AS hits
+                    FROM hits GROUP BY doc_id ORDER BY score LIMIT ?
+                )
+                SELECT documents.path AS path, documents.title AS title, pages_fts.page AS page,
+                       snippet(pages_fts, 0, '**', '**', '…', 16) AS snippet,
+                       best.score AS score, best.hits AS hits
+                FROM best
+                JOIN pages_fts ON pages_fts.rowid = best.rid
+                JOIN documents ON documents.id = pages_fts.doc_id
+                WHERE pages_fts MATCH ?
+                ORDER BY best.score
+            """
+            params = (fts_query, limit, fts_query)
+        else:
+            sql = """
+                SELECT documents.path AS path, documents.title AS title, pages_fts.page AS page,
+                       snippet(pages_fts, 0, '**', '**', '…', 16) AS snippet,
+                       bm25(pages_fts) AS score
+                FROM pages_fts JOIN documents ON documents.id = pages_fts.doc_id
+                WHERE pages_fts MATCH ?
+                ORDER BY score LIMIT ?
+            """
+            params = (fts_query, limit)
+
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
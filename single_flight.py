@@ -0,0 +1,234 @@
+"""
+相同解析請求的合併（single-flight）
+
+新指引發布時，多位使用者常在幾分鐘內上傳同一份 PDF，每次上傳都各自送出 LlamaParse 工作。
+此模組以「檔案內容雜湊 + 引擎設定」為鍵，合併進行中的相同請求：
+- 第一個請求（leader）實際解析；同時到達的相同請求（follower）附掛在它上面，取得同一份結果
+- leader 的進度事件轉給 follower：follower 在自己的執行緒輪詢最新事件
+  （Streamlit 只能由 session 自己的執行緒更新畫面）
+- follower 的時限與取消只影響自己：逾時或取消時停止等待，leader 繼續解析
+- leader 中途中止（丟出例外，例如 session 重新執行）或結果不可共用（例如已取消）時，
+  等待中的 follower 重新競爭，其中一個成為新的 leader
+
+跨 process（可選）：指定 lock_dir 時，leader 另外以 flock 鎖住 <lock_dir>/<鍵>.lock。
+其他 process 的相同請求等待鎖釋放後，先以 lookup 查詢共用的結果（例如結果快取的磁碟層），沒有才自行解析；
+leader 的最新進度寫入 <鍵>.progress.json 供其他 process 顯示。process 結束時鎖自動釋放，不會留下過期的鎖
+（鎖檔本身保留，刪除會讓等待中的 process 鎖在已刪除的檔案上）。沒有 fcntl 的平台只合併同一 process 內的請求。
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import tracing
+from atomic_io import AtomicWriter
+from deadlines import Deadline
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# follower 輪詢 leader 進度與完成狀態的間隔（秒）
+DEFAULT_POLL_INTERVAL = 0.2
+
+Publish = Callable[[Dict], None]
+
+
+class SingleFlight:
+    """
+    合併相同鍵的進行中請求
+
+    Args:
+        lock_dir: 跨 process 合併的鎖檔目錄，None 為只合併同一 process 內的請求
+        poll_interval: follower 輪詢間隔（秒）
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "followers": 0, "lookups": 0}
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def in_flight(self, key: str) -> bool:
+        """此鍵是否有進行中的請求（同一 process 內）"""
+        with self._lock:
+            return key in self._flights
+
+    def run(self, key: str, compute: Callable[[Publish], Any],
+            on_progress: Optional[Callable[[Dict], None]] = None, deadline: Optional[Deadline] = None,
+            lookup: Optional[Callable[[], Any]] = None,
+            shareable: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+        """
+        執行或附掛到相同鍵的進行中請求
+
+        Args:
+            key: 請求鍵（檔案內容雜湊 + 引擎設定，例如 result_cache.cache_key）
+            compute: compute(publish) -> 結果；publish(event) 將進度事件轉給 follower
+            on_progress: 等待其他請求期間收到其進度事件時呼叫（在呼叫端執行緒）
+            deadline: 等待期間的時限與取消（逾時或取消時丟出，leader 不受影響）
+            lookup: 成為 leader 後、解析前查詢已完成的共用結果，沒有時回傳 None
+            shareable: shareable(結果) -> 是否交給 follower（預設皆可）
+
+        Returns:
+            (結果, 是否取得其他請求的結果)
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = {"done": threading.Event(), "event": None, "version": 0,
+                              "result": None, "shared": False, "followers": 0}
+                    self._flights[key] = flight
+                else:
+                    flight["followers"] += 1
+                    self.stats["followers"] += 1
+            if leader:
+                return self._lead(key, flight, compute, on_progress, deadline, lookup, shareable)
+
+            with tracing.span("single_flight_wait", key=key[:16]) as record:
+                self._wait(flight, on_progress, deadline)
+                record["attributes"]["shared"] = flight["shared"]
+            if flight["shared"]:
+                return flight["result"], True
+            # leader 中止或結果不可共用：重新競爭
+
+    def _wait(self, flight: Dict, on_progress: Optional[Callable[[Dict], None]],
+              deadline: Optional[Deadline]) -> None:
+        seen = 0
+        while not flight["done"].wait(self.poll_interval):
+            with self._lock:
+                version, event = flight["version"], flight["event"]
+            if on_progress and event is not None and version != seen:
+                seen = version
+                on_progress(event)
+            if deadline is not None:
+                deadline.check()
+
+    def _publisher(self, key: str, flight: Dict) -> Publish:
+        last_write = [0.0]
+
+        def publish(event: Dict) -> None:
+            with self._lock:
+                flight["event"] = event
+                flight["version"] += 1
+            # 跨 process 的進度檔依輪詢間隔節流
+            if self.lock_dir and time.monotonic() - last_write[0] >= self.poll_interval:
+                last_write[0] = time.monotonic()
+                self._write_progress(key, event)
+
+        return publish
+
+    def _lead(self, key: str, flight: Dict, compute: Callable[[Publish], Any],
+              on_progress: Optional[Callable[[Dict], None]], deadline: Optional[Deadline],
+              lookup: Optional[Callable[[], Any]],
+              shareable: Optional[Callable[[Any], bool]]) -> Tuple[Any, bool]:
+        publish = self._publisher(key, flight)
+        fd = None
+        try:
+            if self.lock_dir:
+                fd = self._acquire_file_lock(key, flight, on_progress, deadline)
+            result = lookup() if lookup else None
+            shared = result is not None
+            if shared:
+                with self._lock:
+                    self.stats["lookups"] += 1
+            else:
+                with self._lock:
+                    self.stats["leaders"] += 1
+                result = compute(publish)
+        except BaseException:
+            self._finish(key, flight, None, False)
+            raise
+        finally:
+            if fd is not None:
+                self._release_file_lock(key, fd)
+        self._finish(key, flight, result, shareable is None or shareable(result))
+        return result, shared
+
+    def _finish(self, key: str, flight: Dict, result: Any, shared: bool) -> None:
+        with self._lock:
+            flight["result"] = result
+            flight["shared"] = shared
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight["done"].set()
+
+    # 跨 process
+
+    def _progress_path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, f"{key}.progress.json")
+
+    def _write_progress(self, key: str, event: Dict) -> None:
+        try:
+            with AtomicWriter(self._progress_path(key), "w") as f:
+                f.write(json.dumps(event, ensure_ascii=False, default=str))
+        except OSError:
+            # 進度只是顯示用，寫入失敗不影響解析
+            pass
+
+    def _read_progress(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._progress_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _acquire_file_lock(self, key: str, flight: Dict,
+                           on_progress: Optional[Callable[[Dict], None]], deadline: Optional[Deadline]) -> int:
+        # 取得鎖檔；其他 process 持有時等待，並轉發其進度給本 process 的呼叫端與 follower
+        fd = os.open(os.path.join(self.lock_dir, f"{key}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        seen = None
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    pass
+                event = self._read_progress(key)
+                if event is not None and event != seen:
+                    seen = event
+                    with self._lock:
+                        flight["event"] = event
+                        flight["version"] += 1
+                    if on_progress:
+                        on_progress(event)
+                if deadline is not None:
+                    deadline.check()
+                time.sleep(self.poll_interval)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def _release_file_lock(self, key: str, fd: int) -> None:
+        try:
+            os.remove(self._progress_path(key))
+        except OSError:
+            pass
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+_shared_flight: Optional[SingleFlight] = None
+_shared_lock = threading.Lock()
+
+
+def get_single_flight(lock_dir: Optional[str] = None) -> SingleFlight:
+    """
+    取得 process 層級共用的 SingleFlight（供 Streamlit 多個 session 與服務的 worker 執行緒共用）
+
+    Args:
+        lock_dir: 第一次建立時的跨 process 鎖檔目錄
+    """
+    global _shared_flight
+    with _shared_lock:
+        if _shared_flight is None:
+            _shared_flight = SingleFlight(lock_dir)
+        return _shared_flight
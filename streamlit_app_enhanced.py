@@ -6,6 +6,8 @@ import json
 import time
 from typing import Optional, Dict, List
 from pdf_parser_alternative import parse_pdf_with_fallbacks
+from deadlines import Deadline, DeadlineExceeded, count_pages, llamaparse_json, llamaparse_timeout_kwargs
+from progress import ProgressTracker, format_duration, tracked
 
 # 設置頁面標題
 st.set_page_config(
@@ -73,6 +75,8 @@ with st.sidebar.expander("進階選項"):
     chunk_pages = st.checkbox("分段處理大型文件", value=True,
                               help="將大型PDF分成小段處理，避免觸發內容政策")
     pages_per_chunk = st.number_input("每段頁數", min_value=5, max_value=50, value=10)
+    deadline_seconds = st.number_input("單份文件時限（秒，0 為不限）", min_value=0, max_value=3600, value=600)
+    page_deadline_seconds = st.number_input("每頁額外時限（秒）", min_value=0, max_value=120, value=10)
 
 # 將 API 金鑰設置為環境變數
 if gemini_api_key:
@@ -122,7 +126,9 @@ st.markdown("""
 """)
 
 def parse_with_llama_parse(file_path: str, model_choice: str, chunk_mode: bool = False,
-                           start_page: int = 0, end_page: Optional[int] = None) -> Dict:
+                           start_page: int = 0, end_page: Optional[int] = None,
+                           deadline: Optional[Deadline] = None,
+                           server_timeouts: Optional[Dict] = None) -> Dict:
     """
     使用 LlamaParse 解析 PDF
 
@@ -132,6 +138,8 @@ def parse_with_llama_parse(file_path: str, model_choice: str, chunk_mode: bool =
         chunk_mode: 是否使用分段模式
         start_page: 開始頁數
         end_page: 結束頁數
+        deadline: 時限（可選），逾時會中止遠端工作
+        server_timeouts: 傳給 LlamaParse 伺服器端的工作時限參數
 
     Returns:
         解析結果字典
@@ -163,11 +171,12 @@ def parse_with_llama_parse(file_path: str, model_choice: str, chunk_mode: bool =
             vendor_multimodal_model_name=model_choice,
             system_prompt=content_guideline,  # 使用 system_prompt 代替 deprecated 的參數
             invalidate_cache=True,
-            **extra_info
+            **extra_info,
+            **(server_timeouts or {})
         )
 
         # 執行解析
-        json_objs = parser.get_json_result(file_path)
+        json_objs = llamaparse_json(parser, file_path, deadline)
 
         if not json_objs or len(json_objs) == 0:
             return {"error": "無法從 PDF 中解析出內容", "type": "empty_result"}
@@ -185,6 +194,9 @@ def parse_with_llama_parse(file_path: str, model_choice: str, chunk_mode: bool =
             "pages": len(json_list)
         }
 
+    except DeadlineExceeded as e:
+        return {"error": f"解析逾時：{e}", "type": "timeout"}
+
     except Exception as e:
         error_msg = str(e)
 
@@ -240,21 +252,47 @@ def smart_parse_pdf(file_path: str, gemini_api_key: str, llama_api_key: Optional
     retry_count = 0
     max_retries = options.get("max_retries", 3)
 
+    # 進度事件：頁數先送出，解析完成時標記完成；等待期間由時限輪詢更新 ETA
+    progress = options.get("progress") or ProgressTracker()
+    page_total = count_pages(file_path)
+    progress.submit(page_total or 0, document=os.path.basename(file_path))
+
+    def run_local(reason: Optional[str] = None) -> Optional[str]:
+        if reason:
+            progress.fallback("LlamaParse", "本地解析", reason)
+        else:
+            progress.set_engine("本地解析")
+        content = parse_pdf_with_fallbacks(file_path, gemini_api_key, model_choice)
+        progress.complete(None, "本地解析")
+        return content
+
+    # 時限涵蓋所有 LlamaParse 嘗試（含重試）
+    deadline = Deadline.for_document(
+        options.get("deadline_seconds") or None,
+        options.get("page_deadline_seconds") or None,
+        page_total,
+        on_poll=progress.tick
+    )
+    server_timeouts = llamaparse_timeout_kwargs(options.get("deadline_seconds"),
+                                                options.get("page_deadline_seconds"))
+
     # 根據模式選擇解析策略
     if mode == "本地解析" or not llama_api_key:
         st.info("使用本地解析工具...")
-        result = parse_pdf_with_fallbacks(file_path, gemini_api_key, model_choice)
+        result = run_local()
 
     elif mode == "LlamaParse優先" or mode == "智能模式":
         while retry_count < max_retries:
             st.info(f"嘗試使用 LlamaParse 解析... (第 {retry_count + 1} 次)")
 
             # 嘗試 LlamaParse
-            parse_result = parse_with_llama_parse(
+            parse_result = tracked(progress, "LlamaParse", lambda: parse_with_llama_parse(
                 file_path,
                 model_choice,
                 chunk_mode=options.get("chunk_pages", False),
-            )
+                deadline=deadline,
+                server_timeouts=server_timeouts
+            ))
 
             if parse_result.get("success"):
                 result = parse_result["content"]
@@ -270,12 +308,17 @@ def smart_parse_pdf(file_path: str, gemini_api_key: str, llama_api_key: Optional
                 # 根據錯誤類型決定策略
                 if error_type == "recitation":
                     st.info("檢測到內容政策限制，切換到本地解析...")
-                    result = parse_pdf_with_fallbacks(file_path, gemini_api_key, model_choice)
+                    result = run_local("recitation")
                     break
 
                 elif error_type == "quota":
                     st.info("API 額度不足，切換到本地解析...")
-                    result = parse_pdf_with_fallbacks(file_path, gemini_api_key, model_choice)
+                    result = run_local("quota")
+                    break
+
+                elif error_type == "timeout":
+                    st.info("超過解析時限，已取消遠端工作，切換到本地解析...")
+                    result = run_local("timeout")
                     break
 
                 elif error_type == "multimodal":
@@ -290,7 +333,7 @@ def smart_parse_pdf(file_path: str, gemini_api_key: str, llama_api_key: Optional
                     retry_count += 1
                     if retry_count >= max_retries:
                         st.info("多次嘗試失敗，切換到本地解析...")
-                        result = parse_pdf_with_fallbacks(file_path, gemini_api_key, model_choice)
+                        result = run_local("multimodal")
                         break
                     else:
                         time.sleep(2)  # 等待後重試
@@ -299,7 +342,7 @@ def smart_parse_pdf(file_path: str, gemini_api_key: str, llama_api_key: Optional
                     retry_count += 1
                     if retry_count >= max_retries:
                         st.info("切換到本地解析...")
-                        result = parse_pdf_with_fallbacks(file_path, gemini_api_key, model_choice)
+                        result = run_local(error_type)
                         break
 
     return result or "無法解析文件"
@@ -336,29 +379,35 @@ else:
             progress_container = st.container()
 
             with progress_container:
-                progress_bar = st.progress(0)
+                progress_bar = st.progress(0.0, text="📤 準備解析文件...")
                 status_text = st.empty()
 
+                def show_progress(event: Dict):
+                    # 由解析層的進度事件驅動，不使用固定的進度值
+                    text = (f"🔄 {event['engine'] or '準備中'}：{event['pages_completed']}/{event['pages_submitted']} 頁"
+                            f" · 已處理 {format_duration(event['elapsed'])}"
+                            f" · 預估剩餘 {format_duration(event['eta'])}")
+                    if event["event"] == "fallback":
+                        text += f" · ↪️ {event['message']}"
+                    progress_bar.progress(event["fraction"], text=text)
+
                 try:
                     # 創建輸出目錄
                     output_dir = "parsed_results"
                     os.makedirs(output_dir, exist_ok=True)
 
-                    # 更新進度
-                    progress_bar.progress(20)
-                    status_text.text("📤 準備解析文件...")
-
                     # 準備選項
                     options = {
                         "retry_on_error": retry_on_error,
                         "max_retries": max_retries,
                         "chunk_pages": chunk_pages,
-                        "pages_per_chunk": pages_per_chunk
+                        "pages_per_chunk": pages_per_chunk,
+                        "deadline_seconds": deadline_seconds,
+                        "page_deadline_seconds": page_deadline_seconds,
+                        "progress": ProgressTracker(show_progress)
                     }
 
                     # 執行智能解析
-                    progress_bar.progress(40)
-                    status_text.text(f"🔄 使用 {model_choice} 進行解析...")
 
                     content = smart_parse_pdf(
                         file_path,
@@ -369,7 +418,6 @@ else:
                         options
                     )
 
-                    progress_bar.progress(80)
                     status_text.text("💾 保存解析結果...")
 
                     # 儲存解析結果
@@ -377,7 +425,6 @@ else:
                     with open(output_file, 'w', encoding='utf-8') as f:
                         f.write(content)
 
-                    progress_bar.progress(100)
                     status_text.text("✅ 解析完成！")
 
                     # 顯示成功訊息
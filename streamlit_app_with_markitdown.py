@@ -2,9 +2,27 @@ import streamlit as st
 from llama_parse import LlamaParse
 import os
 import shutil
+import tempfile
 import time
-from typing import Optional, Dict
-from markitdown import MarkItDown
+from typing import Optional, Dict, List
+from local_pool import get_shared_pool
+from deadlines import (Deadline, DeadlineExceeded, ParseCancelled, count_pages,
+                       llamaparse_json, llamaparse_timeout_kwargs)
+from page_store import records_from_pages, dumps_pages, find_page, pages_path_for
+from compressed_store import exists as stored_exists
+from search_index import default_index_path, search, update_index
+from postprocess import passes_for, postprocess_pages
+from preview import find_sections, preview_sections, section_label
+from pdf_optimizer import format_report, optimized_upload
+from progress import ProgressTracker, format_duration, tracked
+from quality import (QUALITY_THRESHOLD, merge_pages, pages_to_escalate, score_pages,
+                     summarize_provenance, target_pages_arg)
+from result_cache import DEFAULT_CACHE_DIR, cache_key, file_hash, get_shared_cache
+from single_flight import get_single_flight
+from model_tiers import format_tier_report, llamaparse_json_tiered, plan_document
+from page_ranges import format_page_ranges, parse_page_ranges, split_preview
+from background_jobs import BackgroundJob
+import tracing
 
 # 設置頁面標題
 st.set_page_config(
@@ -16,6 +34,12 @@ st.set_page_config(
 # 初始化 session state
 if 'parsing_history' not in st.session_state:
     st.session_state.parsing_history = []
+if 'seconds_per_page' not in st.session_state:
+    st.session_state.seconds_per_page = {}
+if 'parse_cancelled' not in st.session_state:
+    st.session_state.parse_cancelled = False
+if 'current_result' not in st.session_state:
+    st.session_state.current_result = None
 
 # 側邊欄 API 金鑰輸入
 st.sidebar.header("API 設定")
@@ -34,6 +58,9 @@ llama_cloud_api_key = st.sidebar.text_input(
 
 st.sidebar.markdown("---")
 
+# 逐頁依複雜度選擇模型（flash-lite / flash / pro）
+AUTO_TIER_MODEL = "自動分級（依頁面複雜度）"
+
 # 模型選擇
 st.sidebar.subheader("🤖 選擇 Gemini 模型")
 model_choice = st.sidebar.selectbox(
@@ -41,7 +68,11 @@ model_choice = st.sidebar.selectbox(
     options=[
         "gemini-2.0-flash",      # 新版本較少觸發 recitation
         "gemini-1.5-flash",      # 舊版快速模型
-        "gemini-1.5-pro"         # 舊版專業模型
+        "gemini-1.5-pro",        # 舊版專業模型
+        "gemini-2.5-pro",
+        "gemini-2.5-flash",
+        "gemini-2.5-flash-lite",
+        AUTO_TIER_MODEL
     ],
     index=0,
     help="選擇要使用的 Gemini 模型版本（建議使用 2.0 版本）"
@@ -51,7 +82,11 @@ model_choice = st.sidebar.selectbox(
 model_descriptions = {
     "gemini-2.0-flash": "⚡ 推薦：最新版本，較少觸發內容政策限制",
     "gemini-1.5-flash": "🚀 快速處理，適合一般文件",
-    "gemini-1.5-pro": "🏆 高品質，但可能觸發更多內容限制"
+    "gemini-1.5-pro": "🏆 高品質，但可能觸發更多內容限制",
+    "gemini-2.5-pro": "🏆 最高品質，每頁最慢、額度最高",
+    "gemini-2.5-flash": "⚡ 品質與速度平衡",
+    "gemini-2.5-flash-lite": "🚀 最快、最便宜，適合純文字頁面",
+    AUTO_TIER_MODEL: "🎚️ 逐頁評估表格、圖表、方程式與掃描頁，純文字頁用 flash-lite，密集表格與圖表頁才用 pro，各模型同時解析"
 }
 st.sidebar.info(model_descriptions.get(model_choice, "標準模型"))
 
@@ -63,21 +98,41 @@ parsing_mode = st.sidebar.radio(
     options=[
         "智能模式（推薦）",
         "LlamaParse 優先",
+        "本地優先（難頁送 LlamaParse）",
         "MarkItDown 本地解析"
     ],
     index=0,
     help="""
     - 智能模式：優先 LlamaParse，失敗自動切換到 MarkItDown
     - LlamaParse 優先：僅使用 LlamaParse（需要API額度）
+    - 本地優先：MarkItDown 解析後逐頁評分，只有品質不足的頁面送 LlamaParse
     - MarkItDown 本地解析：僅使用 Microsoft MarkItDown（完全本地）
     """
 )
 
+# 頁面範圍與快速預覽
+page_ranges = st.sidebar.text_input(
+    "頁面範圍（留空為整份文件）",
+    placeholder="例如 1-3,12-15 或 5-",
+    help="只解析這些頁面（從 1 開始），例如只需要摘要與結果表格時。"
+         "MarkItDown 轉換只含這些頁面的副本，LlamaParse 以 target_pages 指定"
+)
+fast_preview = st.sidebar.checkbox("⚡ 快速預覽：先解析前幾頁並顯示，其餘頁面在背景繼續", value=False)
+preview_pages = st.sidebar.number_input("預覽頁數", min_value=1, max_value=20, value=3, disabled=not fast_preview)
+
 # 進階選項
 with st.sidebar.expander("進階選項"):
     auto_retry = st.checkbox("遇到錯誤時自動重試", value=True)
     max_retries = st.number_input("最大重試次數", min_value=1, max_value=3, value=2)
     show_debug_info = st.checkbox("顯示除錯資訊", value=False)
+    deadline_seconds = st.number_input("LlamaParse 單份文件時限（秒，0 為不限）", min_value=0, max_value=3600, value=600)
+    page_deadline_seconds = st.number_input("每頁額外時限（秒）", min_value=0, max_value=120, value=10)
+    clean_output = st.checkbox("整理輸出（移除頁首頁尾、頁碼、斷字並修正表格）", value=True)
+    quality_threshold = st.slider("本地優先：品質門檻（低於此分數的頁面送 LlamaParse）",
+                                  min_value=0.0, max_value=1.0, value=QUALITY_THRESHOLD, step=0.05)
+    optimize_upload = st.checkbox("上傳前壓縮 PDF（清除未使用物件、重新壓縮）", value=False)
+    max_image_dpi = st.number_input("圖片降採樣 DPI（0 為不降採樣）", min_value=0, max_value=600, value=0,
+                                    disabled=not optimize_upload)
 
 # 將 API 金鑰設置為環境變數
 if gemini_api_key:
@@ -137,37 +192,44 @@ st.markdown("""
 - 完全**本地化選項**，不需要任何 API 金鑰
 """)
 
-def parse_with_markitdown(file_path: str) -> Dict:
+# 修改內容指導以避免 recitation（也是結果快取鍵的一部分，修改後舊結果自動失效）
+CONTENT_GUIDELINE = """
+        Extract and restructure the document content:
+        1. SUMMARIZE text sections, don't copy verbatim
+        2. Extract DATA and STRUCTURE (tables, lists, headings)
+        3. Focus on KEY INFORMATION and CONCEPTS
+        4. Preserve technical terms, formulas, and numbers exactly
+        5. Create an analytical summary rather than full text extraction
+        6. For tables: convert to markdown format
+        7. For figures: describe content and data trends
+        """
+
+def parse_with_markitdown(file_path: str, deadline: Optional[Deadline] = None,
+                          pages: Optional[List[int]] = None) -> Dict:
     """
     使用 Microsoft MarkItDown 解析 PDF
 
+    轉換在共用的 process pool 中執行（worker 保有 warm 的 MarkItDown 實例），
+    不佔用 Streamlit 的執行緒與 GIL，多個使用者可同時使用多個核心。
+
     Args:
         file_path: PDF 文件路徑
+        deadline: 時限與取消旗標（可選）
+        pages: 只解析這些頁面（從 1 開始），None 為整份文件
 
     Returns:
         解析結果字典
     """
     try:
-        # 初始化 MarkItDown
-        md = MarkItDown()
+        return get_shared_pool().convert(file_path, deadline, pages)
 
-        # 解析文件
-        with open(file_path, "rb") as f:
-            result = md.convert_stream(f, file_path=file_path)
-
-        if result and result.text_content:
-            return {
-                "success": True,
-                "content": result.text_content,
-                "method": "MarkItDown",
-                "title": result.title if hasattr(result, 'title') else None
-            }
-        else:
-            return {
-                "success": False,
-                "error": "MarkItDown 無法提取內容",
-                "method": "MarkItDown"
-            }
+    except ParseCancelled as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "error_type": "cancelled",
+            "method": "MarkItDown"
+        }
 
     except Exception as e:
         return {
@@ -176,41 +238,49 @@ def parse_with_markitdown(file_path: str) -> Dict:
             "method": "MarkItDown"
         }
 
-def parse_with_llamaparse(file_path: str, model_choice: str) -> Dict:
+def parse_with_llamaparse(file_path: str, model_choice: str,
+                          deadline: Optional[Deadline] = None,
+                          server_timeouts: Optional[Dict] = None,
+                          upload_options: Optional[Dict] = None,
+                          target_pages: Optional[List[int]] = None) -> Dict:
     """
     使用 LlamaParse 解析 PDF
 
     Args:
         file_path: PDF 文件路徑
         model_choice: Gemini 模型選擇
+        deadline: 時限與取消旗標（可選），逾時或取消時會中止遠端工作
+        server_timeouts: 傳給 LlamaParse 伺服器端的工作時限參數
+        upload_options: 上傳前最佳化參數（pdf_optimizer.optimize_pdf），None 為上傳原檔
+        target_pages: 只解析這些頁面（從 1 開始），None 為整份文件
 
     Returns:
         解析結果字典
     """
-    try:
-        # 修改內容指導以避免 recitation
-        content_guideline = """
-        Extract and restructure the document content:
-        1. SUMMARIZE text sections, don't copy verbatim
-        2. Extract DATA and STRUCTURE (tables, lists, headings)
-        3. Focus on KEY INFORMATION and CONCEPTS
-        4. Preserve technical terms, formulas, and numbers exactly
-        5. Create an analytical summary rather than full text extraction
-        6. For tables: convert to markdown format
-        7. For figures: describe content and data trends
-        """
-
-        parser = LlamaParse(
+    def make_parser(model: str, pages: Optional[List[int]]):
+        return LlamaParse(
             result_type="markdown",
             use_vendor_multimodal_model=True,
-            vendor_multimodal_model_name=model_choice,
-            system_prompt=content_guideline,
+            vendor_multimodal_model_name=model,
+            system_prompt=CONTENT_GUIDELINE,
             invalidate_cache=True,
-            verbose=False
+            verbose=False,
+            **(server_timeouts or {}),
+            **({"target_pages": target_pages_arg(pages)} if pages else {})
         )
 
-        # 執行解析
-        json_objs = parser.get_json_result(file_path)
+    try:
+        tiers = None
+        # 執行解析（可選：上傳最佳化後的副本）
+        with optimized_upload(file_path, upload_options) as (upload_path, upload_report):
+            if model_choice == AUTO_TIER_MODEL:
+                # 逐頁分級：各模型以 target_pages 各自解析，同時進行
+                tiered = llamaparse_json_tiered(make_parser, upload_path,
+                                                plan_document(file_path, target_pages), deadline)
+                json_objs = [{"pages": tiered["pages"]}]
+                tiers = tiered["report"]
+            else:
+                json_objs = llamaparse_json(make_parser(model_choice, target_pages), upload_path, deadline)
 
         if not json_objs or len(json_objs) == 0:
             return {
@@ -221,16 +291,37 @@ def parse_with_llamaparse(file_path: str, model_choice: str) -> Dict:
 
         json_list = json_objs[0]["pages"]
 
-        # 組合頁面內容
+        # 組合頁面內容（只解析部分頁面時標題使用原始頁碼）
         content = []
         for i, page in enumerate(json_list):
-            content.append(f"## Page {i+1}\n\n{page.get('md', '')}")
+            content.append(f"## Page {page.get('page') or i + 1}\n\n{page.get('md', '')}")
 
         return {
             "success": True,
             "content": "\n\n".join(content),
+            "page_contents": [page.get('md', '') for page in json_list],
             "method": "LlamaParse",
-            "pages": len(json_list)
+            "pages": len(json_list),
+            "page_numbers": [page.get("page") for page in json_list],
+            "page_models": [page.get("model", model_choice) for page in json_list],
+            "tiers": tiers,
+            "upload": upload_report
+        }
+
+    except DeadlineExceeded as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "error_type": "timeout",
+            "method": "LlamaParse"
+        }
+
+    except ParseCancelled as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "error_type": "cancelled",
+            "method": "LlamaParse"
         }
 
     except Exception as e:
@@ -251,48 +342,216 @@ def parse_with_llamaparse(file_path: str, model_choice: str) -> Dict:
             "method": "LlamaParse"
         }
 
+def apply_postprocessing(result: Dict) -> Dict:
+    """
+    對逐頁結果套用後處理，並依解析方法重新組合全文
+
+    Args:
+        result: 解析結果字典（需包含 page_contents）
+
+    Returns:
+        更新後的解析結果
+    """
+    if not result.get("page_contents"):
+        return result
+
+    pages = list(postprocess_pages(result["page_contents"], passes_for(page_engines(result))))
+    return {**result, "page_contents": pages,
+            "content": join_pages(pages, result.get("method"), result.get("page_numbers"))}
+
+def page_engines(result: Dict) -> List[Optional[str]]:
+    """各頁的來源引擎：逐頁來源 > 合併預覽時記錄的各頁引擎 > 整份結果的解析方法"""
+    if result.get("provenance"):
+        return [entry["engine"] for entry in result["provenance"]]
+    if result.get("page_engines"):
+        return result["page_engines"]
+    return [result.get("method")] * len(result.get("page_contents") or [])
+
+def join_pages(pages: List[str], method: Optional[str], page_numbers: Optional[List[int]] = None) -> str:
+    """組合全文：LlamaParse 的結果每頁加上頁碼標題（只解析部分頁面時為原始頁碼）"""
+    if method != "LlamaParse":
+        return "\n\n".join(pages)
+    numbers = page_numbers if page_numbers and len(page_numbers) == len(pages) else [None] * len(pages)
+    return "\n\n".join(f"## Page {number or i + 1}\n\n{page}"
+                         for i, (number, page) in enumerate(zip(numbers, pages)))
+
+def parse_local_first(file_path: str, model_choice: str, remote_deadline: Deadline,
+                      local_deadline: Deadline, server_timeouts: Dict,
+                      upload_options: Optional[Dict], threshold: float,
+                      progress: ProgressTracker, pages: Optional[List[int]] = None) -> Dict:
+    """
+    本地優先解析：MarkItDown 解析並逐頁評分，只有低於門檻的頁面送 LlamaParse
+
+    Returns:
+        合併後的解析結果，provenance 為逐頁的來源引擎與品質分數
+    """
+    progress.set_engine("MarkItDown")
+    start_time = time.time()
+    local = parse_with_markitdown(file_path, local_deadline, pages)
+    if not local["success"]:
+        if local.get("error_type") == "cancelled":
+            return local
+        # 本地完全無法擷取（例如整份掃描）時整份送遠端，與批次的本地優先模式相同
+        st.info(f"🚀 本地解析失敗，整份送 LlamaParse + {model_choice}...")
+        return tracked(progress, "LlamaParse", lambda: parse_with_llamaparse(
+            file_path, model_choice, remote_deadline, server_timeouts, upload_options, target_pages=pages))
+
+    local_pages = local["page_contents"]
+    scores = score_pages(local_pages)
+    escalate = pages_to_escalate(scores, threshold)
+    if (len(pages) if pages else count_pages(file_path)) not in (None, len(local_pages)):
+        # 本地切頁與 PDF 頁數不符時無法逐頁對應，與批次的本地優先模式相同整份送遠端
+        st.info(f"🚀 本地切頁與 PDF 頁數不符，整份送 LlamaParse + {model_choice}...")
+        return tracked(progress, "LlamaParse", lambda: parse_with_llamaparse(
+            file_path, model_choice, remote_deadline, server_timeouts, upload_options, target_pages=pages))
+    # 本地結果的第 i 頁對應的原始頁碼（只解析部分頁面時不是 i）
+    numbers = local.get("page_numbers") or list(range(1, len(local_pages) + 1))
+    positions = {number: i + 1 for i, number in enumerate(numbers)}
+
+    # 品質足夠的頁面到此已完成，只有難頁需要等待遠端
+    progress.complete(len(local_pages) - len(escalate), "MarkItDown", seconds=time.time() - start_time)
+
+    remote_pages = {}
+    remote_models = {}
+    tiers = None
+    if escalate:
+        target_pages = [numbers[i - 1] for i in escalate]
+        st.info(f"🚀 {len(escalate)}/{len(local_pages)} 頁品質不足，送 LlamaParse + {model_choice}...")
+        remote = tracked(progress, "LlamaParse", lambda: parse_with_llamaparse(
+            file_path, model_choice, remote_deadline, server_timeouts, upload_options, target_pages=target_pages))
+        if remote["success"]:
+            for requested, number, md, model in zip(target_pages, remote["page_numbers"], remote["page_contents"],
+                                                    remote["page_models"]):
+                position = positions[number if number in target_pages else requested]
+                remote_pages[position] = md
+                remote_models[position] = model
+            tiers = remote["tiers"]
+        elif remote.get("error_type") == "cancelled":
+            return remote
+        else:
+            st.warning(f"⚠️ LlamaParse 失敗（{remote.get('error_type', 'unknown')}），這些頁面保留本地結果")
+            tracing.mark("fallback", from_engine="LlamaParse", to_engine="MarkItDown",
+                         reason=remote.get("error_type", "unknown"), pages=len(escalate))
+            progress.fallback("LlamaParse", "MarkItDown", remote.get("error_type", "unknown"))
+            progress.complete(None, "MarkItDown")
+    else:
+        st.success("✅ 所有頁面品質皆達門檻，不需遠端解析")
+
+    pages, provenance = merge_pages(local_pages, local["method"], scores,
+                                    remote_pages, "LlamaParse", model_choice)
+    for number, model in remote_models.items():
+        provenance[number - 1]["model"] = model
+    method = f"{local['method']} + LlamaParse" if remote_pages else local["method"]
+    return {
+        **local,
+        "content": "\n\n".join(pages),
+        "page_contents": pages,
+        "pages": len(pages),
+        "method": method,
+        "provenance": provenance,
+        "engine_pages": summarize_provenance(provenance),
+        "tiers": tiers
+    }
+
 def smart_parse(file_path: str, mode: str, model_choice: str,
                 llama_key: Optional[str], options: Dict) -> Dict:
     """
     智能解析 PDF，根據模式和錯誤自動選擇最佳方法
 
+    整個過程記錄為一個 trace（引擎嘗試、重試等待、備援），結果附上 trace_id。
+
     Args:
         file_path: PDF 文件路徑
         mode: 解析模式
         model_choice: Gemini 模型
         llama_key: LlamaParse API key
-        options: 其他選項
+        options: 其他選項（deadline_seconds / page_deadline_seconds / cancel_event / on_poll / upload_options /
+                 progress / pages）
 
     Returns:
         解析結果
     """
+    with tracing.span("smart_parse", document=os.path.basename(file_path), mode=mode,
+                      model=model_choice) as record:
+        result = _smart_parse(file_path, mode, model_choice, llama_key, options)
+        record["attributes"]["method"] = result.get("method")
+        if not result["success"]:
+            record["status"] = "error"
+            record["attributes"]["error_type"] = result.get("error_type", "unknown")
+    return {**result, "trace_id": record["trace_id"]}
+
+def _smart_parse(file_path: str, mode: str, model_choice: str,
+                 llama_key: Optional[str], options: Dict) -> Dict:
+    # smart_parse 的實作（依模式選擇引擎、重試與備援）
     results = []
 
+    # 進度事件：整份文件的頁數先送出，各引擎完成時標記完成；等待期間由時限輪詢更新 ETA
+    progress = options.get("progress") or ProgressTracker()
+    # 只解析部分頁面時，進度與時限以選取的頁數計算
+    pages = options.get("pages")
+    page_total = len(pages) if pages else count_pages(file_path)
+    progress.submit(page_total or 0, document=os.path.basename(file_path))
+
+    # 遠端解析的時限涵蓋所有 LlamaParse 嘗試（含重試）；本地備援只接受取消
+    cancel_event = options.get("cancel_event")
+    on_poll = options.get("on_poll") or progress.tick
+    remote_deadline = Deadline.for_document(
+        options.get("deadline_seconds") or None,
+        options.get("page_deadline_seconds") or None,
+        page_total,
+        cancel_event=cancel_event,
+        on_poll=on_poll
+    )
+    server_timeouts = llamaparse_timeout_kwargs(options.get("deadline_seconds"),
+                                                options.get("page_deadline_seconds"))
+    local_deadline = Deadline(None, cancel_event=remote_deadline.cancel_event, on_poll=on_poll)
+    upload_options = options.get("upload_options")
+
+    def run_markitdown() -> Dict:
+        return tracked(progress, "MarkItDown", lambda: parse_with_markitdown(file_path, local_deadline, pages))
+
+    def run_llamaparse() -> Dict:
+        return tracked(progress, "LlamaParse", lambda: parse_with_llamaparse(
+            file_path, model_choice, remote_deadline, server_timeouts, upload_options, target_pages=pages))
+
     # MarkItDown 本地解析模式
     if mode == "MarkItDown 本地解析":
         st.info("🔧 使用 MarkItDown 進行本地解析...")
-        result = parse_with_markitdown(file_path)
+        result = run_markitdown()
         results.append(result)
         return result
 
+    # 本地優先模式：只有品質不足的頁面付出遠端延遲
+    elif mode == "本地優先（難頁送 LlamaParse）":
+        st.info("🔧 使用 MarkItDown 本地解析並逐頁評分...")
+        if not llama_key:
+            st.warning("⚠️ 未提供 LlamaParse API Key，品質不足的頁面將保留本地結果")
+            return run_markitdown()
+        return parse_local_first(file_path, model_choice, remote_deadline, local_deadline, server_timeouts,
+                                 upload_options, options.get("quality_threshold", QUALITY_THRESHOLD), progress,
+                                 pages)
+
     # LlamaParse 優先模式
     elif mode == "LlamaParse 優先":
         if not llama_key:
             st.warning("⚠️ 未提供 LlamaParse API Key，自動切換到 MarkItDown")
-            result = parse_with_markitdown(file_path)
+            result = run_markitdown()
             results.append(result)
             return result
 
         st.info(f"🚀 使用 LlamaParse + {model_choice} 解析...")
-        result = parse_with_llamaparse(file_path, model_choice)
+        result = run_llamaparse()
         results.append(result)
 
         if not result["success"]:
             st.warning(f"⚠️ LlamaParse 失敗: {result.get('error', '未知錯誤')}")
 
-            if options.get("auto_retry") and result.get("error_type") in ["recitation", "quota"]:
+            if options.get("auto_retry") and result.get("error_type") in ["recitation", "quota", "timeout"]:
                 st.info("🔄 自動切換到 MarkItDown...")
-                fallback_result = parse_with_markitdown(file_path)
+                tracing.mark("fallback", from_engine="LlamaParse", to_engine="MarkItDown",
+                             reason=result["error_type"])
+                progress.fallback("LlamaParse", "MarkItDown", result["error_type"])
+                fallback_result = run_markitdown()
                 results.append(fallback_result)
                 return fallback_result
 
@@ -303,7 +562,7 @@ def smart_parse(file_path: str, mode: str, model_choice: str,
         # 優先嘗試 LlamaParse
         if llama_key:
             st.info(f"🚀 嘗試 LlamaParse + {model_choice}...")
-            result = parse_with_llamaparse(file_path, model_choice)
+            result = run_llamaparse()
             results.append(result)
 
             if result["success"]:
@@ -314,21 +573,32 @@ def smart_parse(file_path: str, mode: str, model_choice: str,
                 st.warning(f"⚠️ LlamaParse 遇到問題: {error_type}")
 
                 # 根據錯誤類型決定是否重試
-                if error_type == "recitation":
+                if error_type == "cancelled":
+                    return result
+                elif error_type == "recitation":
                     st.info("📝 檢測到內容政策限制，切換到 MarkItDown...")
                 elif error_type == "quota":
                     st.info("💳 API 額度不足，切換到 MarkItDown...")
+                elif error_type == "timeout":
+                    st.info("⏱️ 超過解析時限，已取消遠端工作，切換到 MarkItDown...")
                 elif options.get("auto_retry") and len(results) < options.get("max_retries", 2):
                     st.info(f"🔄 重試 {len(results)}/{options.get('max_retries', 2)}...")
-                    time.sleep(2)
-                    retry_result = parse_with_llamaparse(file_path, model_choice)
+                    with tracing.span("retry_sleep", attempt=len(results)):
+                        time.sleep(2)
+                    retry_result = run_llamaparse()
                     results.append(retry_result)
                     if retry_result["success"]:
                         return retry_result
+                    if retry_result.get("error_type") == "cancelled":
+                        return retry_result
 
         # 使用 MarkItDown 作為備援
         st.info("🔧 使用 MarkItDown 本地解析...")
-        fallback_result = parse_with_markitdown(file_path)
+        if llama_key:
+            tracing.mark("fallback", from_engine="LlamaParse", to_engine="MarkItDown",
+                         reason=results[-1].get("error_type", "unknown"))
+            progress.fallback("LlamaParse", "MarkItDown", results[-1].get("error_type", "unknown"))
+        fallback_result = run_markitdown()
         results.append(fallback_result)
 
         if fallback_result["success"]:
@@ -336,147 +606,635 @@ def smart_parse(file_path: str, mode: str, model_choice: str,
 
         return fallback_result
 
-# 主要介面
-if not gemini_api_key and parsing_mode != "MarkItDown 本地解析":
-    st.warning("請在左側輸入 Gemini API 金鑰，或選擇 MarkItDown 本地解析模式")
-else:
-    # 文件上傳區
-    uploaded_file = st.file_uploader(
-        "上傳 PDF 文件",
-        type="pdf",
-        help="支援各種 PDF 格式，包括掃描檔案"
+def result_cache_key(content_hash: str, mode: str, model_choice: str, llama_key: Optional[str],
+                     upload_options: Optional[Dict], threshold: float,
+                     pages: Optional[List[int]] = None) -> str:
+    """
+    解析結果的快取鍵：只納入會改變輸出的設定
+
+    時限、重試等只影響是否備援的設定不納入（備援產生的結果不寫入快取）；
+    整理輸出在顯示時才套用，切換時不需重新解析。
+    解析整份文件時不納入頁面範圍，既有的快取結果仍然有效。
+    """
+    selection = {"pages": pages} if pages else {}
+    if mode == "MarkItDown 本地解析":
+        return cache_key(content_hash, mode, "", selection)
+    settings = {
+        "llamaparse": bool(llama_key),
+        "prompt": CONTENT_GUIDELINE,
+        "upload_options": upload_options,
+        **selection,
+    }
+    if mode == "本地優先（難頁送 LlamaParse）":
+        settings["quality_threshold"] = threshold
+    return cache_key(content_hash, mode, model_choice, settings)
+
+def result_view(current: Dict) -> Dict:
+    """
+    結果的顯示資料：整理後的結果、預覽段落、逐頁來源表與下載內容
+
+    每個結果與整理設定只計算一次，保存在 current（session state）中，
+    翻頁、搜尋與下載造成的重新執行不必再處理整份文件；下載內容在第一次點擊下載時才產生。
+    """
+    views = current.setdefault("views", {})
+    if clean_output not in views:
+        result = apply_postprocessing(current["result"]) if clean_output else current["result"]
+        pages = result.get("page_contents") or [result["content"]]
+        page_numbers = result.get("page_numbers")
+        views[clean_output] = {
+            "result": result,
+            "sections": preview_sections(pages, page_numbers=page_numbers),
+            "pages": len(pages),
+            "chars": len(result["content"]),
+            "provenance": [
+                {"頁": page_numbers[i] if page_numbers else i + 1, "引擎": entry["engine"],
+                 "模型": entry.get("model") or "",
+                 "品質分數": entry["quality"]["score"],
+                 "問題": ", ".join(entry["quality"]["reasons"])}
+                for i, entry in enumerate(result["provenance"])
+            ] if result.get("provenance") else None,
+            "matches": {},
+            "downloads": {},
+        }
+    return views[clean_output]
+
+def download_markdown(current: Dict, view: Dict) -> str:
+    """Markdown 下載內容（元資料 + 全文），第一次下載時產生"""
+    if "markdown" not in view["downloads"]:
+        result = view["result"]
+        metadata = f"""---
+    title: {current['filename'].replace('.pdf', '')}
+    parsed_by: {result.get('method', 'Unknown')}
+    model: {current['model'] if result.get('method') == 'LlamaParse' else 'N/A'}
+    date: {current['parsed_at']}
+    time_taken: {current['elapsed']:.2f}s
+    ---
+
+    """
+        view["downloads"]["markdown"] = metadata + result["content"]
+    return view["downloads"]["markdown"]
+
+def download_jsonl(current: Dict, view: Dict) -> str:
+    """逐頁 JSONL 下載內容（每行一頁，保留頁面邊界），第一次下載時產生"""
+    if "jsonl" not in view["downloads"]:
+        result = view["result"]
+        page_numbers = result.get("page_numbers")
+        page_meta = result.get('provenance') or ([{"model": model} for model in result['page_models']]
+                                                 if result.get('tiers') else None)
+        if page_numbers and len(page_numbers) == len(result['page_contents']):
+            # 只解析部分頁面時記錄原始頁碼
+            page_meta = [{**(page_meta[i] if page_meta else {}), "page": number}
+                         for i, number in enumerate(page_numbers)]
+        records = records_from_pages(
+            result['page_contents'],
+            result.get('method', 'Unknown'),
+            current['model'] if result.get('method') == 'LlamaParse' else None,
+            current['elapsed'],
+            page_meta
+        )
+        view["downloads"]["jsonl"] = dumps_pages(records)
+    return view["downloads"]["jsonl"]
+
+def render_preview(view: Dict, key: str):
+    """
+    逐頁分段預覽，支援翻頁與搜尋跳頁
+
+    每次只渲染目前位置起的幾個段落；段落與搜尋結果保存在 view 中，
+    上千頁的文件與短文件的翻頁成本相同。
+
+    Args:
+        view: result_view() 的顯示資料
+        key: 結果的快取鍵（區分不同結果的元件狀態）
+    """
+    sections = view["sections"]
+    total = len(sections)
+    position_key = f"preview_position_{key}"
+    query_key = f"preview_query_{key}"
+    match_key = f"preview_match_{key}"
+    if position_key not in st.session_state:
+        st.session_state[position_key] = 1
+
+    def move(step: int):
+        st.session_state[position_key] = min(max(1, st.session_state[position_key] + step), total)
+
+    def matches_for(query: str) -> List[int]:
+        if query not in view["matches"]:
+            view["matches"][query] = find_sections(sections, query)
+        return view["matches"][query]
+
+    def jump_to_first_match():
+        matches = matches_for(st.session_state[query_key])
+        if matches:
+            st.session_state[position_key] = matches[0] + 1
+
+    def jump_to_match():
+        st.session_state[position_key] = st.session_state[match_key] + 1
+
+    col_prev, col_position, col_next, col_window = st.columns([1, 2, 1, 1])
+    with col_window:
+        window = st.selectbox("每次顯示", [1, 3, 5, 10], key=f"preview_window_{key}",
+                              format_func=lambda n: f"{n} 段")
+    with col_prev:
+        st.button("◀ 上一段", on_click=move, args=(-window,), key=f"preview_prev_{key}",
+                  use_container_width=True)
+    with col_next:
+        st.button("下一段 ▶", on_click=move, args=(window,), key=f"preview_next_{key}",
+                  use_container_width=True)
+    with col_position:
+        st.number_input(f"位置（共 {total} 段 / {view['pages']} 頁）", min_value=1, max_value=total,
+                        key=position_key)
+
+    col_query, col_matches = st.columns([1, 1])
+    with col_query:
+        query = st.text_input("搜尋並跳至", key=query_key, on_change=jump_to_first_match,
+                              placeholder="輸入關鍵字後按 Enter")
+    if query:
+        matches = matches_for(query)
+        with col_matches:
+            if matches:
+                st.selectbox(f"找到 {len(matches)} 段", matches, key=match_key, on_change=jump_to_match,
+                             format_func=lambda i: section_label(sections[i]))
+            else:
+                st.info("找不到符合的內容")
+
+    start = st.session_state[position_key] - 1
+    for section in sections[start:start + window]:
+        st.caption(f"📄 {section_label(section)}")
+        st.markdown(section["text"])
+        st.divider()
+
+def render_result(current: Dict):
+    """
+    顯示解析結果（統計、預覽與下載按鈕）
+
+    結果保存在 session state，點下載按鈕或調整側邊欄造成的重新執行也能再次顯示。
+
+    Args:
+        current: {"result", "filename", "elapsed", "parsed_at", "model", "cached", "coalesced", "trace", "preview"}
+    """
+    view = result_view(current)
+    result = view["result"]
+    filename = current["filename"]
+    elapsed_time = current["elapsed"]
+
+    # 顯示成功訊息和統計
+    if current.get("cached"):
+        st.success(f"⚡ 已有相同文件與設定的解析結果（{current['parsed_at']}，使用 {result.get('method', 'Unknown')}）")
+    elif current.get("coalesced"):
+        st.success(f"🤝 已合併到相同文件的進行中解析，使用 {result.get('method', 'Unknown')}")
+    elif current.get("preview"):
+        st.success(f"⚡ 快速預覽：已解析 {len(current['preview']['head'])} 頁，使用 {result.get('method', 'Unknown')}")
+    else:
+        st.success(f"✅ 解析完成！使用 {result.get('method', 'Unknown')}")
+
+    if current.get("preview"):
+        poll_background(current)
+    elif current.get("preview_error"):
+        st.warning(current["preview_error"])
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("解析方法", result.get('method', 'Unknown'))
+    with col2:
+        st.metric("耗時", f"{elapsed_time:.1f} 秒")
+    with col3:
+        st.metric("字數", f"{view['chars']:,}")
+    with col4:
+        if result.get('pages'):
+            st.metric("頁數", result['pages'])
+
+    if current.get("pages"):
+        st.caption(f"📑 頁面範圍：{format_page_ranges(current['pages'])}")
+
+    if result.get("upload"):
+        st.caption(f"📦 上傳最佳化：{format_report(result['upload'])}")
+
+    if result.get("tiers"):
+        st.caption(f"🎚️ 模型分級：{format_tier_report(result['tiers'])}")
+
+    if view["provenance"]:
+        with st.expander(f"🧭 逐頁來源：{result['engine_pages']}"):
+            st.dataframe(view["provenance"], use_container_width=True, hide_index=True)
+
+    if current.get("trace"):
+        with st.expander("🕒 解析追蹤"):
+            st.code(tracing.format_waterfall(current["trace"]), language=None)
+
+    # 分頁預覽：只渲染目前視窗內的頁面
+    with st.expander("📝 預覽解析結果", expanded=True):
+        render_preview(view, current["key"])
+
+    # 提供下載按鈕（內容在點擊時才產生）
+    st.download_button(
+        label="📥 下載 Markdown 檔案",
+        data=lambda: download_markdown(current, view),
+        file_name=filename.replace(".pdf", ".md"),
+        mime="text/markdown",
+        type="primary",
+        use_container_width=True,
+        key=f"download_md_{current['key']}"
     )
 
-    if uploaded_file is not None:
-        # 創建臨時目錄
-        temp_dir = "temp_uploads"
-        os.makedirs(temp_dir, exist_ok=True)
-
-        # 保存上傳的文件
-        file_path = os.path.join(temp_dir, uploaded_file.name)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-
-        # 顯示文件信息
-        col1, col2 = st.columns(2)
-        with col1:
-            st.success(f"✅ 已上傳: {uploaded_file.name}")
-        with col2:
-            file_size_mb = uploaded_file.size / (1024 * 1024)
-            st.info(f"📊 大小: {file_size_mb:.2f} MB")
-
-        # 解析按鈕
-        if st.button("🚀 開始解析", type="primary", use_container_width=True):
-
-            # 創建進度容器
-            with st.spinner("解析中..."):
-                start_time = time.time()
-
-                try:
-                    # 準備選項
-                    options = {
-                        "auto_retry": auto_retry,
-                        "max_retries": max_retries,
-                        "show_debug": show_debug_info
-                    }
-
-                    # 執行智能解析
-                    result = smart_parse(
-                        file_path,
-                        parsing_mode,
-                        model_choice,
-                        llama_cloud_api_key,
-                        options
-                    )
-
-                    # 計算解析時間
-                    elapsed_time = time.time() - start_time
-
-                    if result["success"]:
-                        content = result["content"]
-
-                        # 添加元資料到內容開頭
-                        metadata = f"""---
-title: {uploaded_file.name.replace('.pdf', '')}
-parsed_by: {result.get('method', 'Unknown')}
-model: {model_choice if result.get('method') == 'LlamaParse' else 'N/A'}
-date: {time.strftime('%Y-%m-%d %H:%M:%S')}
-time_taken: {elapsed_time:.2f}s
----
-
-"""
-                        full_content = metadata + content
-
-                        # 顯示成功訊息和統計
-                        st.success(f"✅ 解析完成！使用 {result.get('method', 'Unknown')}")
-
-                        col1, col2, col3, col4 = st.columns(4)
-                        with col1:
-                            st.metric("解析方法", result.get('method', 'Unknown'))
-                        with col2:
-                            st.metric("耗時", f"{elapsed_time:.1f} 秒")
-                        with col3:
-                            st.metric("字數", f"{len(content):,}")
-                        with col4:
-                            if result.get('pages'):
-                                st.metric("頁數", result['pages'])
-
-                        # 顯示預覽
-                        with st.expander("📝 預覽解析結果", expanded=True):
-                            preview_length = min(2000, len(content))
-                            st.markdown(content[:preview_length] + "..." if len(content) > preview_length else content)
-
-                        # 提供下載按鈕
-                        st.download_button(
-                            label="📥 下載 Markdown 檔案",
-                            data=full_content,
-                            file_name=uploaded_file.name.replace(".pdf", ".md"),
-                            mime="text/markdown",
-                            type="primary",
-                            use_container_width=True
-                        )
-
-                        # 記錄到歷史
-                        st.session_state.parsing_history.append({
-                            "filename": uploaded_file.name,
-                            "method": result.get('method'),
-                            "success": True,
-                            "time": elapsed_time
-                        })
-
-                    else:
-                        st.error(f"❌ 解析失敗: {result.get('error', '未知錯誤')}")
-
-                        # 提供建議
-                        st.info("""
-                        💡 **建議嘗試：**
-                        1. 切換到 MarkItDown 本地解析模式
-                        2. 檢查 PDF 是否損壞
-                        3. 如果是掃描檔，可能需要 OCR 處理
-                        """)
-
-                except Exception as e:
-                    st.error(f"❌ 發生錯誤: {str(e)}")
-
-                    if show_debug_info:
-                        st.exception(e)
-
-                finally:
-                    # 清理臨時文件
-                    if os.path.exists(temp_dir):
-                        shutil.rmtree(temp_dir)
-
-# 顯示解析歷史
-if st.session_state.parsing_history:
-    with st.expander("📜 解析歷史"):
-        for record in st.session_state.parsing_history[-5:]:  # 顯示最近5筆
-            col1, col2, col3 = st.columns(3)
+    # 逐頁 JSONL（每行一頁，保留頁面邊界）
+    if result.get('page_contents'):
+        st.download_button(
+            label="📥 下載逐頁 JSONL",
+            data=lambda: download_jsonl(current, view),
+            file_name=filename.replace(".pdf", ".pages.jsonl"),
+            mime="application/jsonl",
+            use_container_width=True,
+            key=f"download_jsonl_{current['key']}"
+        )
+
+def request_cancel():
+    """取消按鈕的回呼：點擊會觸發重新執行，進行中的解析在下一次輪詢時中止"""
+    st.session_state.parse_cancelled = True
+
+def upload_page_count(data) -> Optional[int]:
+    """上傳文件的頁數（解析頁面範圍用），無法開啟時為 None"""
+    try:
+        import fitz  # PyMuPDF
+        with fitz.open(stream=bytes(data), filetype="pdf") as doc:
+            return doc.page_count
+    except Exception:
+        return None
+
+def merge_preview(head: Dict, rest: Dict) -> Dict:
+    """
+    合併快速預覽的前幾頁與背景解析的其餘頁面
+
+    逐頁來源只在兩部分都有時保留，各頁的來源引擎一律記錄在 page_engines（後處理依此選擇步驟）；
+    模型分級報告無法合併，合併後不顯示。
+    """
+    pages = head["page_contents"] + rest["page_contents"]
+    numbers = (head.get("page_numbers") or []) + (rest.get("page_numbers") or [])
+    method = head["method"] if head["method"] == rest["method"] else f"{head['method']} + {rest['method']}"
+    merged = {**rest, "page_contents": pages, "pages": len(pages), "method": method,
+              "page_numbers": numbers if len(numbers) == len(pages) else None,
+              "page_engines": page_engines(head) + page_engines(rest),
+              "upload": None, "tiers": None}
+    if head.get("provenance") and rest.get("provenance"):
+        merged["provenance"] = head["provenance"] + rest["provenance"]
+        merged["engine_pages"] = summarize_provenance(merged["provenance"])
+    else:
+        merged.pop("provenance", None)
+        merged.pop("engine_pages", None)
+    merged["content"] = join_pages(pages, head["method"] if head["method"] == rest["method"] else None,
+                                   merged["page_numbers"])
+    return merged
+
+def continue_in_background(file_path: str, temp_dir: str, head_result: Dict, rest: List[int],
+                           options: Dict, key: str, cacheable: bool) -> BackgroundJob:
+    """
+    快速預覽：在背景解析其餘頁面並與預覽合併
+
+    背景工作擁有上傳的暫存目錄，完成後自行刪除。
+    背景執行緒沒有 Streamlit 的執行環境，不可存取 session state：需要的設定都由參數傳入。
+    合併結果沒有發生備援時以完整頁面範圍的快取鍵寫入快取。
+
+    Args:
+        file_path: 上傳的 PDF 路徑
+        temp_dir: 上傳的暫存目錄
+        head_result: 預覽頁面的解析結果
+        rest: 其餘頁碼
+        options: smart_parse 的選項（會以 rest 取代 pages）
+        key: 完整頁面範圍的快取鍵
+        cacheable: 預覽部分可寫入快取（沒有發生備援）
+    """
+    results_cache = get_shared_cache()
+    mode, model, llama_key = parsing_mode, model_choice, llama_cloud_api_key
+    seconds_per_page = dict(st.session_state.seconds_per_page)
+
+    def work(cancel_event, publish):
+        try:
+            tracker = ProgressTracker(publish, seconds_per_page)
+            rest_result = smart_parse(file_path, mode, model, llama_key,
+                                      {**options, "pages": rest, "progress": tracker, "cancel_event": cancel_event})
+            if not rest_result["success"]:
+                return rest_result
+            merged = merge_preview(head_result, rest_result)
+            if cacheable and not tracker.fallbacks:
+                results_cache.put(key, {"entry": {
+                    "elapsed": time.time() - job.started_at,
+                    "parsed_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+                    "model": model
+                }, "result": {k: v for k, v in merged.items() if k not in ("memory", "trace_id")}})
+            return merged
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    job = BackgroundJob(work, description=f"{os.path.basename(file_path)} 第 {format_page_ranges(rest)} 頁")
+    return job
+
+@st.fragment(run_every=1.0)
+def poll_background(current: Dict):
+    """
+    顯示背景解析的進度；完成時以合併結果取代快速預覽並重新執行
+
+    以 fragment 定時重新執行，只更新這一區塊，不影響使用者瀏覽預覽內容。
+    """
+    preview = current["preview"]
+    job = preview["job"]
+    if not job.done:
+        event = job.event
+        text = f"⏳ 其餘 {len(preview['rest'])} 頁在背景解析中"
+        if event:
+            text += (f"：{event['pages_completed']}/{event['pages_submitted']} 頁"
+                     f" · 預估剩餘 {format_duration(event['eta'])}")
+        st.info(text)
+        st.button("⏹️ 停止背景解析", on_click=job.cancel, key=f"background_cancel_{current['key']}")
+        return
+
+    result = job.result
+    # 結果改變，顯示資料需重新計算
+    finished = {**current, "preview": None, "views": {}}
+    if job.error is not None or not result["success"]:
+        if result is not None and result.get("error_type") == "cancelled":
+            reason = "已停止背景解析"
+        else:
+            reason = f"背景解析失敗: {job.error or result.get('error', '未知錯誤')}"
+        finished["preview_error"] = f"⚠️ {reason}，只保留前 {len(preview['head'])} 頁"
+        finished["pages"] = preview["head"]
+    else:
+        finished.update(result=result, elapsed=job.finished_at - preview["started_at"])
+        st.session_state.parsing_history.append({
+            "filename": current["filename"],
+            "method": f"{result.get('method')}（背景完成）",
+            "success": True,
+            "time": finished["elapsed"]
+        })
+    if st.session_state.current_result is current:
+        st.session_state.current_result = finished
+    st.rerun()
+
+# 分頁：解析 / 搜尋
+tab_parse, tab_search = st.tabs(["📄 解析", "🔎 搜尋已解析文件"])
+
+with tab_parse:
+    # 主要介面
+    if not gemini_api_key and parsing_mode != "MarkItDown 本地解析":
+        st.warning("請在左側輸入 Gemini API 金鑰，或選擇 MarkItDown 本地解析模式")
+    else:
+        # 文件上傳區
+        uploaded_file = st.file_uploader(
+            "上傳 PDF 文件",
+            type="pdf",
+            help="支援各種 PDF 格式，包括掃描檔案"
+        )
+
+        if uploaded_file is not None:
+            # 顯示文件信息
+            col1, col2 = st.columns(2)
             with col1:
-                st.text(record['filename'])
+                st.success(f"✅ 已上傳: {uploaded_file.name}")
             with col2:
-                st.text(f"方法: {record['method']}")
-            with col3:
-                st.text(f"耗時: {record['time']:.1f}s")
+                file_size_mb = uploaded_file.size / (1024 * 1024)
+                st.info(f"📊 大小: {file_size_mb:.2f} MB")
+
+            # 頁面範圍（開放式範圍與截斷需要頁數）
+            page_total = upload_page_count(uploaded_file.getbuffer()) if page_ranges.strip() or fast_preview else None
+            range_error = None
+            try:
+                selected_pages = parse_page_ranges(page_ranges, page_total)
+            except ValueError as e:
+                selected_pages = None
+                range_error = str(e)
+                st.error(f"❌ 頁面範圍錯誤: {range_error}")
+
+            # 快取鍵：檔案內容 + 會改變輸出的設定
+            upload_options = {"max_image_dpi": max_image_dpi or None} if optimize_upload else None
+            content_hash = file_hash(uploaded_file.getbuffer())
+            key = result_cache_key(content_hash, parsing_mode, model_choice,
+                                   llama_cloud_api_key, upload_options, quality_threshold, selected_pages)
+            results_cache = get_shared_cache()
+            # 跨 process 合併需要共用的磁碟快取（其他 process 的結果從磁碟層取得）
+            inflight = get_single_flight(os.path.join(DEFAULT_CACHE_DIR, "inflight") if DEFAULT_CACHE_DIR else None)
+
+            # 同一份文件與設定已有結果（其他 session 解析過）時直接顯示
+            current = st.session_state.current_result
+            if current is None or current["key"] != key:
+                cached = results_cache.get(key)
+                if cached is not None:
+                    st.session_state.current_result = {**cached["entry"], "result": cached["result"],
+                                                       "key": key, "filename": uploaded_file.name,
+                                                       "cached": True, "pages": selected_pages}
+
+            # 解析按鈕
+            if st.session_state.parse_cancelled:
+                st.warning("⏹️ 已取消上一次解析，進行中的遠端工作已中止")
+                st.session_state.parse_cancelled = False
+
+            if st.button("🚀 開始解析", type="primary", use_container_width=True, disabled=bool(range_error)):
+                # 快取命中時不重新解析（上方已顯示快取結果）
+                current = st.session_state.current_result
+                if current is not None and current["key"] == key:
+                    st.session_state.parsing_history.append({
+                        "filename": uploaded_file.name,
+                        "method": f"{current['result'].get('method')}（快取）",
+                        "success": True,
+                        "time": 0.0
+                    })
+                else:
+                    # 快速預覽：先解析前幾頁（以預覽頁面的快取鍵合併與快取），其餘頁面之後在背景解析
+                    head_pages, rest_pages = (split_preview(selected_pages, page_total, preview_pages)
+                                              if fast_preview and page_total else (selected_pages, []))
+                    parse_pages = head_pages if rest_pages else selected_pages
+                    parse_key = (result_cache_key(content_hash, parsing_mode, model_choice, llama_cloud_api_key,
+                                                  upload_options, quality_threshold, parse_pages)
+                                 if rest_pages else key)
+                    background_started = False
+
+                    # 創建臨時目錄並保存上傳的文件（只有需要解析時才寫入）
+                    # 每次解析一個獨立的子目錄：多個 session 同時上傳同名文件時不會互相覆寫或刪除
+                    os.makedirs("temp_uploads", exist_ok=True)
+                    temp_dir = tempfile.mkdtemp(prefix="upload-", dir="temp_uploads")
+                    file_path = os.path.join(temp_dir, uploaded_file.name)
+                    with open(file_path, "wb") as f:
+                        f.write(uploaded_file.getbuffer())
+
+                    # 取消按鈕：點擊後 Streamlit 重新執行，本次解析在下一次輪詢時中止
+                    st.button("⏹️ 取消解析", on_click=request_cancel, use_container_width=True)
+                    progress_bar = st.progress(0.0, text="📤 準備解析文件...")
+
+                    def show_progress(event: Dict):
+                        # 由解析層的進度事件驅動；等待遠端時隨時限輪詢更新已處理時間與 ETA
+                        text = (f"⏳ {event['engine'] or '準備中'}：{event['pages_completed']}/{event['pages_submitted']} 頁"
+                                f" · 已處理 {format_duration(event['elapsed'])}"
+                                f" · 預估剩餘 {format_duration(event['eta'])}")
+                        if event["event"] == "fallback":
+                            text += f" · ↪️ {event['message']}"
+                        progress_bar.progress(event["fraction"], text=text)
+
+                    # 每頁耗時估計沿用本 session 先前的實際觀察值
+                    progress = ProgressTracker(show_progress, st.session_state.seconds_per_page)
+                    # 發生過備援的結果不寫入快取（下一次可能不必備援）
+                    fallbacks = []
+                    progress.add_listener(lambda event: fallbacks.append(event) if event["event"] == "fallback" else None)
+
+                    # 創建進度容器
+                    with st.spinner("解析中..."):
+                        start_time = time.time()
+
+                        try:
+                            # 準備選項
+                            options = {
+                                "auto_retry": auto_retry,
+                                "max_retries": max_retries,
+                                "show_debug": show_debug_info,
+                                "deadline_seconds": deadline_seconds,
+                                "page_deadline_seconds": page_deadline_seconds,
+                                "progress": progress,
+                                "upload_options": upload_options,
+                                "quality_threshold": quality_threshold,
+                                "pages": parse_pages
+                            }
+
+                            def parse_once(publish):
+                                # 其他 session 同時上傳相同文件時附掛在本次解析上，進度也轉給它們
+                                progress.add_listener(publish)
+                                result = smart_parse(
+                                    file_path,
+                                    parsing_mode,
+                                    model_choice,
+                                    llama_cloud_api_key,
+                                    options
+                                )
+                                if result["success"] and not fallbacks:
+                                    # 合併結束前寫入快取，之後到達的相同請求直接命中
+                                    # 記憶體用量與追蹤只對本次執行有意義，不寫入快取
+                                    results_cache.put(parse_key, {"entry": {
+                                        "elapsed": time.time() - start_time,
+                                        "parsed_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+                                        "model": model_choice
+                                    }, "result": {k: v for k, v in result.items() if k not in ("memory", "trace_id")}})
+                                return result
+
+                            def cached_result():
+                                # 其他 process 剛完成的相同解析（磁碟層）
+                                cached = results_cache.get(parse_key)
+                                return cached["result"] if cached is not None else None
+
+                            if inflight.in_flight(parse_key):
+                                st.info("🤝 其他使用者正在解析相同的文件與設定，完成後直接取得結果")
+
+                            # 執行智能解析；收集本次的 span 供瀑布圖顯示（其他 session 的 span 依 trace_id 濾除）
+                            spans = []
+                            tracing.add_exporter(spans.append)
+                            try:
+                                result, coalesced = inflight.run(
+                                    parse_key, parse_once, on_progress=show_progress, lookup=cached_result,
+                                    shareable=lambda result: result.get("error_type") != "cancelled")
+                            finally:
+                                tracing.remove_exporter(spans.append)
+                            trace = [span for span in spans if span["trace_id"] == result.get("trace_id")]
+
+                            if not coalesced:
+                                st.session_state.seconds_per_page.update(progress.observed_rates())
+
+                            # 計算解析時間
+                            elapsed_time = time.time() - start_time
+
+                            if result["success"]:
+                                entry = {
+                                    "elapsed": elapsed_time,
+                                    "parsed_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+                                    "model": model_choice
+                                }
+                                # 保存未整理的結果：整理輸出在顯示時套用
+                                st.session_state.current_result = {**entry, "result": result, "key": key,
+                                                                   "filename": uploaded_file.name,
+                                                                   "cached": False, "coalesced": coalesced,
+                                                                   "trace": trace, "pages": selected_pages}
+                                if rest_pages:
+                                    # 背景解析期間上傳的文件仍需保留，由背景工作刪除
+                                    job = continue_in_background(file_path, temp_dir, result, rest_pages,
+                                                                 {k: v for k, v in options.items() if k != "progress"},
+                                                                 key, not fallbacks)
+                                    background_started = True
+                                    st.session_state.current_result["preview"] = {
+                                        "job": job, "head": head_pages, "rest": rest_pages,
+                                        "started_at": start_time}
+
+                                # 記錄到歷史
+                                st.session_state.parsing_history.append({
+                                    "filename": uploaded_file.name,
+                                    "method": result.get('method'),
+                                    "success": True,
+                                    "time": elapsed_time
+                                })
+
+                            else:
+                                st.error(f"❌ 解析失敗: {result.get('error', '未知錯誤')}")
+                                if trace:
+                                    with st.expander("🕒 解析追蹤"):
+                                        st.code(tracing.format_waterfall(trace), language=None)
+
+                                # 提供建議
+                                st.info("""
+                                💡 **建議嘗試：**
+                                1. 切換到 MarkItDown 本地解析模式
+                                2. 檢查 PDF 是否損壞
+                                3. 如果是掃描檔，可能需要 OCR 處理
+                                """)
+
+                        except Exception as e:
+                            st.error(f"❌ 發生錯誤: {str(e)}")
+
+                            if show_debug_info:
+                                st.exception(e)
+
+                        finally:
+                            # 清理本次的臨時文件（背景解析進行中時由背景工作清理）
+                            if not background_started:
+                                shutil.rmtree(temp_dir, ignore_errors=True)
+
+            # 結果在按鈕分支外顯示：重新執行（下載、調整設定）時仍保留
+            current = st.session_state.current_result
+            if current is not None and current["key"] == key:
+                render_result(current)
+
+    # 顯示解析歷史
+    if st.session_state.parsing_history:
+        with st.expander("📜 解析歷史"):
+            for record in st.session_state.parsing_history[-5:]:  # 顯示最近5筆
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.text(record['filename'])
+                with col2:
+                    st.text(f"方法: {record['method']}")
+                with col3:
+                    st.text(f"耗時: {record['time']:.1f}s")
+
+with tab_search:
+    st.markdown("在批次解析的輸出目錄中進行全文檢索（SQLite FTS5，增量更新）")
+    search_dir = st.text_input("解析結果目錄", value="parsed_journals")
+    search_col1, search_col2 = st.columns([3, 1])
+    with search_col1:
+        search_query = st.text_input("關鍵字", placeholder="例如：empagliflozin eGFR")
+    with search_col2:
+        search_by_document = st.checkbox("依文件彙整", value=True)
+
+    if search_query:
+        if not os.path.isdir(search_dir):
+            st.warning(f"找不到目錄: {search_dir}")
+        else:
+            index_path = default_index_path(search_dir)
+            index_stats = update_index(index_path, search_dir)
+            if index_stats["added"] or index_stats["updated"] or index_stats["removed"]:
+                st.caption(f"索引已更新：新增 {index_stats['added']}、更新 {index_stats['updated']}、移除 {index_stats['removed']}")
+
+            search_start = time.time()
+            hits = search(index_path, search_query, limit=50, by_document=search_by_document)
+            st.caption(f"{len(hits)} 筆結果，耗時 {(time.time() - search_start) * 1000:.1f} ms")
+
+            for hit in hits:
+                location = f"第 {hit['page']} 頁" if hit['page'] else "全文"
+                with st.expander(f"📄 {hit['title']}（{location}）"):
+                    st.markdown(hit['snippet'])
+                    pages_path = pages_path_for(hit['path'])
+                    if hit['page'] and stored_exists(pages_path):
+                        if st.checkbox("顯示整頁內容", key=f"search_page_{hit['path']}_{hit['page']}"):
+                            st.markdown(find_page(pages_path, hit['page'])['markdown'])
 
 # 添加頁尾
 st.markdown("---")
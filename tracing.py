@@ -0,0 +1,254 @@
+"""
+解析流程的 span 追蹤
+
+一份文件最後落到 MarkItDown 之前可能經過兩次 LlamaParse、重試等待與備援判斷，
+過去只留下 st.info / print 訊息。此模組以 span 記錄每個步驟：
+- 每份文件一個 trace（trace_id），其下的 span 涵蓋引擎嘗試、重試等待、備援判斷與寫檔
+- span 附帶屬性（error_type / pages / bytes 等），結束時交給 exporter
+- JsonlExporter 每個 span 寫一行 JSON；多個 process 以 O_APPEND 寫入同一個檔案
+- format_waterfall() 將同一 trace 的 span 依開始時間排成瀑布圖，可看出慢的文件時間花在哪裡
+
+目前的 span 以 contextvars 傳遞，巢狀的 with span(...) 自動成為子 span。
+PDF2MD_TRACE_FILE 環境變數設定輸出檔；configure() 同時更新環境變數，spawn 的 worker process 也會寫入同一檔案。
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+TRACE_FILE_ENV = "PDF2MD_TRACE_FILE"
+
+SpanExporter = Callable[[Dict], None]
+
+_current: "contextvars.ContextVar[Optional[Dict]]" = contextvars.ContextVar("pdf2md_span", default=None)
+_exporters: List[SpanExporter] = []
+_exporters_lock = threading.Lock()
+
+
+class JsonlExporter:
+    """
+    每個結束的 span 以一行 JSON 附加到檔案
+
+    以 O_APPEND 開啟並一次寫入整行，多個 process 同時寫入時行不會交錯。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, span: Dict) -> None:
+        line = json.dumps(span, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def add_exporter(exporter: SpanExporter) -> None:
+    with _exporters_lock:
+        _exporters.append(exporter)
+
+
+def remove_exporter(exporter: SpanExporter) -> None:
+    with _exporters_lock:
+        if exporter in _exporters:
+            _exporters.remove(exporter)
+
+
+def configure(path: Optional[str]) -> None:
+    """
+    設定 JSONL 輸出檔（None 為停用檔案輸出）
+
+    同時設定 PDF2MD_TRACE_FILE，之後 spawn 的 worker process 匯入本模組時寫入同一檔案。
+    """
+    with _exporters_lock:
+        _exporters[:] = [exporter for exporter in _exporters if not isinstance(exporter, JsonlExporter)]
+        if path:
+            _exporters.append(JsonlExporter(path))
+    if path:
+        os.environ[TRACE_FILE_ENV] = path
+    else:
+        os.environ.pop(TRACE_FILE_ENV, None)
+
+
+def _export(record: Dict) -> None:
+    with _exporters_lock:
+        exporters = list(_exporters)
+    for exporter in exporters:
+        try:
+            exporter(record)
+        except Exception as e:
+            # 追蹤失敗不影響解析
+            print(f"    trace export failed: {str(e)}")
+
+
+def current_span() -> Optional[Dict]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span["trace_id"] if span else None
+
+
+def set_attributes(**attributes) -> None:
+    """在目前的 span 加上屬性（沒有進行中的 span 時忽略）"""
+    span = _current.get()
+    if span is not None:
+        span["attributes"].update(attributes)
+
+
+def _new_record(name: str, start: Optional[float], attributes: Dict) -> Dict:
+    parent = _current.get()
+    return {
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "start": start if start is not None else time.time(),
+        "duration": None,
+        "status": "ok",
+        "attributes": {key: value for key, value in attributes.items() if value is not None},
+        "pid": os.getpid(),
+    }
+
+
+@contextmanager
+def span(name: str, start: Optional[float] = None, **attributes) -> Iterator[Dict]:
+    """
+    記錄一個 span；沒有進行中的 span 時開始新的 trace
+
+    Args:
+        name: span 名稱（例如 llamaparse / markitdown / retry_sleep / write_outputs）
+        start: 開始時間（time.time()），用於補記已在其他地方開始的工作；預設為現在
+        attributes: 屬性
+
+    Yields:
+        span 記錄；可直接更新 span["attributes"]
+    """
+    record = _new_record(name, start, attributes)
+    token = _current.set(record)
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["attributes"].setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        record["duration"] = round(time.time() - record["start"], 6)
+        _export(record)
+
+
+def mark(name: str, **attributes) -> None:
+    """記錄一個瞬間的決策（例如備援），以長度為 0 的 span 表示"""
+    record_span(name, time.time(), 0.0, **attributes)
+
+
+def record_span(name: str, start: float, duration: float, **attributes) -> None:
+    """補記已完成的工作（例如在 event loop 或其他 process 中量測的耗時）"""
+    record = _new_record(name, start, attributes)
+    record["duration"] = round(duration, 6)
+    if attributes.get("error_type"):
+        record["status"] = "error"
+    _export(record)
+
+
+# 瀏覽
+
+def load_spans(path: str) -> List[Dict]:
+    """讀取 JSONL 輸出檔（略過不完整的行）"""
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+def group_traces(spans: Iterable[Dict]) -> Dict[str, List[Dict]]:
+    """依 trace_id 分組，各組依開始時間排序"""
+    traces: Dict[str, List[Dict]] = {}
+    for record in spans:
+        traces.setdefault(record["trace_id"], []).append(record)
+    for records in traces.values():
+        records.sort(key=lambda record: record["start"])
+    return traces
+
+
+def trace_summary(records: List[Dict]) -> Dict:
+    """trace 的根 span、文件名稱、開始時間與總耗時"""
+    ids = {record["span_id"] for record in records}
+    roots = [record for record in records if record["parent_id"] not in ids] or records
+    start = min(record["start"] for record in records)
+    end = max(record["start"] + (record["duration"] or 0.0) for record in records)
+    document = next((record["attributes"].get("document") for record in roots
+                     if record["attributes"].get("document")), None)
+    return {"trace_id": records[0]["trace_id"], "root": roots[0]["name"], "document": document,
+            "start": start, "seconds": end - start,
+            "errors": sum(1 for record in records if record["status"] == "error")}
+
+
+def _depths(records: List[Dict]) -> Dict[str, int]:
+    parents = {record["span_id"]: record["parent_id"] for record in records}
+    depths = {}
+    for span_id in parents:
+        depth, parent = 0, parents[span_id]
+        while parent in parents and depth < 32:
+            depth, parent = depth + 1, parents[parent]
+        depths[span_id] = depth
+    return depths
+
+
+def _ordered(records: List[Dict]) -> List[Dict]:
+    # 深度優先：子 span 緊接在父 span 之後，同層依開始時間
+    ids = {record["span_id"] for record in records}
+    children: Dict[Optional[str], List[Dict]] = {}
+    for record in records:
+        parent = record["parent_id"] if record["parent_id"] in ids else None
+        children.setdefault(parent, []).append(record)
+    ordered = []
+    stack = list(reversed(children.get(None, [])))
+    while stack:
+        record = stack.pop()
+        ordered.append(record)
+        stack.extend(reversed(children.get(record["span_id"], [])))
+    return ordered
+
+
+def format_waterfall(records: List[Dict], width: int = 40) -> str:
+    """
+    單一 trace 的文字瀑布圖
+
+    每行一個 span：相對開始時間、耗時、名稱（依巢狀縮排）、時間軸與主要屬性；錯誤的 span 標記 !。
+    """
+    summary = trace_summary(records)
+    total = summary["seconds"] or 1e-9
+    depths = _depths(records)
+    lines = [f"trace {summary['trace_id']}  {summary['document'] or summary['root']}  "
+             f"{summary['seconds']:.2f}s"]
+    for record in _ordered(records):
+        offset = record["start"] - summary["start"]
+        duration = record["duration"] or 0.0
+        begin = min(width - 1, int(offset / total * width))
+        length = max(1, int(round(duration / total * width))) if duration else 0
+        bar = " " * begin + ("█" * min(length, width - begin) if length else "◆")
+        name = "  " * depths[record["span_id"]] + record["name"] + (" !" if record["status"] == "error" else "")
+        details = " ".join(f"{key}={value}" for key, value in record["attributes"].items()
+                           if key != "document")
+        lines.append(f"{offset:8.2f}s {duration:8.2f}s  {name:<28} |{bar:<{width}}| {details}")
+    return "\n".join(lines)
+
+
+if os.environ.get(TRACE_FILE_ENV):
+    # worker process（或以環境變數啟動）時自動寫入同一檔案
+    add_exporter(JsonlExporter(os.environ[TRACE_FILE_ENV]))
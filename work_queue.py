@@ -0,0 +1,380 @@
+"""
+共用檔案系統上的分散式工作佇列
+
+全語料重新解析時，單一機器的 batch_process_pdfs 不夠用。此模組只依賴共用檔案系統（NFS 等），
+不需要任何外部 broker：
+- 協調者（coordinator）把輸入檔案寫入佇列目錄的 pending/
+- 任意數量、位於不同節點的 worker 以 rename 認領工作；rename 是原子操作，同一工作只會有一個 worker 取得
+- 租約（lease）的到期時間寫在 leased/ 的檔名中，worker 以 rename 定期續約（heartbeat）
+- 租約過期的工作會被任何 worker 重新放回 pending/（嘗試次數加一），超過上限則移到 failed/
+- 輸出先寫入暫存目錄，確認仍持有租約後才逐檔以 os.replace 移到輸出目錄，最後把工作移到 done/
+
+佇列目錄結構：
+
+    <queue>/pending/<成本>-<工作 id>.a<嘗試次數>.json
+    <queue>/leased/<成本>-<工作 id>.a<嘗試次數>.json@<worker>@<到期時間>
+    <queue>/done/    <queue>/failed/    <queue>/staging/
+
+pending/ 的檔名以成本開頭，依檔名排序即為最短工作優先。
+各節點的時鐘差距需遠小於租約長度。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Optional
+
+from atomic_io import replace_if_changed
+from page_store import INDEX_SUFFIX, PAGES_SUFFIX, index_path_for, pages_digest
+from scheduler import estimate_job
+
+STATES = ("pending", "leased", "done", "failed", "staging")
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+
+# 這些檔案是多份文件共用的記錄檔，提交時附加到目的檔而不是取代
+APPEND_FILES = {"upload_optimization.jsonl"}
+
+
+class LeaseLost(Exception):
+    """租約已過期並被重新分派，本 worker 的結果不得提交"""
+
+
+def _job_id(file_path: str) -> str:
+    return hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+
+
+def _base_name(name: str) -> str:
+    """去除租約資訊，回傳 pending/ 中的檔名"""
+    return name.split("@", 1)[0]
+
+
+def _parse_attempt(base: str) -> int:
+    return int(base.rsplit(".a", 1)[1].split(".", 1)[0])
+
+
+def _with_attempt(base: str, attempt: int) -> str:
+    return f"{base.rsplit('.a', 1)[0]}.a{attempt}.json"
+
+
+def init_queue(queue_dir: str) -> None:
+    for state in STATES:
+        os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+
+def _known_job_ids(queue_dir: str) -> set:
+    ids = set()
+    for state in ("pending", "leased", "done", "failed"):
+        for name in os.listdir(os.path.join(queue_dir, state)):
+            ids.add(_base_name(name).split("-", 1)[1].split(".", 1)[0])
+    return ids
+
+
+def enqueue(queue_dir: str, file_paths: Iterable[str], output_dir: str, requeue_done: bool = False) -> int:
+    """
+    協調者：將 PDF 加入佇列（同一檔案已在佇列中時略過）
+
+    Args:
+        queue_dir: 共用的佇列目錄
+        file_paths: PDF 路徑（以絕對路徑儲存，所有節點需能以相同路徑存取）
+        output_dir: 輸出目錄（共用檔案系統上）
+        requeue_done: 已完成或失敗的工作是否重新加入
+
+    Returns:
+        加入的工作數
+    """
+    init_queue(queue_dir)
+    if requeue_done:
+        for state in ("done", "failed"):
+            for name in os.listdir(os.path.join(queue_dir, state)):
+                os.remove(os.path.join(queue_dir, state, name))
+    known = _known_job_ids(queue_dir)
+
+    added = 0
+    for file_path in file_paths:
+        job_id = _job_id(file_path)
+        if job_id in known:
+            continue
+        job = estimate_job(file_path)
+        job.update({
+            "id": job_id,
+            "path": os.path.abspath(file_path),
+            "output_dir": os.path.abspath(output_dir),
+            "enqueued_at": time.time(),
+        })
+        name = f"{int(job['cost'] * 1000):012d}-{job_id}.a0.json"
+        # 先寫暫存檔再 rename，worker 不會讀到寫到一半的工作
+        tmp_path = os.path.join(queue_dir, "staging", f"{name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(queue_dir, "pending", name))
+        known.add(job_id)
+        added += 1
+    return added
+
+
+def queue_status(queue_dir: str) -> Dict[str, int]:
+    """各狀態的工作數"""
+    return {state: len(os.listdir(os.path.join(queue_dir, state)))
+            for state in ("pending", "leased", "done", "failed")}
+
+
+def requeue_expired(queue_dir: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                    now: Optional[float] = None) -> int:
+    """
+    將租約過期的工作放回 pending/（嘗試次數加一），超過上限的移到 failed/
+
+    任何 worker 都可以呼叫；與續約同時發生時，只有一個 rename 會成功。
+
+    Returns:
+        重新放回佇列的工作數
+    """
+    now = now if now is not None else time.time()
+    leased_dir = os.path.join(queue_dir, "leased")
+    requeued = 0
+    for name in os.listdir(leased_dir):
+        try:
+            expires_at = float(name.rsplit("@", 1)[1])
+        except (IndexError, ValueError):
+            continue
+        if expires_at > now:
+            continue
+
+        base = _base_name(name)
+        attempt = _parse_attempt(base) + 1
+        if attempt >= max_attempts:
+            target = os.path.join(queue_dir, "failed", base)
+        else:
+            target = os.path.join(queue_dir, "pending", _with_attempt(base, attempt))
+        try:
+            os.rename(os.path.join(leased_dir, name), target)
+        except FileNotFoundError:
+            continue  # 已被續約、提交或其他 worker 處理
+        if attempt < max_attempts:
+            requeued += 1
+    return requeued
+
+
+class Lease:
+    """
+    一個已認領的工作
+
+    Attributes:
+        job: 工作內容（path / output_dir / pages / cost ...）
+        attempt: 第幾次嘗試（從 0 開始）
+    """
+
+    def __init__(self, queue_dir: str, base: str, worker_id: str, expires_at: float,
+                 job: Dict, lease_seconds: float):
+        self.queue_dir = queue_dir
+        self.base = base
+        self.worker_id = worker_id
+        self.expires_at = expires_at
+        self.job = job
+        self.attempt = _parse_attempt(base)
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.queue_dir, "leased", f"{self.base}@{self.worker_id}@{self.expires_at:.3f}")
+
+    def renew(self) -> None:
+        """續約：以新的到期時間重新命名；檔案已不在時表示租約已遺失"""
+        with self._lock:
+            if self.lost:
+                raise LeaseLost(self.base)
+            old_path = self.path
+            self.expires_at = time.time() + self.lease_seconds
+            try:
+                os.rename(old_path, self.path)
+            except FileNotFoundError:
+                self.lost = True
+                raise LeaseLost(self.base)
+
+    def _finish(self, state: str) -> None:
+        with self._lock:
+            try:
+                os.rename(self.path, os.path.join(self.queue_dir, state, self.base))
+            except FileNotFoundError:
+                self.lost = True
+                raise LeaseLost(self.base)
+
+    def complete(self) -> None:
+        self._finish("done")
+
+    def fail(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> None:
+        """處理失敗：尚未達到上限時放回 pending/ 重試，否則移到 failed/"""
+        attempt = self.attempt + 1
+        if attempt >= max_attempts:
+            self._finish("failed")
+            return
+        with self._lock:
+            try:
+                os.rename(self.path, os.path.join(self.queue_dir, "pending", _with_attempt(self.base, attempt)))
+            except FileNotFoundError:
+                self.lost = True
+                raise LeaseLost(self.base)
+
+
+def claim(queue_dir: str, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[Lease]:
+    """
+    認領下一個工作（成本最低者優先）
+
+    Returns:
+        Lease，佇列中沒有待處理工作時為 None
+    """
+    pending_dir = os.path.join(queue_dir, "pending")
+    for base in sorted(os.listdir(pending_dir)):
+        expires_at = time.time() + lease_seconds
+        lease_name = f"{base}@{worker_id}@{expires_at:.3f}"
+        try:
+            os.rename(os.path.join(pending_dir, base), os.path.join(queue_dir, "leased", lease_name))
+        except FileNotFoundError:
+            continue  # 其他 worker 先取得
+
+        with open(os.path.join(queue_dir, "leased", lease_name), "r", encoding="utf-8") as f:
+            job = json.load(f)
+        return Lease(queue_dir, base, worker_id, expires_at, job, lease_seconds)
+    return None
+
+
+def commit_outputs(lease: Lease, staging_dir: str, output_dir: str) -> int:
+    """
+    提交暫存目錄中的輸出：先確認仍持有租約，再逐檔以 os.replace 原子地移到輸出目錄
+
+    讀者只會看到舊檔或完整的新檔；內容與既有輸出相同的檔案不會取代（mtime 不變），
+    共用記錄檔（APPEND_FILES）附加到目的檔。
+
+    Returns:
+        實際取代或附加的檔案數
+
+    Raises:
+        LeaseLost: 租約已遺失，輸出不提交
+    """
+    lease.renew()
+    os.makedirs(output_dir, exist_ok=True)
+
+    names = sorted(os.listdir(staging_dir))
+    # 子目錄（圖片 assets/）最先提交，Markdown 出現時連結已有效；
+    # 位移索引跟在 .pages.jsonl 之後，.md 最後提交：搜尋索引以 .md / .pages.jsonl 中較新者為準
+    names.sort(key=lambda name: (not os.path.isdir(os.path.join(staging_dir, name)),
+                                 name.endswith(".md"), name.endswith(INDEX_SUFFIX)))
+    committed = 0
+    kept = set()
+    for name in names:
+        source = os.path.join(staging_dir, name)
+        destination = os.path.join(output_dir, name)
+        if os.path.isdir(source):
+            # 以內容命名的共用檔案（圖片）：合併到既有目錄，相同內容不取代
+            os.makedirs(destination, exist_ok=True)
+            for filename in sorted(os.listdir(source)):
+                if filename.startswith("."):
+                    continue
+                if replace_if_changed(os.path.join(source, filename), os.path.join(destination, filename)):
+                    committed += 1
+        elif name in APPEND_FILES:
+            with open(source, "rb") as src, open(destination, "ab") as dst:
+                dst.write(src.read())
+            os.remove(source)
+            committed += 1
+        elif name in kept:
+            os.remove(source)
+        elif name.endswith(PAGES_SUFFIX) and pages_digest(source) == pages_digest(destination):
+            # 頁面內容相同（只有耗時不同）：保留既有的 JSONL 與對應的索引
+            os.remove(source)
+            kept.add(os.path.basename(index_path_for(name)))
+        elif replace_if_changed(source, destination):
+            committed += 1
+    return committed
+
+
+class _Heartbeat(threading.Thread):
+    """背景續約；租約遺失時停止"""
+
+    def __init__(self, lease: Lease):
+        super().__init__(name="lease-heartbeat", daemon=True)
+        self.lease = lease
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        interval = max(1.0, self.lease.lease_seconds / 3)
+        while not self.stopped.wait(interval):
+            try:
+                self.lease.renew()
+            except LeaseLost:
+                print(f"Lease lost for {self.lease.job['path']}; result will be discarded")
+                return
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def run_worker(queue_dir: str, process: Callable[[str, str], bool], worker_id: Optional[str] = None,
+               lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+               poll_interval: float = 5.0, exit_when_idle: bool = True) -> Dict[str, int]:
+    """
+    worker 主迴圈：認領、處理、提交，直到佇列清空
+
+    Args:
+        queue_dir: 共用的佇列目錄
+        process: process(pdf_path, staging_dir) -> 是否成功；輸出寫入 staging_dir
+        worker_id: worker 識別（預設為主機名稱-pid-亂數）
+        lease_seconds: 租約長度；處理期間每 1/3 租約續約一次
+        max_attempts: 每個工作的最大嘗試次數
+        poll_interval: 其他 worker 仍在處理時，等待租約到期的輪詢間隔
+        exit_when_idle: pending/ 與 leased/ 皆空時結束
+
+    Returns:
+        本 worker 的統計：completed / failed / lost
+    """
+    init_queue(queue_dir)
+    worker_id = worker_id or default_worker_id()
+    stats = {"completed": 0, "failed": 0, "lost": 0}
+
+    while True:
+        requeue_expired(queue_dir, max_attempts)
+        lease = claim(queue_dir, worker_id, lease_seconds)
+        if lease is None:
+            if exit_when_idle and not os.listdir(os.path.join(queue_dir, "leased")):
+                return stats
+            time.sleep(poll_interval)
+            continue
+
+        pdf_path = lease.job["path"]
+        staging_dir = os.path.join(queue_dir, "staging", f"{lease.job['id']}-{worker_id}")
+        os.makedirs(staging_dir, exist_ok=True)
+        heartbeat = _Heartbeat(lease)
+        heartbeat.start()
+        try:
+            try:
+                success = process(pdf_path, staging_dir)
+            except Exception as e:
+                print(f"Error processing {pdf_path}: {str(e)}")
+                success = False
+            heartbeat.stop()
+
+            if success:
+                commit_outputs(lease, staging_dir, lease.job["output_dir"])
+                lease.complete()
+                stats["completed"] += 1
+            else:
+                lease.fail(max_attempts)
+                stats["failed"] += 1
+        except LeaseLost:
+            stats["lost"] += 1
+        finally:
+            heartbeat.stop()
+            shutil.rmtree(staging_dir, ignore_errors=True)